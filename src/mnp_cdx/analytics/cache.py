@@ -0,0 +1,126 @@
+"""In-memory result cache for analytics queries, invalidated by data generation."""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass, fields, is_dataclass
+from typing import Any, Callable, Hashable
+import copy
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class CacheStats:
+    entries: int
+    size_bytes: int
+    max_entries: int
+    max_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+    generation: int
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def _estimate_size(value: Any) -> int:
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if is_dataclass(value):
+        return sys.getsizeof(value) + sum(_estimate_size(getattr(value, f.name)) for f in fields(value))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def _copy(value: Any) -> Any:
+    # il chiamante puo' modificare il risultato (es. colonne aggiunte in reporting):
+    # la copia in cache resta intatta
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    return copy.deepcopy(value)
+
+
+class QueryCache:
+    """Cache LRU dei risultati analytics, limitata per numero di voci e byte.
+
+    Ogni voce e' legata alla generazione dati del repository: quando una
+    scrittura la incrementa, tutte le voci precedenti vengono scartate al
+    primo accesso successivo.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 64 * 1024 * 1024) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._size_bytes = 0
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key: Hashable, generation: int, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            self._sync_generation(generation)
+            # un chiamante con generazione vecchia non legge ne' scrive voci correnti
+            entry = self._entries.get(key) if generation == self._generation else None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return _copy(entry[0])
+            self._misses += 1
+
+        # calcolo fuori dal lock: query lente non bloccano gli hit di altri thread
+        value = compute()
+        size = _estimate_size(value)
+        with self._lock:
+            if generation == self._generation and size <= self.max_bytes:
+                self._store(key, value, size)
+        return _copy(value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size_bytes = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                entries=len(self._entries),
+                size_bytes=self._size_bytes,
+                max_entries=self.max_entries,
+                max_bytes=self.max_bytes,
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                generation=self._generation,
+            )
+
+    def _sync_generation(self, generation: int) -> None:
+        if generation > self._generation:
+            self._entries.clear()
+            self._size_bytes = 0
+            self._generation = generation
+
+    def _store(self, key: Hashable, value: Any, size: int) -> None:
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size_bytes -= previous[1]
+        self._entries[key] = (value, size)
+        self._size_bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._size_bytes > self.max_bytes):
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._size_bytes -= evicted_size
+            self._evictions += 1
@@ -0,0 +1,145 @@
+"""Dense donor x recipient porting matrix.
+
+L'export Arrow e' opzionale: richiede `pyarrow` (extra `arrow`), che non e'
+una dipendenza base del progetto.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date
+from typing import Any
+
+import numpy as np
+
+from mnp_cdx.db.repository import DBRepository
+
+
+NORMALIZATIONS = (None, "row", "col")
+
+
+@dataclass
+class FlowMatrix:
+    """Matrice `values[i, j]` = porting dal donor `labels[i]` al recipient `labels[j]`."""
+
+    labels: list[str]
+    values: np.ndarray
+    period_type: str
+    start_date: date | None = None
+    end_date: date | None = None
+    normalize: str | None = None
+
+    def index_of(self, operator: str) -> int:
+        return self.labels.index(operator)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "labels": list(self.labels),
+            "matrix": self.values.tolist(),
+            "period_type": self.period_type,
+            "start_date": str(self.start_date) if self.start_date else None,
+            "end_date": str(self.end_date) if self.end_date else None,
+            "normalize": self.normalize,
+        }
+
+    def to_arrow(self):
+        """Tabella Arrow: colonna `donor` piu una colonna float64 per recipient."""
+        try:
+            import pyarrow as pa
+        except ImportError as exc:  # pragma: no cover - dipende dall'ambiente
+            raise RuntimeError("Export Arrow non disponibile: installare pyarrow (extra 'arrow')") from exc
+
+        columns = {"donor": pa.array(self.labels, type=pa.string())}
+        for j, recipient in enumerate(self.labels):
+            columns[recipient] = pa.array(self.values[:, j], type=pa.float64())
+        metadata = {k: str(v) for k, v in self.to_dict().items() if k not in ("labels", "matrix") and v is not None}
+        return pa.table(columns, metadata=metadata)
+
+    def to_arrow_ipc(self) -> bytes:
+        """Serializza `to_arrow()` come Arrow IPC stream."""
+        # prima `to_arrow()`: senza pyarrow solleva RuntimeError, non ImportError
+        table = self.to_arrow()
+        import pyarrow as pa
+
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+
+def _normalize(values: np.ndarray, normalize: str | None) -> np.ndarray:
+    if normalize is None:
+        return values
+    axis = 1 if normalize == "row" else 0
+    totals = values.sum(axis=axis, keepdims=True)
+    # righe/colonne a zero restano a zero invece di produrre NaN
+    return np.divide(values, totals, out=np.zeros_like(values), where=totals != 0)
+
+
+def build_flow_matrix(
+    repo: DBRepository,
+    period_type: str = "MONTHLY",
+    start_date: date | None = None,
+    end_date: date | None = None,
+    normalize: str | None = None,
+    facts: tuple[str, list[Any]] | None = None,
+) -> FlowMatrix:
+    """Costruisce la matrice con una sola aggregazione SQL e uno scatter NumPy.
+
+    Le etichette sono tutti gli operatori di `operator_dim` (ordine alfabetico),
+    cosi la forma della matrice non dipende dal periodo richiesto. `facts` e
+    la CTE `facts` gia filtrata per periodo (vedi `AnalyticsService._facts`,
+    es. sul lakehouse); di default si legge `mnp_flow_store`.
+    """
+    if normalize not in NORMALIZATIONS:
+        raise ValueError(f"normalize non valido: {normalize!r} (ammessi: row, col)")
+
+    operators = repo.con.execute(
+        "SELECT operator_id, canonical_name FROM operator_dim ORDER BY canonical_name"
+    ).fetchnumpy()
+    labels = [str(name) for name in operators["canonical_name"]]
+    operator_ids = np.asarray(operators["operator_id"], dtype=np.int64)
+
+    if facts is None:
+        facts = (
+            """
+        facts AS (
+          SELECT donor_operator_id, recipient_operator_id, value
+          FROM mnp_flow_store
+          WHERE period_type = ?
+            AND (? IS NULL OR period_date >= ?)
+            AND (? IS NULL OR period_date <= ?)
+        )""",
+            [period_type, start_date, start_date, end_date, end_date],
+        )
+    facts_cte, params = facts
+    # uno snapshot puo contenere operatori non piu in operator_dim (es. dopo reload-mapping)
+    pairs = repo.con.execute(
+        f"""
+        WITH {facts_cte}
+        SELECT donor_operator_id, recipient_operator_id, SUM(value) AS value
+        FROM facts
+        WHERE donor_operator_id IN (SELECT operator_id FROM operator_dim)
+          AND recipient_operator_id IN (SELECT operator_id FROM operator_dim)
+        GROUP BY 1, 2
+        """,
+        params,
+    ).fetchnumpy()
+
+    values = np.zeros((len(labels), len(labels)), dtype=np.float64)
+    if len(pairs["value"]):
+        # operator_id -> posizione nella matrice (id ordinati per searchsorted)
+        order = np.argsort(operator_ids)
+        sorted_ids = operator_ids[order]
+        rows = order[np.searchsorted(sorted_ids, np.asarray(pairs["donor_operator_id"], dtype=np.int64))]
+        cols = order[np.searchsorted(sorted_ids, np.asarray(pairs["recipient_operator_id"], dtype=np.int64))]
+        np.add.at(values, (rows, cols), np.asarray(pairs["value"], dtype=np.float64))
+
+    return FlowMatrix(
+        labels=labels,
+        values=_normalize(values, normalize),
+        period_type=period_type,
+        start_date=start_date,
+        end_date=end_date,
+        normalize=normalize,
+    )
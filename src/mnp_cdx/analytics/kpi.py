@@ -4,9 +4,13 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import date
+from typing import Any, Callable
 
 import pandas as pd
 
+from mnp_cdx.analytics.cache import QueryCache
+from mnp_cdx.analytics.flow_matrix import FlowMatrix, build_flow_matrix
+from mnp_cdx.db.lakehouse import Lakehouse, partition_filter
 from mnp_cdx.db.repository import DBRepository
 
 
@@ -19,11 +23,76 @@ class KPIRecord:
 
 
 class AnalyticsService:
-    def __init__(self, repo: DBRepository) -> None:
+    def __init__(
+        self,
+        repo: DBRepository,
+        cache: QueryCache | None = None,
+        lake: Lakehouse | None = None,
+    ) -> None:
         self.repo = repo
+        # risultati invariati tra due ingest: con la cache le query ripetute non toccano DuckDB
+        self.cache = cache
+        # con un lakehouse tutte le analisi sui flussi (trend, KPI, top, matrice) leggono lo
+        # snapshot Parquet partizionato, cosi gli endpoint restano coerenti tra loro
+        self.lake = lake
+
+    def _facts(self, period_type: str, start_date: date | None, end_date: date | None) -> tuple[str, list[Any]]:
+        """CTE `facts` sui fatti MNP del periodo, da DuckDB o dal lakehouse con partition pruning."""
+        source, pruning, params = "mnp_flow_store", "TRUE", []
+        if self.lake is not None:
+            source = "lake_mnp_flow_fact"
+            pruning, params = partition_filter(start_date, end_date)
+        query = f"""
+        facts AS (
+          SELECT period_date, donor_operator_id, recipient_operator_id, value
+          FROM {source}
+          WHERE period_type = ?
+            AND {pruning}
+            AND (? IS NULL OR period_date >= ?)
+            AND (? IS NULL OR period_date <= ?)
+        )"""
+        return query, [period_type, *params, start_date, start_date, end_date, end_date]
+
+    def _period_agg(self, period_type: str, start_date: date | None, end_date: date | None) -> tuple[str, list[Any]]:
+        """CTE `agg` (operator_id, period_date, port_in, port_out, net_flow) del periodo.
+
+        Da `operator_period_agg` su DuckDB; dal lakehouse, dove la tabella non
+        esiste, aggregando i fatti potati con la stessa logica.
+        """
+        if self.lake is None:
+            query = """
+        agg AS (
+          SELECT operator_id, period_date, port_in, port_out, net_flow
+          FROM operator_period_agg
+          WHERE period_type = ?
+            AND (? IS NULL OR period_date >= ?)
+            AND (? IS NULL OR period_date <= ?)
+        )"""
+            return query, [period_type, start_date, start_date, end_date, end_date]
+
+        facts, params = self._facts(period_type, start_date, end_date)
+        query = f"""
+        {facts},
+        flows AS (
+          SELECT recipient_operator_id AS operator_id, period_date, value AS port_in, 0.0 AS port_out FROM facts
+          UNION ALL
+          SELECT donor_operator_id AS operator_id, period_date, 0.0 AS port_in, value AS port_out FROM facts
+        ),
+        agg AS (
+          SELECT operator_id, period_date, SUM(port_in) AS port_in, SUM(port_out) AS port_out,
+                 SUM(port_in) - SUM(port_out) AS net_flow
+          FROM flows
+          GROUP BY 1, 2
+        )"""
+        return query, params
+
+    def _cached(self, method: str, args: tuple[Any, ...], compute: Callable[[], Any]) -> Any:
+        if self.cache is None:
+            return compute()
+        return self.cache.get_or_compute((method, args), self.repo.generation, compute)
 
     def operators(self) -> list[str]:
-        return self.repo.list_operators()
+        return self._cached("operators", (), self.repo.list_operators)
 
     def trend(
         self,
@@ -32,53 +101,29 @@ class AnalyticsService:
         start_date: date | None = None,
         end_date: date | None = None,
     ) -> pd.DataFrame:
-        query = """
-        WITH target AS (
-            SELECT operator_id FROM operator_dim WHERE canonical_name = ?
-        ),
-        in_flow AS (
-            SELECT f.period_date, SUM(f.value) AS port_in
-            FROM mnp_flow_fact f
-            JOIN target t ON t.operator_id = f.recipient_operator_id
-            WHERE f.period_type = ?
-              AND (? IS NULL OR f.period_date >= ?)
-              AND (? IS NULL OR f.period_date <= ?)
-            GROUP BY f.period_date
-        ),
-        out_flow AS (
-            SELECT f.period_date, SUM(f.value) AS port_out
-            FROM mnp_flow_fact f
-            JOIN target t ON t.operator_id = f.donor_operator_id
-            WHERE f.period_type = ?
-              AND (? IS NULL OR f.period_date >= ?)
-              AND (? IS NULL OR f.period_date <= ?)
-            GROUP BY f.period_date
+        return self._cached(
+            "trend",
+            (operator, period_type, start_date, end_date),
+            lambda: self._trend(operator, period_type, start_date, end_date),
         )
-        SELECT
-          COALESCE(i.period_date, o.period_date) AS period_date,
-          COALESCE(i.port_in, 0) AS port_in,
-          COALESCE(o.port_out, 0) AS port_out,
-          COALESCE(i.port_in, 0) - COALESCE(o.port_out, 0) AS net_flow
-        FROM in_flow i
-        FULL OUTER JOIN out_flow o ON i.period_date = o.period_date
-        ORDER BY period_date
+
+    def _trend(
+        self,
+        operator: str,
+        period_type: str,
+        start_date: date | None,
+        end_date: date | None,
+    ) -> pd.DataFrame:
+        agg, params = self._period_agg(period_type, start_date, end_date)
+        query = f"""
+        WITH {agg}
+        SELECT a.period_date, a.port_in, a.port_out, a.net_flow
+        FROM agg a
+        JOIN operator_dim d ON d.operator_id = a.operator_id
+        WHERE d.canonical_name = ?
+        ORDER BY a.period_date
         """
-        return self.repo.query_df(
-            query,
-            [
-                operator,
-                period_type,
-                start_date,
-                start_date,
-                end_date,
-                end_date,
-                period_type,
-                start_date,
-                start_date,
-                end_date,
-                end_date,
-            ],
-        )
+        return self.repo.query_df(query, [*params, operator])
 
     def kpi_snapshot(
         self,
@@ -86,6 +131,19 @@ class AnalyticsService:
         period_type: str = "MONTHLY",
         start_date: date | None = None,
         end_date: date | None = None,
+    ) -> dict:
+        return self._cached(
+            "kpi_snapshot",
+            (operator, period_type, start_date, end_date),
+            lambda: self._kpi_snapshot(operator, period_type, start_date, end_date),
+        )
+
+    def _kpi_snapshot(
+        self,
+        operator: str,
+        period_type: str,
+        start_date: date | None,
+        end_date: date | None,
     ) -> dict:
         df = self.trend(operator, period_type, start_date=start_date, end_date=end_date)
         if df.empty:
@@ -112,6 +170,80 @@ class AnalyticsService:
             "latest_net": float(latest["net_flow"]),
         }
 
+    def kpi_snapshot_all(
+        self,
+        period_type: str = "MONTHLY",
+        start_date: date | None = None,
+        end_date: date | None = None,
+    ) -> list[dict]:
+        """KPI di tutti gli operatori in una sola aggregazione (stesso formato di `kpi_snapshot`)."""
+        return self._cached(
+            "kpi_snapshot_all",
+            (period_type, start_date, end_date),
+            lambda: self._kpi_snapshot_all(period_type, start_date, end_date),
+        )
+
+    def _kpi_snapshot_all(
+        self,
+        period_type: str,
+        start_date: date | None,
+        end_date: date | None,
+    ) -> list[dict]:
+        agg, params = self._period_agg(period_type, start_date, end_date)
+        query = f"""
+        WITH {agg}
+        SELECT
+            d.canonical_name AS operator,
+            COALESCE(SUM(a.port_in), 0) AS total_port_in,
+            COALESCE(SUM(a.port_out), 0) AS total_port_out,
+            MAX(a.period_date) AS latest_period,
+            arg_max(a.net_flow, a.period_date) AS latest_net
+        FROM operator_dim d
+        LEFT JOIN agg a ON a.operator_id = d.operator_id
+        GROUP BY d.canonical_name
+        ORDER BY d.canonical_name
+        """
+        df = self.repo.query_df(query, params)
+
+        snapshots: list[dict] = []
+        for row in df.itertuples(index=False):
+            has_data = pd.notna(row.latest_period)
+            total_in = float(row.total_port_in)
+            total_out = float(row.total_port_out)
+            snapshots.append(
+                {
+                    "operator": row.operator,
+                    "period_type": period_type,
+                    "total_port_in": total_in,
+                    "total_port_out": total_out,
+                    "net_balance": total_in - total_out,
+                    "latest_period": str(row.latest_period) if has_data else None,
+                    "latest_net": float(row.latest_net) if has_data else 0.0,
+                }
+            )
+        return snapshots
+
+    def flow_matrix(
+        self,
+        period_type: str = "MONTHLY",
+        start_date: date | None = None,
+        end_date: date | None = None,
+        normalize: str | None = None,
+    ) -> FlowMatrix:
+        """Matrice densa donor x recipient; `normalize` = None | "row" | "col"."""
+        return self._cached(
+            "flow_matrix",
+            (period_type, start_date, end_date, normalize),
+            lambda: build_flow_matrix(
+                self.repo,
+                period_type,
+                start_date,
+                end_date,
+                normalize,
+                facts=self._facts(period_type, start_date, end_date),
+            ),
+        )
+
     def top_donors(
         self,
         operator: str,
@@ -120,25 +252,35 @@ class AnalyticsService:
         start_date: date | None = None,
         end_date: date | None = None,
     ) -> pd.DataFrame:
-        query = """
-        WITH target AS (
+        return self._cached(
+            "top_donors",
+            (operator, period_type, limit, start_date, end_date),
+            lambda: self._top_donors(operator, period_type, limit, start_date, end_date),
+        )
+
+    def _top_donors(
+        self,
+        operator: str,
+        period_type: str,
+        limit: int,
+        start_date: date | None,
+        end_date: date | None,
+    ) -> pd.DataFrame:
+        facts, params = self._facts(period_type, start_date, end_date)
+        query = f"""
+        WITH {facts},
+        target AS (
           SELECT operator_id FROM operator_dim WHERE canonical_name = ?
         )
         SELECT d.canonical_name AS donor_operator, SUM(f.value) AS total_in
-        FROM mnp_flow_fact f
+        FROM facts f
         JOIN target t ON t.operator_id = f.recipient_operator_id
         JOIN operator_dim d ON d.operator_id = f.donor_operator_id
-        WHERE f.period_type = ?
-          AND (? IS NULL OR f.period_date >= ?)
-          AND (? IS NULL OR f.period_date <= ?)
         GROUP BY d.canonical_name
         ORDER BY total_in DESC
         LIMIT ?
         """
-        return self.repo.query_df(
-            query,
-            [operator, period_type, start_date, start_date, end_date, end_date, limit],
-        )
+        return self.repo.query_df(query, [*params, operator, limit])
 
     def top_recipients(
         self,
@@ -148,41 +290,54 @@ class AnalyticsService:
         start_date: date | None = None,
         end_date: date | None = None,
     ) -> pd.DataFrame:
-        query = """
-        WITH target AS (
+        return self._cached(
+            "top_recipients",
+            (operator, period_type, limit, start_date, end_date),
+            lambda: self._top_recipients(operator, period_type, limit, start_date, end_date),
+        )
+
+    def _top_recipients(
+        self,
+        operator: str,
+        period_type: str,
+        limit: int,
+        start_date: date | None,
+        end_date: date | None,
+    ) -> pd.DataFrame:
+        facts, params = self._facts(period_type, start_date, end_date)
+        query = f"""
+        WITH {facts},
+        target AS (
           SELECT operator_id FROM operator_dim WHERE canonical_name = ?
         )
         SELECT r.canonical_name AS recipient_operator, SUM(f.value) AS total_out
-        FROM mnp_flow_fact f
+        FROM facts f
         JOIN target t ON t.operator_id = f.donor_operator_id
         JOIN operator_dim r ON r.operator_id = f.recipient_operator_id
-        WHERE f.period_type = ?
-          AND (? IS NULL OR f.period_date >= ?)
-          AND (? IS NULL OR f.period_date <= ?)
         GROUP BY r.canonical_name
         ORDER BY total_out DESC
         LIMIT ?
         """
-        return self.repo.query_df(
-            query,
-            [operator, period_type, start_date, start_date, end_date, end_date, limit],
-        )
+        return self.repo.query_df(query, [*params, operator, limit])
 
     def quality_report(self) -> dict:
+        return self._cached("quality_report", (), self._quality_report)
+
+    def _quality_report(self) -> dict:
         counts = self.repo.query_df(
             """
             SELECT
                 COUNT(*) AS total_rows,
                 SUM(CASE WHEN quality_flag = 'IMPUTED' THEN 1 ELSE 0 END) AS imputed_rows,
                 SUM(CASE WHEN value = 0 THEN 1 ELSE 0 END) AS zero_rows
-            FROM mnp_flow_fact
+            FROM mnp_flow_store
             """
         )
         periods = self.repo.query_df(
             """
             SELECT period_type, MIN(period_date) AS min_date, MAX(period_date) AS max_date,
                    COUNT(DISTINCT period_date) AS distinct_periods
-            FROM mnp_flow_fact
+            FROM mnp_flow_store
             GROUP BY period_type
             ORDER BY period_type
             """
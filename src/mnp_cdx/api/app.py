@@ -5,20 +5,26 @@ from __future__ import annotations
 from datetime import date
 import logging
 from pathlib import Path
-import tempfile
 import uuid
 
+import yaml
 from fastapi import FastAPI, File, Form, HTTPException, Query, UploadFile
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 
+from mnp_cdx.analytics.cache import QueryCache
 from mnp_cdx.analytics.kpi import AnalyticsService
-from mnp_cdx.api.schemas import HealthResponse, IngestResponse
+from mnp_cdx.api.jobs import IngestJob, IngestJobManager, QueueFullError
+from mnp_cdx.api.schemas import HealthResponse, IngestResponse, JobResponse, MappingReloadResponse
+from mnp_cdx.api.uploads import SpooledUpload, spool_upload
 from mnp_cdx.config import Settings
+from mnp_cdx.db.lakehouse import analytics_lake, lakehouse_for
 from mnp_cdx.db.repository import DBRepository
 from mnp_cdx.generic.template_engine import GenericTemplateEngine
 from mnp_cdx.ingest.operator_mapping import OperatorMapper
-from mnp_cdx.ingest.parser import MNPParser
+from mnp_cdx.ingest.parse_cache import ParseCache
+from mnp_cdx.ingest.parser import MNPParser, ParsedWorkbook
 from mnp_cdx.ingest.service import IngestionService
 
 
@@ -34,17 +40,32 @@ def _raise_internal_error(operation: str, exc: Exception) -> None:
     ) from exc
 
 
+def _job_response(job: IngestJob, status_code: int = 200) -> JSONResponse:
+    payload = JobResponse(**job.to_dict()).model_dump(mode="json")
+    return JSONResponse(status_code=status_code, content=payload)
+
+
 def create_app(settings: Settings | None = None) -> FastAPI:
     cfg = settings or Settings.load()
 
     repo = DBRepository(cfg.db_path)
     repo.init_schema()
 
-    parser = MNPParser(include_self_flows=False)
+    parser = MNPParser(include_self_flows=False, engine=cfg.parser_engine)
     mapper = OperatorMapper(cfg.mapping_path)
-    ingest_service = IngestionService(repo=repo, parser=parser, mapper=mapper)
-    analytics = AnalyticsService(repo)
+    parse_cache = (
+        ParseCache(cfg.parse_cache_dir, cfg.parse_cache_max_bytes) if cfg.parse_cache_dir else None
+    )
+    ingest_service = IngestionService(repo=repo, parser=parser, mapper=mapper, parse_cache=parse_cache)
+    query_cache = (
+        QueryCache(cfg.analytics_cache_entries, cfg.analytics_cache_max_bytes)
+        if cfg.analytics_cache_entries > 0
+        else None
+    )
+    analytics = AnalyticsService(repo, cache=query_cache, lake=analytics_lake(cfg, repo))
     generic = GenericTemplateEngine(repo)
+    jobs = IngestJobManager(max_queue=cfg.ingest_queue_size, workers=cfg.ingest_workers)
+    upload_root = cfg.data_dir / "uploads"
 
     app = FastAPI(title="mnpCDX API", version="0.4.2")
 
@@ -53,6 +74,7 @@ def create_app(settings: Settings | None = None) -> FastAPI:
 
     @app.on_event("shutdown")
     def _shutdown() -> None:  # pragma: no cover
+        jobs.shutdown(timeout=30)
         repo.close()
 
     @app.get("/", response_class=HTMLResponse)
@@ -66,29 +88,142 @@ def create_app(settings: Settings | None = None) -> FastAPI:
     def health() -> HealthResponse:
         return HealthResponse(status="ok")
 
+    @app.get("/cache/stats")
+    def cache_stats() -> dict:
+        if query_cache is None:
+            return {"enabled": False}
+        stats = query_cache.stats()
+        return {"enabled": True, **stats.__dict__, "hit_ratio": stats.hit_ratio}
+
+    # ---------------------------
+    # Background ingest jobs
+    # ---------------------------
+    def _check_queue() -> None:
+        # backpressure prima di scrivere l'upload su disco
+        if jobs.queue_depth >= jobs.max_queue:
+            raise HTTPException(
+                status_code=503,
+                detail="Coda ingest piena, riprovare piu tardi",
+                headers={"Retry-After": "5"},
+            )
+
+    def _enqueue_upload(upload: SpooledUpload, kind: str, write, prepare=None) -> JSONResponse:
+        try:
+            job = jobs.submit(
+                kind=kind,
+                filename=upload.filename,
+                prepare=(lambda job: prepare(job, upload)) if prepare else None,
+                write=lambda job, prepared: write(job, upload, prepared),
+                cleanup=upload.discard,
+            )
+        except QueueFullError as exc:
+            upload.discard()
+            raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "5"}) from exc
+        return _job_response(job, status_code=202)
+
+    def _prepare_mnp(job: IngestJob, upload: SpooledUpload) -> tuple[ParsedWorkbook, bool]:
+        # fase parallelizzabile: parsing colonnare, nessun accesso al DB
+        parsed = ingest_service.cached_parse(upload.filename, upload.checksum)
+        fresh = parsed is None
+        if parsed is None:
+            parsed = ingest_service.parser.parse_batches(
+                upload.path,
+                file_id=upload.filename,
+                batch_size=ingest_service.chunk_size,
+                checksum=upload.checksum,
+            )
+        job.report_progress(0, parsed.summary.monthly_records + parsed.summary.daily_records)
+        return parsed, fresh
+
+    @app.get("/jobs/{job_id}", response_model=JobResponse)
+    def job_status(job_id: str) -> JSONResponse:
+        job = jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return _job_response(job)
+
     # ---------------------------
     # Legacy MNP-specific endpoints
     # ---------------------------
-    @app.post("/ingest", response_model=IngestResponse)
-    async def ingest(file: UploadFile = File(...), force: bool = False) -> IngestResponse:
+    @app.post("/ingest", response_model=IngestResponse, responses={202: {"model": JobResponse}})
+    async def ingest(
+        file: UploadFile = File(...),
+        force: bool = False,
+        async_job: bool = False,
+    ) -> IngestResponse:
         if not file.filename:
             raise HTTPException(status_code=400, detail="filename missing")
 
-        suffix = Path(file.filename).suffix or ".xlsx"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(await file.read())
-            tmp_path = Path(tmp.name)
+        if async_job:
+            _check_queue()
+
+        upload = await spool_upload(file, upload_root)
+
+        # checksum calcolato durante lo spool: i duplicati noti rispondono subito, senza parsing.
+        # Con force non si cancella nulla qui: la sostituzione avviene nella transazione del file
+        duplicate = None if force else ingest_service.check_duplicate(upload.filename, upload.checksum)
+        if duplicate is not None:
+            upload.discard()
+            return IngestResponse(**duplicate.__dict__)
+
+        if async_job:
+
+            def _write(job: IngestJob, upload: SpooledUpload, prepared: tuple[ParsedWorkbook, bool]) -> dict:
+                parsed, fresh = prepared
+                if fresh:
+                    ingest_service.store_parse(parsed)
+                result = ingest_service.ingest_parsed(parsed, force=force, on_progress=job.report_progress)
+                return IngestResponse(**result.__dict__).model_dump()
+
+            return _enqueue_upload(upload, "mnp", _write, prepare=_prepare_mnp)
 
         try:
-            result = ingest_service.ingest_file(tmp_path, force=force)
+            # ingest nel thread pool: l'event loop resta libero durante parsing e scritture
+            result = await run_in_threadpool(
+                ingest_service.ingest_file, upload.path, force=force, checksum=upload.checksum
+            )
             return IngestResponse(**result.__dict__)
         finally:
-            tmp_path.unlink(missing_ok=True)
+            upload.discard()
 
     @app.get("/operators")
     def operators() -> list[str]:
         return analytics.operators()
 
+    @app.get("/mapping/unmapped")
+    def unmapped_operators() -> list[dict]:
+        return repo.list_unmapped_operators()
+
+    @app.post("/mapping/reload", response_model=MappingReloadResponse)
+    def reload_mapping() -> MappingReloadResponse:
+        # i flussi esistenti vengono ricanonicalizzati in place, senza reparse degli Excel
+        try:
+            result = ingest_service.reload_mapping()
+        except (OSError, KeyError, yaml.YAMLError) as exc:
+            raise HTTPException(status_code=400, detail=f"Mapping operatori non valido: {exc}") from exc
+        return MappingReloadResponse(**result.__dict__)
+
+    @app.post("/lake/export")
+    def lake_export() -> dict:
+        lake = lakehouse_for(cfg)
+        result = lake.export(repo)
+        if cfg.analytics_source == "lake":
+            analytics.lake = lake
+        return {
+            "root": str(result.root),
+            "flow_rows": result.flow_rows,
+            "template_rows": result.template_rows,
+            "files": result.files,
+        }
+
+    @app.get("/kpi")
+    def kpi_all(
+        period_type: str = "MONTHLY",
+        start_date: date | None = None,
+        end_date: date | None = None,
+    ) -> list[dict]:
+        return analytics.kpi_snapshot_all(period_type, start_date=start_date, end_date=end_date)
+
     @app.get("/kpi/{operator}")
     def kpi(operator: str, period_type: str = "MONTHLY") -> dict:
         return analytics.kpi_snapshot(operator, period_type)
@@ -103,6 +238,23 @@ def create_app(settings: Settings | None = None) -> FastAPI:
         df = analytics.trend(operator, period_type, start_date=start_date, end_date=end_date)
         return df.to_dict(orient="records")
 
+    @app.get("/flow-matrix")
+    def flow_matrix(
+        period_type: str = "MONTHLY",
+        start_date: date | None = None,
+        end_date: date | None = None,
+        normalize: str | None = Query(default=None, pattern="^(row|col)$"),
+        output_format: str = Query(default="json", alias="format", pattern="^(json|arrow)$"),
+    ) -> Response:
+        matrix = analytics.flow_matrix(period_type, start_date=start_date, end_date=end_date, normalize=normalize)
+        if output_format == "json":
+            return JSONResponse(matrix.to_dict())
+        try:
+            payload = matrix.to_arrow_ipc()
+        except RuntimeError as exc:
+            raise HTTPException(status_code=501, detail=str(exc)) from exc
+        return Response(content=payload, media_type="application/vnd.apache.arrow.stream")
+
     @app.get("/top-donors/{operator}")
     def top_donors(
         operator: str,
@@ -149,13 +301,10 @@ def create_app(settings: Settings | None = None) -> FastAPI:
         if not file.filename:
             raise HTTPException(status_code=400, detail="filename missing")
 
-        suffix = Path(file.filename).suffix or ".xlsx"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(await file.read())
-            tmp_path = Path(tmp.name)
+        upload = await spool_upload(file, upload_root)
 
         try:
-            analyzed = generic.analyze(tmp_path)
+            analyzed = await run_in_threadpool(generic.analyze, upload.path)
             return {
                 "filename": file.filename,
                 "workbook_signature": analyzed.workbook_signature,
@@ -167,7 +316,7 @@ def create_app(settings: Settings | None = None) -> FastAPI:
         except Exception as exc:  # pragma: no cover - defensive runtime guard
             _raise_internal_error("Analisi template", exc)
         finally:
-            tmp_path.unlink(missing_ok=True)
+            upload.discard()
 
     @app.post("/template/ingest")
     async def template_ingest(
@@ -175,21 +324,39 @@ def create_app(settings: Settings | None = None) -> FastAPI:
         template_name: str | None = Form(default=None),
         template_id: int | None = Form(default=None),
         force: bool = Form(default=False),
+        async_job: bool = Form(default=False),
     ) -> dict:
         if not file.filename:
             raise HTTPException(status_code=400, detail="filename missing")
 
-        suffix = Path(file.filename).suffix or ".xlsx"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(await file.read())
-            tmp_path = Path(tmp.name)
+        if async_job:
+            _check_queue()
+
+        upload = await spool_upload(file, upload_root)
+
+        # i duplicati noti passano dal percorso sincrono, che risponde senza parsing
+        if async_job and (force or not repo.file_exists(upload.checksum)):
+
+            def _write(job: IngestJob, upload: SpooledUpload, prepared: None) -> dict:
+                result = generic.ingest(
+                    upload.path,
+                    template_id=template_id,
+                    template_name=template_name,
+                    force=force,
+                    checksum=upload.checksum,
+                )
+                return result.__dict__
+
+            return _enqueue_upload(upload, "template", _write)
 
         try:
-            result = generic.ingest(
-                tmp_path,
+            result = await run_in_threadpool(
+                generic.ingest,
+                upload.path,
                 template_id=template_id,
                 template_name=template_name,
                 force=force,
+                checksum=upload.checksum,
             )
             return result.__dict__
         except ValueError as exc:
@@ -197,7 +364,7 @@ def create_app(settings: Settings | None = None) -> FastAPI:
         except Exception as exc:  # pragma: no cover - defensive runtime guard
             _raise_internal_error("Ingestion template", exc)
         finally:
-            tmp_path.unlink(missing_ok=True)
+            upload.discard()
 
     @app.get("/templates")
     def templates() -> list[dict]:
@@ -215,8 +382,8 @@ def create_app(settings: Settings | None = None) -> FastAPI:
         tpl = repo.get_template_by_id(template_id)
         if tpl is None:
             raise HTTPException(status_code=404, detail="Template not found")
-        metrics = repo.list_template_metrics(template_id)
-        return {"template_id": template_id, "metrics": metrics}
+        stats = repo.list_template_metric_stats(template_id)
+        return {"template_id": template_id, "metrics": [m["metric"] for m in stats], "stats": stats}
 
     @app.get("/template/{template_id}/trend")
     def template_trend(
@@ -0,0 +1,216 @@
+"""Background ingest jobs: bounded queue, worker pool, single DB writer."""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable
+import logging
+import queue
+import threading
+import uuid
+
+
+logger = logging.getLogger(__name__)
+
+
+JOB_STATUSES = ("queued", "preparing", "writing", "succeeded", "failed")
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class QueueFullError(RuntimeError):
+    """La coda job ha raggiunto `max_queue`: il client deve riprovare piu tardi."""
+
+
+@dataclass
+class IngestJob:
+    job_id: str
+    kind: str  # "mnp" | "template"
+    filename: str
+    seq: int
+    status: str = "queued"
+    created_at: datetime = field(default_factory=_utcnow)
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    processed_cells: int = 0
+    total_cells: int | None = None
+    result: dict[str, Any] | None = None
+    error: str | None = None
+
+    @property
+    def progress(self) -> float:
+        if self.status == "succeeded":
+            return 1.0
+        if not self.total_cells:
+            return 0.0
+        return min(self.processed_cells / self.total_cells, 1.0)
+
+    def report_progress(self, processed_cells: int, total_cells: int | None = None) -> None:
+        self.processed_cells = processed_cells
+        if total_cells is not None:
+            self.total_cells = total_cells
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "filename": self.filename,
+            "status": self.status,
+            "progress": self.progress,
+            "processed_cells": self.processed_cells,
+            "total_cells": self.total_cells,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+# prepare gira in parallelo sui worker (solo lavoro senza DB: checksum, parsing);
+# write riceve l'output di prepare e gira sotto il turno del writer unico
+PrepareFn = Callable[[IngestJob], Any]
+WriteFn = Callable[[IngestJob, Any], dict[str, Any]]
+
+
+@dataclass
+class _QueuedJob:
+    job: IngestJob
+    prepare: PrepareFn | None
+    write: WriteFn
+    cleanup: Callable[[], None] | None
+
+
+class IngestJobManager:
+    """Esegue ingest in background con backpressure e un solo writer DuckDB.
+
+    La coda e' limitata a `max_queue` job in attesa: oltre, `submit` solleva
+    `QueueFullError`. I `workers` thread eseguono la fase `prepare` in
+    parallelo, mentre le fasi `write` sono serializzate nell'ordine di
+    sottomissione (numero di sequenza), quindi il DB vede un writer alla volta
+    e i file arrivano nell'ordine in cui sono stati caricati.
+    """
+
+    def __init__(self, max_queue: int = 16, workers: int = 1, keep_finished: int = 1000) -> None:
+        self.max_queue = max_queue
+        self.workers = max(workers, 1)
+        self.keep_finished = keep_finished
+        self._queue: queue.Queue[_QueuedJob | None] = queue.Queue(maxsize=max_queue)
+        self._jobs: OrderedDict[str, IngestJob] = OrderedDict()
+        self._lock = threading.Lock()
+        self._turn = threading.Condition()
+        self._next_seq = 0
+        self._next_write = 0
+        self._threads: list[threading.Thread] = []
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(
+        self,
+        kind: str,
+        filename: str,
+        write: WriteFn,
+        prepare: PrepareFn | None = None,
+        cleanup: Callable[[], None] | None = None,
+    ) -> IngestJob:
+        self._ensure_started()
+        with self._lock:
+            job = IngestJob(job_id=uuid.uuid4().hex, kind=kind, filename=filename, seq=self._next_seq)
+            try:
+                self._queue.put_nowait(_QueuedJob(job, prepare, write, cleanup))
+            except queue.Full as exc:
+                raise QueueFullError(f"Coda ingest piena ({self.max_queue} job in attesa)") from exc
+            self._next_seq += 1
+            self._jobs[job.job_id] = job
+            self._prune()
+        return job
+
+    def get(self, job_id: str) -> IngestJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self, timeout: float | None = None) -> None:
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for idx in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"ingest-job-{idx}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _prune(self) -> None:
+        # conserva solo gli ultimi `keep_finished` job conclusi
+        finished = [jid for jid, j in self._jobs.items() if j.status in ("succeeded", "failed")]
+        for jid in finished[: max(len(finished) - self.keep_finished, 0)]:
+            del self._jobs[jid]
+
+    def _worker(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self._run(item)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, item: _QueuedJob) -> None:
+        job = item.job
+        job.started_at = _utcnow()
+        prepared: Any = None
+        try:
+            try:
+                if item.prepare is not None:
+                    job.status = "preparing"
+                    prepared = item.prepare(job)
+            except Exception as exc:
+                self._fail(job, exc)
+                return
+            finally:
+                self._wait_turn(job.seq)
+
+            # da qui fino a _release_turn questo e' l'unico writer attivo
+            try:
+                job.status = "writing"
+                job.result = item.write(job, prepared)
+                job.status = "succeeded"
+            except Exception as exc:
+                self._fail(job, exc)
+            finally:
+                job.finished_at = job.finished_at or _utcnow()
+        finally:
+            self._release_turn(job.seq)
+            if item.cleanup is not None:
+                try:
+                    item.cleanup()
+                except OSError:
+                    logger.warning("Cleanup upload fallito per job %s", job.job_id, exc_info=True)
+
+    def _fail(self, job: IngestJob, exc: Exception) -> None:
+        logger.exception("Ingest job %s failed (%s)", job.job_id, job.filename)
+        job.status = "failed"
+        job.error = str(exc) if isinstance(exc, ValueError) else f"{type(exc).__name__}: {exc}"
+        job.finished_at = _utcnow()
+
+    def _wait_turn(self, seq: int) -> None:
+        with self._turn:
+            self._turn.wait_for(lambda: self._next_write == seq)
+
+    def _release_turn(self, seq: int) -> None:
+        with self._turn:
+            if self._next_write == seq:
+                self._next_write += 1
+                self._turn.notify_all()
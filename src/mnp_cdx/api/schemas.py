@@ -2,6 +2,9 @@
 
 from __future__ import annotations
 
+from datetime import datetime
+from typing import Any
+
 from pydantic import BaseModel
 
 
@@ -18,3 +21,26 @@ class IngestResponse(BaseModel):
     daily_records: int
     skipped_duplicate: bool
     warnings: list[str]
+
+
+class MappingReloadResponse(BaseModel):
+    aliases: int
+    updated_donor_rows: int
+    updated_recipient_rows: int
+    deleted_self_flows: int
+    refreshed_periods: int
+
+
+class JobResponse(BaseModel):
+    job_id: str
+    kind: str
+    filename: str
+    status: str
+    progress: float
+    processed_cells: int
+    total_cells: int | None
+    created_at: datetime
+    started_at: datetime | None
+    finished_at: datetime | None
+    result: dict[str, Any] | None
+    error: str | None
@@ -0,0 +1,63 @@
+"""Streaming upload spooling with on-the-fly SHA-256."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+import hashlib
+import shutil
+import uuid
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+@dataclass
+class SpooledUpload:
+    path: Path
+    checksum: str
+    size_bytes: int
+
+    @property
+    def filename(self) -> str:
+        return self.path.name
+
+    def discard(self) -> None:
+        # ogni upload vive in una directory dedicata
+        shutil.rmtree(self.path.parent, ignore_errors=True)
+
+
+async def spool_upload(file: UploadFile, root: Path, chunk_size: int = UPLOAD_CHUNK_BYTES) -> SpooledUpload:
+    """Copia l'upload su disco a chunk fissi calcolando lo SHA-256 in scrittura.
+
+    In memoria resta al massimo un chunk per upload; il checksum restituito
+    evita di rileggere il file per la deduplica. Il nome originale e'
+    conservato (serve a file_id e agli hint di data dei template).
+    """
+    name = Path(file.filename or "upload").name
+    if not Path(name).suffix:
+        name += ".xlsx"
+    target = root / uuid.uuid4().hex / name
+    target.parent.mkdir(parents=True, exist_ok=True)
+
+    sha = hashlib.sha256()
+    size = 0
+
+    def _consume(fh, chunk: bytes) -> None:
+        sha.update(chunk)
+        fh.write(chunk)
+
+    try:
+        with target.open("wb") as fh:
+            while chunk := await file.read(chunk_size):
+                # hash e write fuori dall'event loop
+                await run_in_threadpool(_consume, fh, chunk)
+                size += len(chunk)
+    except BaseException:
+        shutil.rmtree(target.parent, ignore_errors=True)
+        raise
+
+    return SpooledUpload(path=target, checksum=sha.hexdigest(), size_bytes=size)
@@ -0,0 +1 @@
+"""Parser and ingestion benchmarks."""
@@ -0,0 +1,142 @@
+"""MNPParser micro-benchmarks with a stored regression baseline."""
+
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable
+import json
+import time
+import tracemalloc
+
+from mnp_cdx.benchmarks.synthetic import write_synthetic_mnp_workbook
+from mnp_cdx.db.repository import DBRepository
+from mnp_cdx.ingest.operator_mapping import OperatorMapper
+from mnp_cdx.ingest.parser import MNPParser
+from mnp_cdx.ingest.service import IngestionService
+
+
+@dataclass
+class BenchResult:
+    name: str
+    seconds: float
+    rows: int
+    peak_mb: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class BenchConfig:
+    operators: int = 30
+    months: int = 36
+    days: int = 365
+    engine: str = "openpyxl"
+    repeat: int = 3
+
+
+def _measure(name: str, fn: Callable[[], int], repeat: int) -> BenchResult:
+    # tempo: migliore di `repeat` run senza tracing; memoria: run dedicato con tracemalloc
+    best = float("inf")
+    rows = 0
+    for _ in range(max(repeat, 1)):
+        started = time.perf_counter()
+        rows = fn()
+        best = min(best, time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return BenchResult(name=name, seconds=best, rows=rows, peak_mb=peak / (1024 * 1024))
+
+
+def run_parser_benchmarks(workdir: str | Path, config: BenchConfig, mapping_path: str | Path) -> list[BenchResult]:
+    workdir = Path(workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    workbook = write_synthetic_mnp_workbook(
+        workdir / "MNP SYNTHETIC 2024.xlsx",
+        operators=config.operators,
+        months=config.months,
+        days=config.days,
+        start_year=2024,
+    )
+    parser = MNPParser(engine=config.engine)
+    mapper = OperatorMapper(Path(mapping_path))
+
+    def _ingest() -> int:
+        db_path = workdir / "bench.duckdb"
+        db_path.unlink(missing_ok=True)
+        repo = DBRepository(db_path)
+        try:
+            repo.init_schema()
+            service = IngestionService(repo=repo, parser=parser, mapper=mapper)
+            return service.ingest_file(workbook).inserted_records
+        finally:
+            repo.close()
+
+    def _checksum() -> int:
+        parser.checksum(workbook)
+        return 0
+
+    benches: list[tuple[str, Callable[[], int]]] = [
+        ("parse_monthly", lambda: len(parser.parse_monthly(str(workbook), workbook.name)[0])),
+        ("parse_daily", lambda: len(parser.parse_daily(str(workbook), workbook.name)[0])),
+        ("checksum", _checksum),
+        ("ingest_file", _ingest),
+    ]
+    return [_measure(name, fn, config.repeat) for name, fn in benches]
+
+
+def save_baseline(path: str | Path, config: BenchConfig, results: list[BenchResult]) -> None:
+    payload = {
+        "config": asdict(config),
+        "results": {r.name: {"seconds": round(r.seconds, 4), "rows": r.rows, "peak_mb": round(r.peak_mb, 2)} for r in results},
+    }
+    Path(path).write_text(json.dumps(payload, indent=2) + "\n", encoding="utf-8")
+
+
+def compare_to_baseline(
+    results: list[BenchResult],
+    config: BenchConfig,
+    baseline_path: str | Path,
+    tolerance: float = 0.25,
+    min_delta_seconds: float = 0.010,
+    min_delta_mb: float = 1.0,
+) -> list[str]:
+    """Ritorna l'elenco delle regressioni (vuoto se tutto entro la tolleranza).
+
+    Regressione: tempo o picco memoria oltre baseline * (1 + tolerance) e
+    insieme oltre la soglia assoluta (`min_delta_seconds` / `min_delta_mb`),
+    oppure numero di righe diverso (cambio di output del parser). La soglia
+    assoluta evita falsi positivi sui passi da pochi millisecondi, dove il 25%
+    e rumore di scheduling.
+    """
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    base_config = {k: v for k, v in baseline["config"].items() if k != "repeat"}
+    run_config = {k: v for k, v in asdict(config).items() if k != "repeat"}
+    if base_config != run_config:
+        return [f"configurazione diversa dalla baseline: {run_config} != {base_config}"]
+
+    regressions: list[str] = []
+    for result in results:
+        expected = baseline["results"].get(result.name)
+        if expected is None:
+            continue
+        if result.rows != expected["rows"]:
+            regressions.append(f"{result.name}: righe {result.rows} != baseline {expected['rows']}")
+        slower = result.seconds - expected["seconds"]
+        if result.seconds > expected["seconds"] * (1 + tolerance) and slower > min_delta_seconds:
+            regressions.append(
+                f"{result.name}: {result.seconds:.3f}s vs baseline {expected['seconds']:.3f}s "
+                f"(+{(result.seconds / expected['seconds'] - 1) * 100:.0f}%)"
+            )
+        larger = result.peak_mb - expected["peak_mb"]
+        if result.peak_mb > expected["peak_mb"] * (1 + tolerance) and larger > min_delta_mb:
+            regressions.append(f"{result.name}: picco {result.peak_mb:.1f} MB vs baseline {expected['peak_mb']:.1f} MB")
+    return regressions
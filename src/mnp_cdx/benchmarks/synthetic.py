@@ -0,0 +1,74 @@
+"""Synthetic MNP workbook generator for benchmarks and tests."""
+
+from __future__ import annotations
+
+from datetime import date, timedelta
+from pathlib import Path
+import random
+
+import openpyxl
+
+MONTH_LABELS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def synthetic_operator_names(count: int) -> list[str]:
+    return [f"OPERATOR {idx:02d}" for idx in range(1, count + 1)]
+
+
+def write_synthetic_mnp_workbook(
+    path: str | Path,
+    operators: int = 30,
+    months: int = 36,
+    days: int = 365,
+    start_year: int = 2024,
+    imputed_ratio: float = 0.02,
+    seed: int = 0,
+) -> Path:
+    """Scrive un workbook con layout "Monthly details"/"Daily details" realistico.
+
+    Ogni recipient ha una riga intestazione seguita da una riga per ciascun
+    altro operatore donor; ogni cella periodo e' valorizzata (una quota
+    `imputed_ratio` con "-"), quindi il parser produce esattamente
+    operators * (operators - 1) * periodi record per sheet.
+    """
+    path = Path(path)
+    rng = random.Random(seed)
+    names = synthetic_operator_names(operators)
+
+    wb = openpyxl.Workbook(write_only=True)
+
+    monthly_header = []
+    for idx in range(months):
+        year = start_year + idx // 12
+        monthly_header.append(f"{MONTH_LABELS[idx % 12]} {year % 100:02d}")
+    _write_sheet(wb.create_sheet("Monthly details"), "Monthly details", monthly_header, names, rng, imputed_ratio, 5000)
+
+    first_day = date(start_year, 1, 1)
+    daily_header = []
+    for idx in range(days):
+        day = first_day + timedelta(days=idx)
+        daily_header.append(f"{day.day}/{day.month}")
+    _write_sheet(wb.create_sheet("Daily details"), "Daily details", daily_header, names, rng, imputed_ratio, 200)
+
+    wb.save(path)
+    return path
+
+
+def _write_sheet(ws, title: str, header: list[str], names: list[str], rng: random.Random, imputed_ratio: float, scale: int) -> None:
+    ws.append([f"MNP {title} - synthetic"])
+    ws.append([])
+    ws.append([])
+    ws.append([])
+    ws.append([None, None, None, "Recipient", "Donor", *header])
+    for recipient in names:
+        donor_rows = []
+        for donor in names:
+            if donor == recipient:
+                continue
+            values = ["-" if rng.random() < imputed_ratio else rng.randint(0, scale) for _ in header]
+            donor_rows.append([None, None, None, None, donor, *values])
+        # la riga recipient porta i totali per periodo, come negli export reali
+        totals = [sum(row[5 + idx] for row in donor_rows if row[5 + idx] != "-") for idx in range(len(header))]
+        ws.append([None, None, None, recipient, "Total", *totals])
+        for row in donor_rows:
+            ws.append(row)
@@ -10,25 +10,35 @@ import typer
 import uvicorn
 
 from mnp_cdx.analytics.kpi import AnalyticsService
+from mnp_cdx.benchmarks.parser_bench import BenchConfig, compare_to_baseline, run_parser_benchmarks, save_baseline
 from mnp_cdx.config import Settings
+from mnp_cdx.db.lakehouse import analytics_lake, lakehouse_for
 from mnp_cdx.db.repository import DBRepository
 from mnp_cdx.generic.template_engine import GenericTemplateEngine
 from mnp_cdx.ingest.operator_mapping import OperatorMapper
+from mnp_cdx.ingest.parallel import ingest_directory
+from mnp_cdx.ingest.parse_cache import ParseCache
 from mnp_cdx.ingest.parser import MNPParser
-from mnp_cdx.ingest.service import IngestionService
+from mnp_cdx.ingest.service import IngestionService, IngestResult
+from mnp_cdx.ingest.watcher import FolderWatcher, WatchEvent
 from mnp_cdx.reporting import generate_markdown_report
 
 app = typer.Typer(help="mnpCDX CLI")
 
 
-def build_services() -> tuple[Settings, DBRepository, IngestionService, AnalyticsService, GenericTemplateEngine]:
+def build_services(
+    parser_engine: str | None = None,
+) -> tuple[Settings, DBRepository, IngestionService, AnalyticsService, GenericTemplateEngine]:
     settings = Settings.load()
     repo = DBRepository(settings.db_path)
     repo.init_schema()
-    parser = MNPParser(include_self_flows=False)
+    parser = MNPParser(include_self_flows=False, engine=parser_engine or settings.parser_engine)
     mapper = OperatorMapper(settings.mapping_path)
-    ingest = IngestionService(repo=repo, parser=parser, mapper=mapper)
-    analytics = AnalyticsService(repo)
+    parse_cache = (
+        ParseCache(settings.parse_cache_dir, settings.parse_cache_max_bytes) if settings.parse_cache_dir else None
+    )
+    ingest = IngestionService(repo=repo, parser=parser, mapper=mapper, parse_cache=parse_cache)
+    analytics = AnalyticsService(repo, lake=analytics_lake(settings, repo))
     generic = GenericTemplateEngine(repo)
     return settings, repo, ingest, analytics, generic
 
@@ -41,12 +51,17 @@ def init_db() -> None:
 
 
 @app.command("ingest")
-def ingest(file_path: Path, force: bool = False) -> None:
-    _, repo, ingest_service, _, _ = build_services()
+def ingest(
+    file_path: Path,
+    force: bool = False,
+    incremental: bool = False,
+    engine: str | None = None,
+) -> None:
+    _, repo, ingest_service, _, _ = build_services(parser_engine=engine)
     if not file_path.exists():
         raise typer.BadParameter(f"File not found: {file_path}")
 
-    result = ingest_service.ingest_file(file_path, force=force)
+    result = ingest_service.ingest_file(file_path, force=force, incremental=incremental)
     typer.echo(f"File: {result.filename}")
     typer.echo(f"Checksum: {result.checksum[:16]}...")
     typer.echo(f"Monthly parsed: {result.monthly_records}")
@@ -61,6 +76,76 @@ def ingest(file_path: Path, force: bool = False) -> None:
     repo.close()
 
 
+@app.command("ingest-dir")
+def ingest_dir(
+    directory: Path,
+    pattern: str = "*.xlsx",
+    workers: int | None = None,
+    force: bool = False,
+    incremental: bool = False,
+    engine: str | None = None,
+) -> None:
+    _, repo, ingest_service, _, _ = build_services(parser_engine=engine)
+    if not directory.is_dir():
+        raise typer.BadParameter(f"Directory not found: {directory}")
+
+    def _echo_result(result: IngestResult) -> None:
+        status = "duplicate" if result.skipped_duplicate else f"inserted {result.inserted_records}"
+        typer.echo(f"- {result.filename}: {status}")
+
+    report = ingest_directory(
+        ingest_service,
+        directory,
+        pattern=pattern,
+        workers=workers,
+        force=force,
+        incremental=incremental,
+        on_result=_echo_result,
+    )
+    for filename, error in report.failures:
+        typer.echo(f"- {filename}: FAILED ({error})")
+
+    typer.echo(f"Files: {report.files_processed} ({len(report.failures)} failed)")
+    typer.echo(f"Inserted records: {report.inserted_records}")
+    typer.echo(f"Elapsed: {report.elapsed_seconds:.2f}s")
+    typer.echo(f"Throughput: {report.files_per_second:.2f} files/s, {report.rows_per_second:,.0f} rows/s")
+    repo.close()
+
+
+@app.command("watch")
+def watch(
+    directory: Path,
+    interval: float = 2.0,
+    settle: float = 5.0,
+    incremental: bool = False,
+    engine: str | None = None,
+) -> None:
+    """Resta in ascolto su una cartella e ingestisce i workbook nuovi."""
+    _, repo, ingest_service, _, generic = build_services(parser_engine=engine)
+    if not directory.is_dir():
+        raise typer.BadParameter(f"Directory not found: {directory}")
+
+    def _echo_event(event: WatchEvent) -> None:
+        if event.kind == "error":
+            typer.echo(f"- {event.path.name}: FAILED ({event.error})")
+        elif event.kind == "duplicate":
+            typer.echo(f"- {event.path.name}: duplicate")
+        else:
+            rows = getattr(event.result, "inserted_records", None)
+            if rows is None:
+                rows = getattr(event.result, "inserted_rows", 0)
+            typer.echo(f"- {event.path.name}: {event.kind} ingest, inserted {rows}")
+
+    watcher = FolderWatcher(directory, ingest_service, generic, settle_seconds=settle, incremental=incremental)
+    typer.echo(f"Watching {directory} (Ctrl+C per uscire)")
+    try:
+        watcher.run(interval=interval, on_event=_echo_event)
+    except KeyboardInterrupt:
+        typer.echo("Watch terminato")
+    finally:
+        repo.close()
+
+
 @app.command("generic-analyze")
 def generic_analyze(file_path: Path) -> None:
     _, repo, _, _, generic = build_services()
@@ -125,6 +210,32 @@ def generic_trend(
     repo.close()
 
 
+@app.command("reload-mapping")
+def reload_mapping() -> None:
+    _, repo, ingest_service, _, _ = build_services()
+    result = ingest_service.reload_mapping()
+    typer.echo(json.dumps(result.__dict__, indent=2))
+    repo.close()
+
+
+@app.command("unmapped-operators")
+def unmapped_operators() -> None:
+    _, repo, _, _, _ = build_services()
+    typer.echo(json.dumps(repo.list_unmapped_operators(), indent=2))
+    repo.close()
+
+
+@app.command("lake-export")
+def lake_export() -> None:
+    settings, repo, _, _, _ = build_services()
+    result = lakehouse_for(settings).export(repo)
+    typer.echo(
+        f"Lakehouse scritto in {result.root}: {result.flow_rows} flussi, "
+        f"{result.template_rows} righe template, {result.files} file Parquet"
+    )
+    repo.close()
+
+
 @app.command("kpi")
 def kpi(operator: str = "WINDTRE", period: str = "MONTHLY") -> None:
     _, repo, _, analytics, _ = build_services()
@@ -152,6 +263,48 @@ def report(
     repo.close()
 
 
+@app.command("bench")
+def bench(
+    operators: int = 30,
+    months: int = 36,
+    days: int = 365,
+    engine: str = "openpyxl",
+    repeat: int = 3,
+    workdir: Path = Path("data") / "bench",
+    baseline: Path = Path("benchmarks") / "parser_baseline.json",
+    tolerance: float = 0.25,
+    min_delta_ms: float = 10.0,
+    update_baseline: bool = False,
+) -> None:
+    """Benchmark parser/ingest su workbook sintetici, con confronto baseline."""
+    settings = Settings.load()
+    config = BenchConfig(operators=operators, months=months, days=days, engine=engine, repeat=repeat)
+    results = run_parser_benchmarks(workdir, config, settings.mapping_path)
+
+    for r in results:
+        typer.echo(f"{r.name:<14} {r.seconds:8.3f}s  {r.rows_per_second:12,.0f} rows/s  peak {r.peak_mb:8.1f} MB")
+
+    if update_baseline:
+        baseline.parent.mkdir(parents=True, exist_ok=True)
+        save_baseline(baseline, config, results)
+        typer.echo(f"Baseline aggiornata: {baseline}")
+        return
+
+    if not baseline.exists():
+        typer.echo(f"Nessuna baseline in {baseline} (usa --update-baseline)")
+        return
+
+    regressions = compare_to_baseline(
+        results, config, baseline, tolerance=tolerance, min_delta_seconds=min_delta_ms / 1000
+    )
+    if regressions:
+        typer.echo("REGRESSIONI rispetto alla baseline:")
+        for line in regressions:
+            typer.echo(f"- {line}")
+        raise typer.Exit(code=1)
+    typer.echo("Nessuna regressione rispetto alla baseline")
+
+
 @app.command("api")
 def run_api(host: str = "127.0.0.1", port: int = 8080) -> None:
     uvicorn.run("mnp_cdx.api.app:app", host=host, port=port, reload=False)
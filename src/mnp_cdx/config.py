@@ -13,6 +13,15 @@ class Settings:
     data_dir: Path
     db_path: Path
     mapping_path: Path
+    parser_engine: str = "openpyxl"
+    parse_cache_dir: Path | None = None
+    parse_cache_max_bytes: int = 512 * 1024 * 1024
+    ingest_queue_size: int = 16
+    ingest_workers: int = 1
+    analytics_cache_entries: int = 256
+    analytics_cache_max_bytes: int = 64 * 1024 * 1024
+    lake_dir: Path | None = None
+    analytics_source: str = "duckdb"
 
     @classmethod
     def load(cls) -> "Settings":
@@ -22,4 +31,36 @@ class Settings:
         mapping_path = Path(
             os.getenv("MNP_CDX_MAPPING_PATH", base_dir / "config" / "operator_mapping.yml")
         ).resolve()
-        return cls(base_dir=base_dir, data_dir=data_dir, db_path=db_path, mapping_path=mapping_path)
+        parser_engine = os.getenv("MNP_CDX_PARSER_ENGINE", "openpyxl").strip().lower()
+        # parse cache disattivata di default: con la cache il workbook viene materializzato
+        # prima delle scritture, senza resta lo streaming a memoria limitata.
+        # MNP_CDX_PARSE_CACHE_MAX_MB=512 (o altro valore > 0) la attiva per i re-ingest frequenti
+        parse_cache_max_mb = int(os.getenv("MNP_CDX_PARSE_CACHE_MAX_MB", "0"))
+        parse_cache_dir = (
+            Path(os.getenv("MNP_CDX_PARSE_CACHE_DIR", data_dir / "parse_cache")).resolve()
+            if parse_cache_max_mb > 0
+            else None
+        )
+        ingest_queue_size = int(os.getenv("MNP_CDX_INGEST_QUEUE_SIZE", "16"))
+        ingest_workers = int(os.getenv("MNP_CDX_INGEST_WORKERS", "1"))
+        # MNP_CDX_ANALYTICS_CACHE_ENTRIES=0 disattiva la cache dei risultati analytics
+        analytics_cache_entries = int(os.getenv("MNP_CDX_ANALYTICS_CACHE_ENTRIES", "256"))
+        analytics_cache_mb = int(os.getenv("MNP_CDX_ANALYTICS_CACHE_MAX_MB", "64"))
+        lake_dir = Path(os.getenv("MNP_CDX_LAKE_DIR", data_dir / "lake")).resolve()
+        # "lake": trend, KPI, top donor/recipient e matrice flussi leggono lo snapshot Parquet (mnp-cdx lake-export)
+        analytics_source = os.getenv("MNP_CDX_ANALYTICS_SOURCE", "duckdb").strip().lower()
+        return cls(
+            base_dir=base_dir,
+            data_dir=data_dir,
+            db_path=db_path,
+            mapping_path=mapping_path,
+            parser_engine=parser_engine,
+            parse_cache_dir=parse_cache_dir,
+            parse_cache_max_bytes=parse_cache_max_mb * 1024 * 1024,
+            ingest_queue_size=ingest_queue_size,
+            ingest_workers=ingest_workers,
+            analytics_cache_entries=analytics_cache_entries,
+            analytics_cache_max_bytes=analytics_cache_mb * 1024 * 1024,
+            lake_dir=lake_dir,
+            analytics_source=analytics_source,
+        )
@@ -0,0 +1,73 @@
+"""Per-thread DuckDB cursors over a single shared database instance."""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+import threading
+
+import duckdb
+
+
+class ConnectionManager:
+    """Distribuisce una connessione DuckDB per thread sullo stesso database.
+
+    Una `DuckDBPyConnection` non va usata da piu thread insieme: ogni thread
+    (es. il thread pool di FastAPI per gli endpoint sync) riceve il proprio
+    `cursor()` della connessione radice, cosi le letture analitiche girano in
+    parallelo sullo stesso database in-process. Le scritture passano da
+    `writer()`, un lock rientrante che serializza gli ingest ed evita conflitti
+    di transazione tra cursori diversi.
+    """
+
+    def __init__(self, db_path: str | Path) -> None:
+        self.db_path = Path(db_path)
+        self._root = duckdb.connect(str(self.db_path))
+        self._local = threading.local()
+        self._cursors: list[duckdb.DuckDBPyConnection] = []
+        self._cursors_lock = threading.Lock()
+        self._writer_lock = threading.RLock()
+        self._closed = False
+
+    def cursor(self) -> duckdb.DuckDBPyConnection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            with self._cursors_lock:
+                if self._closed:
+                    raise RuntimeError(f"ConnectionManager chiuso: {self.db_path}")
+                con = self._root.cursor()
+                self._cursors.append(con)
+            self._local.con = con
+        return con
+
+    @contextmanager
+    def writer(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        with self._writer_lock:
+            yield self.cursor()
+
+    @contextmanager
+    def snapshot(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """Cursore dedicato in una transazione di sola lettura, senza lock writer.
+
+        L'MVCC di DuckDB garantisce una vista coerente del database per tutta la
+        durata del blocco, mentre gli ingest continuano a scrivere e committare.
+        """
+        with self._cursors_lock:
+            if self._closed:
+                raise RuntimeError(f"ConnectionManager chiuso: {self.db_path}")
+            con = self._root.cursor()
+        try:
+            con.execute("BEGIN TRANSACTION")
+            yield con
+            con.execute("ROLLBACK")
+        finally:
+            con.close()
+
+    def close(self) -> None:
+        with self._cursors_lock:
+            self._closed = True
+            cursors, self._cursors = self._cursors, []
+        for con in cursors:
+            con.close()
+        self._root.close()
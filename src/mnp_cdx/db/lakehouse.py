@@ -0,0 +1,182 @@
+"""Hive-partitioned Parquet export of fact tables and DuckDB views over it."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+from typing import Any
+import logging
+import shutil
+import uuid
+
+import duckdb
+
+from mnp_cdx.config import Settings
+from mnp_cdx.db.repository import DBRepository
+
+
+logger = logging.getLogger(__name__)
+
+
+# tabella -> (select di export con colonne di partizione, chiavi di partizione, tipi hive)
+LAKE_TABLES: dict[str, tuple[str, tuple[str, ...], str]] = {
+    "mnp_flow_fact": (
+        """
+        SELECT *, year(period_date) AS year, month(period_date) AS month
+        FROM mnp_flow_fact
+        """,
+        ("period_type", "year", "month"),
+        "{'period_type': VARCHAR, 'year': INTEGER, 'month': INTEGER}",
+    ),
+    # le righe template non hanno period_type: si partiziona per template; senza data -> year=0
+    "excel_row_fact": (
+        """
+        SELECT *, COALESCE(year(event_date), 0) AS year, COALESCE(month(event_date), 0) AS month
+        FROM excel_row_fact
+        """,
+        ("template_id", "year", "month"),
+        "{'template_id': BIGINT, 'year': INTEGER, 'month': INTEGER}",
+    ),
+}
+
+
+def _sql_path(path: Path) -> str:
+    return str(path).replace("'", "''")
+
+
+def partition_filter(
+    start_date: date | None,
+    end_date: date | None,
+    alias: str = "",
+) -> tuple[str, list[Any]]:
+    """Predicati su year/month che DuckDB applica alla lista file (partition pruning).
+
+    Espressioni come `year * 12 + month` non vengono potate: servono confronti
+    diretti sulle colonne di partizione. Il filtro esatto su `period_date`
+    resta a carico del chiamante.
+    """
+    prefix = f"{alias}." if alias else ""
+    clauses: list[str] = []
+    params: list[Any] = []
+    if start_date is not None:
+        clauses.append(f"({prefix}year > ? OR ({prefix}year = ? AND {prefix}month >= ?))")
+        params += [start_date.year, start_date.year, start_date.month]
+    if end_date is not None:
+        clauses.append(f"({prefix}year < ? OR ({prefix}year = ? AND {prefix}month <= ?))")
+        params += [end_date.year, end_date.year, end_date.month]
+    return " AND ".join(clauses) or "TRUE", params
+
+
+@dataclass
+class LakeExportResult:
+    root: Path
+    flow_rows: int
+    template_rows: int
+    files: int
+
+
+class Lakehouse:
+    """Snapshot Parquet dei fatti sotto `root`, partizionato stile Hive.
+
+    Layout: `root/mnp_flow_fact/period_type=.../year=.../month=.../*.parquet`
+    e `root/excel_row_fact/template_id=.../year=.../month=.../*.parquet`.
+    Le viste `lake_mnp_flow_fact` e `lake_excel_row_fact` leggono i file con
+    `hive_partitioning`, quindi i filtri su period_type/year/month scartano le
+    directory non pertinenti prima di aprire i file.
+    """
+
+    def __init__(self, root: str | Path) -> None:
+        self.root = Path(root)
+
+    def table_dir(self, table: str) -> Path:
+        return self.root / table
+
+    @property
+    def available(self) -> bool:
+        """True dopo almeno un export riuscito."""
+        return self.table_dir("mnp_flow_fact").is_dir()
+
+    def export(self, repo: DBRepository) -> LakeExportResult:
+        """Riscrive lo snapshot completo; la directory precedente viene sostituita solo a export riuscito."""
+        staging = self.root.with_name(f".{self.root.name}.{uuid.uuid4().hex}")
+        staging.mkdir(parents=True)
+        counts: dict[str, int] = {}
+        try:
+            # snapshot: le due tabelle vengono esportate dallo stesso stato del database
+            # senza lock writer, quindi gli ingest proseguono durante le COPY
+            with repo.snapshot() as con:
+                for table, (query, partitions, _) in LAKE_TABLES.items():
+                    counts[table] = int(con.execute(f"SELECT COUNT(*) FROM ({query})").fetchone()[0])
+                    target = staging / table
+                    if counts[table] == 0:
+                        target.mkdir()
+                        continue
+                    con.execute(
+                        f"""
+                        COPY ({query}) TO '{_sql_path(target)}'
+                        (FORMAT PARQUET, PARTITION_BY ({", ".join(partitions)}))
+                        """
+                    )
+            self._swap(staging)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        # solo la ridefinizione delle viste passa dal writer; lo snapshot e cambiato,
+        # quindi i risultati in cache calcolati in modalita lake non valgono piu
+        self.create_views(repo)
+        repo.bump_generation()
+
+        return LakeExportResult(
+            root=self.root,
+            flow_rows=counts["mnp_flow_fact"],
+            template_rows=counts["excel_row_fact"],
+            files=sum(1 for _ in self.root.rglob("*.parquet")),
+        )
+
+    def create_views(self, repo: DBRepository) -> None:
+        with repo.writer() as con:
+            self._create_views(con)
+
+    def _swap(self, staging: Path) -> None:
+        previous = None
+        if self.root.exists():
+            previous = self.root.with_name(f".{self.root.name}.old.{uuid.uuid4().hex}")
+            self.root.rename(previous)
+        staging.rename(self.root)
+        if previous is not None:
+            shutil.rmtree(previous, ignore_errors=True)
+
+    def _create_views(self, con: duckdb.DuckDBPyConnection) -> None:
+        for table, (query, _, hive_types) in LAKE_TABLES.items():
+            pattern = self.table_dir(table) / "**" / "*.parquet"
+            if not any(self.table_dir(table).rglob("*.parquet")):
+                # nessun file: la vista resta vuota ma interrogabile, con le stesse colonne
+                con.execute(f"CREATE OR REPLACE VIEW lake_{table} AS SELECT * FROM ({query}) WHERE FALSE")
+                continue
+            con.execute(
+                f"""
+                CREATE OR REPLACE VIEW lake_{table} AS
+                SELECT * FROM read_parquet(
+                    '{_sql_path(pattern)}',
+                    hive_partitioning = true,
+                    hive_types = {hive_types}
+                )
+                """
+            )
+
+
+def lakehouse_for(settings: Settings) -> Lakehouse:
+    return Lakehouse(settings.lake_dir or settings.data_dir / "lake")
+
+
+def analytics_lake(settings: Settings, repo: DBRepository) -> Lakehouse | None:
+    """Lakehouse da passare ad `AnalyticsService`: solo in modalita `lake` e dopo un export."""
+    if settings.analytics_source != "lake":
+        return None
+    lake = lakehouse_for(settings)
+    if not lake.available:
+        logger.warning("MNP_CDX_ANALYTICS_SOURCE=lake ma nessuno snapshot in %s: uso DuckDB", lake.root)
+        return None
+    lake.create_views(repo)
+    return lake
@@ -2,14 +2,22 @@
 
 from __future__ import annotations
 
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, Any
+from typing import Callable, Iterable, Iterator, Any
 import json
+import threading
 
 import duckdb
 import pandas as pd
 
+from mnp_cdx.db.connection import ConnectionManager
+
+
+# risolve i nomi raw senza alias: righe (raw_name, canonical_name, group_name, type)
+OperatorFallback = Callable[[list[str]], list[tuple[str, str, str | None, str | None]]]
+
 
 @dataclass
 class DBRepository:
@@ -18,18 +26,99 @@ class DBRepository:
     def __post_init__(self) -> None:
         self.db_path = Path(self.db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
-        self.con = duckdb.connect(str(self.db_path))
+        self.connections = ConnectionManager(self.db_path)
+        # generazione dati: cresce a ogni scrittura, usata per invalidare cache di risultati
+        self.generation = 0
+        self._generation_lock = threading.Lock()
+        # profondita delle transaction() annidate (protetta dal lock writer)
+        self._transaction_depth = 0
+        # scritture nella transazione aperta: la generazione avanza solo al COMMIT
+        self._generation_pending = False
+
+    @property
+    def con(self) -> duckdb.DuckDBPyConnection:
+        """Cursore DuckDB del thread corrente (stesso database, stato di sessione separato)."""
+        return self.connections.cursor()
+
+    @contextmanager
+    def writer(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """Percorso di scrittura esclusivo: un solo ingest alla volta, da qualunque thread.
+
+        Non invalida le cache da solo: la generazione avanza solo dai metodi che
+        scrivono dati (`bump_generation`), cosi duplicati e rollback le lasciano valide.
+        """
+        with self.connections.writer() as con:
+            yield con
+
+    @contextmanager
+    def snapshot(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """Lettura coerente di lunga durata (es. export) che non blocca gli ingest."""
+        with self.connections.snapshot() as con:
+            yield con
+
+    @contextmanager
+    def transaction(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """Writer esclusivo dentro una transazione esplicita: commit una volta, rollback su errore.
+
+        Le chiamate annidate riusano la transazione esterna, cosi un ingest
+        composto da piu metodi del repository resta atomico.
+        """
+        with self.writer() as con:
+            if self._transaction_depth:
+                self._transaction_depth += 1
+                try:
+                    yield con
+                finally:
+                    self._transaction_depth -= 1
+                return
+
+            con.execute("BEGIN TRANSACTION")
+            self._transaction_depth = 1
+            self._generation_pending = False
+            try:
+                yield con
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            else:
+                con.execute("COMMIT")
+                if self._generation_pending:
+                    self._advance_generation()
+            finally:
+                self._transaction_depth = 0
+                self._generation_pending = False
+
+    def bump_generation(self) -> int:
+        """Segnala una scrittura di dati: dentro una transazione vale al COMMIT."""
+        if self._transaction_depth:
+            # prima del COMMIT un lettore vedrebbe ancora i dati vecchi: niente cache con la nuova generazione
+            self._generation_pending = True
+            return self.generation
+        return self._advance_generation()
+
+    def _advance_generation(self) -> int:
+        with self._generation_lock:
+            self.generation += 1
+            return self.generation
 
     def close(self) -> None:
-        self.con.close()
+        self.connections.close()
 
     def init_schema(self) -> None:
+        # transazione unica: una migrazione interrotta non lascia lo schema a meta
+        with self.transaction():
+            self._create_schema()
+
+    def _create_schema(self) -> None:
         self.con.execute(
             """
             CREATE SEQUENCE IF NOT EXISTS seq_file_id START 1;
             CREATE SEQUENCE IF NOT EXISTS seq_operator_id START 1;
             CREATE SEQUENCE IF NOT EXISTS seq_template_id START 1;
             CREATE SEQUENCE IF NOT EXISTS seq_ingest_event_id START 1;
+            CREATE SEQUENCE IF NOT EXISTS seq_metric_id START 1;
+            CREATE SEQUENCE IF NOT EXISTS seq_raw_name_id START 1;
+            CREATE SEQUENCE IF NOT EXISTS seq_sheet_id START 1;
 
             CREATE TABLE IF NOT EXISTS ingest_file (
                 file_id BIGINT PRIMARY KEY,
@@ -49,20 +138,63 @@ class DBRepository:
                 created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
             );
 
-            CREATE TABLE IF NOT EXISTS mnp_flow_fact (
+            -- alias normalizzati da operator_mapping.yml: la risoluzione dei nomi raw e' una join
+            CREATE TABLE IF NOT EXISTS operator_alias (
+                alias VARCHAR NOT NULL,
+                canonical_name VARCHAR NOT NULL,
+                group_name VARCHAR,
+                type VARCHAR
+            );
+
+            -- nomi raw senza alias affidabile: da rivedere e aggiungere al mapping
+            CREATE TABLE IF NOT EXISTS operator_unmapped_name (
+                raw_name VARCHAR NOT NULL,
+                normalized_name VARCHAR NOT NULL,
+                suggestion VARCHAR,
+                confidence DOUBLE NOT NULL,
+                seen_count BIGINT NOT NULL DEFAULT 1,
+                first_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                last_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+
+            -- fatti MNP con testi ripetuti codificati: la vista mnp_flow_fact espone le colonne originali
+            CREATE TYPE IF NOT EXISTS period_type_enum AS ENUM ('DAILY', 'MONTHLY');
+            CREATE TYPE IF NOT EXISTS quality_flag_enum AS ENUM ('IMPUTED', 'OK');
+
+            CREATE TABLE IF NOT EXISTS raw_name_dim (
+                raw_name_id INTEGER PRIMARY KEY,
+                raw_name VARCHAR NOT NULL UNIQUE
+            );
+
+            CREATE TABLE IF NOT EXISTS sheet_dim (
+                sheet_id INTEGER PRIMARY KEY,
+                sheet_name VARCHAR NOT NULL UNIQUE
+            );
+
+            CREATE TABLE IF NOT EXISTS mnp_flow_store (
                 file_id BIGINT NOT NULL,
-                period_type VARCHAR NOT NULL,
+                period_type period_type_enum NOT NULL,
                 period_date DATE NOT NULL,
                 donor_operator_id BIGINT NOT NULL,
                 recipient_operator_id BIGINT NOT NULL,
                 value DOUBLE NOT NULL,
-                sheet_name VARCHAR,
-                quality_flag VARCHAR NOT NULL DEFAULT 'OK',
-                donor_raw VARCHAR,
-                recipient_raw VARCHAR,
+                sheet_id INTEGER,
+                quality_flag quality_flag_enum NOT NULL DEFAULT 'OK',
+                donor_raw_id INTEGER,
+                recipient_raw_id INTEGER,
                 created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
             );
 
+            -- aggregato per operatore e periodo, mantenuto incrementalmente dalle scritture su mnp_flow_store
+            CREATE TABLE IF NOT EXISTS operator_period_agg (
+                period_type VARCHAR NOT NULL,
+                period_date DATE NOT NULL,
+                operator_id BIGINT NOT NULL,
+                port_in DOUBLE NOT NULL,
+                port_out DOUBLE NOT NULL,
+                net_flow DOUBLE NOT NULL
+            );
+
             CREATE TABLE IF NOT EXISTS excel_template (
                 template_id BIGINT PRIMARY KEY,
                 template_name VARCHAR NOT NULL,
@@ -86,6 +218,45 @@ class DBRepository:
                 created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
             );
 
+            -- righe template per (file, sheet, data): il trend template non scansiona excel_row_fact
+            CREATE TABLE IF NOT EXISTS excel_row_date_agg (
+                file_id BIGINT NOT NULL,
+                template_id BIGINT NOT NULL,
+                sheet_name VARCHAR NOT NULL,
+                event_date DATE NOT NULL,
+                row_count BIGINT NOT NULL
+            );
+
+            -- metriche dei template in formato stretto e tipizzato (stesse righe di excel_row_fact)
+            CREATE TABLE IF NOT EXISTS excel_metric_dim (
+                metric_id BIGINT PRIMARY KEY,
+                metric_name VARCHAR NOT NULL UNIQUE,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE TABLE IF NOT EXISTS excel_metric_fact (
+                file_id BIGINT NOT NULL,
+                template_id BIGINT NOT NULL,
+                sheet_name VARCHAR NOT NULL,
+                row_number BIGINT NOT NULL,
+                event_date DATE,
+                metric_id BIGINT NOT NULL,
+                value DOUBLE NOT NULL
+            );
+
+            -- catalogo metriche per template, aggiornato a ogni scrittura su excel_metric_fact
+            CREATE TABLE IF NOT EXISTS template_metric (
+                template_id BIGINT NOT NULL,
+                metric_id BIGINT NOT NULL,
+                metric_name VARCHAR NOT NULL,
+                first_date DATE,
+                last_date DATE,
+                row_count BIGINT NOT NULL,
+                min_value DOUBLE,
+                max_value DOUBLE,
+                updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+
             CREATE TABLE IF NOT EXISTS excel_ingest_event (
                 event_id BIGINT PRIMARY KEY,
                 file_id BIGINT NOT NULL,
@@ -96,39 +267,197 @@ class DBRepository:
                 notes TEXT
             );
 
-            CREATE INDEX IF NOT EXISTS idx_flow_period ON mnp_flow_fact(period_type, period_date);
-            CREATE INDEX IF NOT EXISTS idx_flow_donor ON mnp_flow_fact(donor_operator_id, period_date);
-            CREATE INDEX IF NOT EXISTS idx_flow_recipient ON mnp_flow_fact(recipient_operator_id, period_date);
+            CREATE INDEX IF NOT EXISTS idx_flow_store_period ON mnp_flow_store(period_type, period_date);
+            CREATE INDEX IF NOT EXISTS idx_flow_store_donor ON mnp_flow_store(donor_operator_id, period_date);
+            CREATE INDEX IF NOT EXISTS idx_flow_store_recipient ON mnp_flow_store(recipient_operator_id, period_date);
+
+            CREATE INDEX IF NOT EXISTS idx_operator_alias ON operator_alias(alias);
+
+            CREATE INDEX IF NOT EXISTS idx_agg_period ON operator_period_agg(period_type, period_date);
+            CREATE INDEX IF NOT EXISTS idx_agg_operator ON operator_period_agg(operator_id, period_type, period_date);
 
             CREATE INDEX IF NOT EXISTS idx_excel_row_template_date ON excel_row_fact(template_id, event_date);
             CREATE INDEX IF NOT EXISTS idx_excel_row_sheet ON excel_row_fact(sheet_name);
+            CREATE INDEX IF NOT EXISTS idx_excel_row_date_agg ON excel_row_date_agg(template_id, event_date);
+            CREATE INDEX IF NOT EXISTS idx_excel_metric_template ON excel_metric_fact(template_id, metric_id, event_date);
+            CREATE INDEX IF NOT EXISTS idx_template_metric ON template_metric(template_id, metric_id);
             CREATE INDEX IF NOT EXISTS idx_excel_ingest_template ON excel_ingest_event(template_id, created_at);
 
+            -- stessa normalizzazione di operator_mapping._normalize_name
+            CREATE OR REPLACE MACRO mnp_normalize_name(s) AS
+                replace(replace(regexp_replace(upper(s), '^\\s+|\\s+$', '', 'g'), '-', ' '), '  ', ' ');
+
             CREATE OR REPLACE VIEW v_operator_period AS
-            WITH in_flow AS (
-              SELECT period_type, period_date, recipient_operator_id AS operator_id, SUM(value) AS port_in
-              FROM mnp_flow_fact
-              GROUP BY 1,2,3
+            SELECT period_type, period_date, operator_id, port_in, port_out, net_flow
+            FROM operator_period_agg;
+            """
+        )
+        self._migrate_flow_fact_storage()
+        self.con.execute(
+            """
+            CREATE OR REPLACE VIEW mnp_flow_fact AS
+            SELECT
+                f.file_id,
+                CAST(f.period_type AS VARCHAR) AS period_type,
+                f.period_date,
+                f.donor_operator_id,
+                f.recipient_operator_id,
+                f.value,
+                s.sheet_name,
+                CAST(f.quality_flag AS VARCHAR) AS quality_flag,
+                d.raw_name AS donor_raw,
+                r.raw_name AS recipient_raw,
+                f.created_at
+            FROM mnp_flow_store f
+            LEFT JOIN sheet_dim s ON s.sheet_id = f.sheet_id
+            LEFT JOIN raw_name_dim d ON d.raw_name_id = f.donor_raw_id
+            LEFT JOIN raw_name_dim r ON r.raw_name_id = f.recipient_raw_id
+            """
+        )
+        self._backfill_operator_period_agg()
+        self._backfill_excel_metric_fact()
+        self._backfill_excel_row_date_agg()
+        if not self.con.execute("SELECT 1 FROM template_metric LIMIT 1").fetchone():
+            self._rebuild_template_metric_catalog()
+
+    def _migrate_flow_fact_storage(self) -> None:
+        # database precedenti: mnp_flow_fact era una tabella con testi in chiaro; i dati passano
+        # in mnp_flow_store codificati e il nome torna disponibile per la vista di compatibilita
+        row = self.con.execute(
+            """
+            SELECT table_type FROM information_schema.tables
+            WHERE table_schema = 'main' AND table_name = 'mnp_flow_fact'
+            """
+        ).fetchone()
+        if row is None or row[0] != "BASE TABLE":
+            return
+        self._intern_flow_texts("mnp_flow_fact")
+        self.con.execute(
+            """
+            INSERT INTO mnp_flow_store(
+                file_id,
+                period_type,
+                period_date,
+                donor_operator_id,
+                recipient_operator_id,
+                value,
+                sheet_id,
+                quality_flag,
+                donor_raw_id,
+                recipient_raw_id,
+                created_at
+            )
+            SELECT
+                f.file_id,
+                f.period_type,
+                f.period_date,
+                f.donor_operator_id,
+                f.recipient_operator_id,
+                f.value,
+                s.sheet_id,
+                f.quality_flag,
+                d.raw_name_id,
+                r.raw_name_id,
+                f.created_at
+            FROM mnp_flow_fact f
+            LEFT JOIN sheet_dim s ON s.sheet_name = f.sheet_name
+            LEFT JOIN raw_name_dim d ON d.raw_name = f.donor_raw
+            LEFT JOIN raw_name_dim r ON r.raw_name = f.recipient_raw
+            """
+        )
+        self.con.execute("DROP TABLE mnp_flow_fact")
+
+    def _backfill_operator_period_agg(self) -> None:
+        # database creati prima dell'aggregato: ricostruzione completa una tantum
+        agg_rows = self.con.execute("SELECT COUNT(*) FROM operator_period_agg").fetchone()[0]
+        if agg_rows == 0 and self.con.execute("SELECT 1 FROM mnp_flow_store LIMIT 1").fetchone():
+            self._refresh_operator_period_agg("SELECT DISTINCT period_type, period_date FROM mnp_flow_store")
+
+    def _backfill_excel_metric_fact(self) -> None:
+        # righe template ingestite prima della tabella tipizzata: esplosione una tantum del JSON
+        if self.con.execute("SELECT 1 FROM excel_metric_fact LIMIT 1").fetchone():
+            return
+        if not self.con.execute(
+            "SELECT 1 FROM excel_row_fact WHERE metrics_json IS NOT NULL AND metrics_json <> '{}' LIMIT 1"
+        ).fetchone():
+            return
+        self.con.execute(
+            """
+            CREATE OR REPLACE TEMP TABLE _metric_backfill AS
+            SELECT file_id, template_id, sheet_name, row_number, event_date, e.key AS metric_name, e.value AS value
+            FROM (
+                SELECT
+                    file_id,
+                    template_id,
+                    sheet_name,
+                    row_number,
+                    event_date,
+                    UNNEST(map_entries(CAST(json(metrics_json) AS MAP(VARCHAR, DOUBLE)))) AS e
+                FROM excel_row_fact
+                WHERE metrics_json IS NOT NULL AND metrics_json <> '{}'
+            )
+            WHERE e.value IS NOT NULL
+            """
+        )
+        self._insert_metric_rows("_metric_backfill")
+        self.con.execute("DROP TABLE IF EXISTS _metric_backfill")
+
+    def _backfill_excel_row_date_agg(self) -> None:
+        # righe template ingestite prima della tabella pre-aggregata: conteggio una tantum
+        if self.con.execute("SELECT 1 FROM excel_row_date_agg LIMIT 1").fetchone():
+            return
+        if not self.con.execute("SELECT 1 FROM excel_row_fact WHERE event_date IS NOT NULL LIMIT 1").fetchone():
+            return
+        self._merge_excel_row_date_agg("excel_row_fact")
+
+    def _refresh_operator_period_agg(self, periods_query: str, params: list[Any] | None = None) -> None:
+        """Ricalcola `operator_period_agg` solo per i periodi restituiti da `periods_query`.
+
+        `periods_query` seleziona (period_type, period_date) toccati da una
+        scrittura; il costo dipende dal volume di quei periodi, non dallo
+        storico complessivo.
+        """
+        self.con.execute(
+            f"CREATE OR REPLACE TEMP TABLE _agg_periods AS SELECT DISTINCT period_type, period_date FROM ({periods_query})",
+            params or [],
+        )
+        self.con.execute(
+            """
+            DELETE FROM operator_period_agg a
+            USING _agg_periods p
+            WHERE a.period_type = p.period_type
+              AND a.period_date = p.period_date
+            """
+        )
+        self.con.execute(
+            """
+            INSERT INTO operator_period_agg(period_type, period_date, operator_id, port_in, port_out, net_flow)
+            WITH scoped AS (
+                SELECT f.period_type, f.period_date, f.donor_operator_id, f.recipient_operator_id, f.value
+                FROM mnp_flow_store f
+                JOIN _agg_periods p
+                  ON p.period_type = f.period_type
+                 AND p.period_date = f.period_date
             ),
-            out_flow AS (
-              SELECT period_type, period_date, donor_operator_id AS operator_id, SUM(value) AS port_out
-              FROM mnp_flow_fact
-              GROUP BY 1,2,3
+            flows AS (
+                SELECT period_type, period_date, recipient_operator_id AS operator_id, value AS port_in, 0.0 AS port_out
+                FROM scoped
+                UNION ALL
+                SELECT period_type, period_date, donor_operator_id AS operator_id, 0.0 AS port_in, value AS port_out
+                FROM scoped
             )
             SELECT
-              COALESCE(i.period_type, o.period_type) AS period_type,
-              COALESCE(i.period_date, o.period_date) AS period_date,
-              COALESCE(i.operator_id, o.operator_id) AS operator_id,
-              COALESCE(i.port_in, 0) AS port_in,
-              COALESCE(o.port_out, 0) AS port_out,
-              COALESCE(i.port_in, 0) - COALESCE(o.port_out, 0) AS net_flow
-            FROM in_flow i
-            FULL OUTER JOIN out_flow o
-              ON i.period_type = o.period_type
-             AND i.period_date = o.period_date
-             AND i.operator_id = o.operator_id;
+                period_type,
+                period_date,
+                operator_id,
+                SUM(port_in) AS port_in,
+                SUM(port_out) AS port_out,
+                SUM(port_in) - SUM(port_out) AS net_flow
+            FROM flows
+            GROUP BY 1, 2, 3
             """
         )
+        self.con.execute("DROP TABLE IF EXISTS _agg_periods")
 
     def next_id(self, sequence_name: str) -> int:
         return int(self.con.execute(f"SELECT nextval('{sequence_name}')").fetchone()[0])
@@ -179,13 +508,321 @@ class DBRepository:
             """,
             [operator_id, canonical_name, group_name, op_type],
         )
+        self.bump_generation()
         return operator_id
 
+    def load_operator_ids(self) -> dict[str, int]:
+        rows = self.con.execute("SELECT canonical_name, operator_id FROM operator_dim").fetchall()
+        return {row[0]: int(row[1]) for row in rows}
+
+    def insert_operators(self, operators: list[tuple[str, str | None, str | None]]) -> dict[str, int]:
+        """Inserisce in un solo statement gli operatori mancanti e ritorna gli id richiesti."""
+        if not operators:
+            return {}
+        df = pd.DataFrame(operators, columns=["canonical_name", "group_name", "type"])
+        df = df.drop_duplicates(subset=["canonical_name"])
+        self.con.register("df_operator", df)
+        self.con.execute(
+            """
+            INSERT INTO operator_dim(operator_id, canonical_name, group_name, type)
+            SELECT nextval('seq_operator_id'), n.canonical_name, n.group_name, n.type
+            FROM df_operator n
+            WHERE NOT EXISTS (
+                SELECT 1 FROM operator_dim o WHERE o.canonical_name = n.canonical_name
+            )
+            """
+        )
+        rows = self.con.execute(
+            """
+            SELECT o.canonical_name, o.operator_id
+            FROM operator_dim o
+            JOIN df_operator n ON n.canonical_name = o.canonical_name
+            """
+        ).fetchall()
+        self.con.unregister("df_operator")
+        self.bump_generation()
+        return {row[0]: int(row[1]) for row in rows}
+
+    def has_operator_aliases(self) -> bool:
+        return self.con.execute("SELECT 1 FROM operator_alias LIMIT 1").fetchone() is not None
+
+    def replace_operator_aliases(self, aliases: list[tuple[str, str, str | None, str | None]]) -> int:
+        """Sostituisce il contenuto di `operator_alias` con il mapping dato.
+
+        Ogni tupla e' (alias normalizzato, canonical_name, group_name, type).
+        Gruppo e tipo degli operatori gia presenti vengono allineati al
+        mapping; i fatti non vengono toccati (vedi `recanonicalize_flows`).
+        """
+        df = pd.DataFrame(aliases, columns=["alias", "canonical_name", "group_name", "type"])
+        df = df.drop_duplicates(subset=["alias"], keep="last")
+        self.con.register("df_alias", df)
+        self.con.execute("DELETE FROM operator_alias")
+        self.con.execute(
+            """
+            INSERT INTO operator_alias(alias, canonical_name, group_name, type)
+            SELECT alias, canonical_name, group_name, type FROM df_alias
+            """
+        )
+        self.con.execute(
+            """
+            UPDATE operator_dim o
+            SET group_name = m.group_name, type = m.type
+            FROM (SELECT DISTINCT canonical_name, group_name, type FROM df_alias) m
+            WHERE o.canonical_name = m.canonical_name
+              AND (o.group_name IS DISTINCT FROM m.group_name OR o.type IS DISTINCT FROM m.type)
+            """
+        )
+        self.con.unregister("df_alias")
+        self.bump_generation()
+        return int(len(df))
+
+    def _resolve_raw_names(self, source: str, fallback: OperatorFallback | None = None) -> None:
+        """Risolve i `raw_name` distinti di `source` in `_raw_resolved(raw_name, operator_id)`.
+
+        Una join su `operator_alias` (alias esatto, poi lato sinistro dei nomi
+        combinati "A + B"). I nomi senza alias passano da `fallback` se dato
+        (es. match fuzzy del mapper), altrimenti diventano operatori UNMAPPED
+        con il nome normalizzato come canonico.
+        """
+        self.con.execute(
+            f"""
+            CREATE OR REPLACE TEMP TABLE _raw_canonical AS
+            WITH names AS (
+                SELECT raw_name, COALESCE(NULLIF(mnp_normalize_name(raw_name), ''), 'UNKNOWN') AS normalized
+                FROM (SELECT DISTINCT raw_name FROM {source})
+            )
+            SELECT
+                n.raw_name,
+                COALESCE(a.canonical_name, l.canonical_name, n.normalized) AS canonical_name,
+                CASE WHEN a.alias IS NOT NULL THEN a.group_name
+                     WHEN l.alias IS NOT NULL THEN l.group_name
+                     ELSE 'UNMAPPED' END AS group_name,
+                CASE WHEN a.alias IS NOT NULL THEN a.type
+                     WHEN l.alias IS NOT NULL THEN l.type
+                     ELSE 'UNKNOWN' END AS type,
+                a.alias IS NOT NULL OR l.alias IS NOT NULL AS matched
+            FROM names n
+            LEFT JOIN operator_alias a ON a.alias = n.normalized
+            LEFT JOIN operator_alias l
+              ON strpos(n.normalized, '+') > 0
+             AND l.alias = trim(split_part(n.normalized, '+', 1))
+            """
+        )
+        if fallback is not None:
+            self._apply_operator_fallback(fallback)
+        missing = self.con.execute(
+            """
+            SELECT DISTINCT r.canonical_name, r.group_name, r.type
+            FROM _raw_canonical r
+            WHERE NOT EXISTS (SELECT 1 FROM operator_dim o WHERE o.canonical_name = r.canonical_name)
+            """
+        ).fetchall()
+        if missing:
+            self.insert_operators(missing)
+        self.con.execute(
+            """
+            CREATE OR REPLACE TEMP TABLE _raw_resolved AS
+            SELECT r.raw_name, o.operator_id
+            FROM _raw_canonical r
+            JOIN operator_dim o ON o.canonical_name = r.canonical_name
+            """
+        )
+        self.con.execute("DROP TABLE IF EXISTS _raw_canonical")
+
+    def _apply_operator_fallback(self, fallback: OperatorFallback) -> None:
+        unmatched = [
+            row[0]
+            for row in self.con.execute(
+                "SELECT raw_name FROM _raw_canonical WHERE NOT matched AND raw_name IS NOT NULL"
+            ).fetchall()
+        ]
+        if not unmatched:
+            return
+        df = pd.DataFrame(fallback(unmatched), columns=["raw_name", "canonical_name", "group_name", "type"])
+        self.con.register("df_raw_fallback", df)
+        self.con.execute(
+            """
+            UPDATE _raw_canonical r
+            SET canonical_name = f.canonical_name, group_name = f.group_name, type = f.type
+            FROM df_raw_fallback f
+            WHERE r.raw_name = f.raw_name
+            """
+        )
+        self.con.unregister("df_raw_fallback")
+
+    def resolve_raw_operators(
+        self, raw_names: list[str], fallback: OperatorFallback | None = None
+    ) -> dict[str, int]:
+        """Mappa nomi operatore raw -> operator_id con una sola join sugli alias."""
+        if not raw_names:
+            return {}
+        self.con.register("df_raw_names", pd.DataFrame({"raw_name": list(dict.fromkeys(raw_names))}))
+        self._resolve_raw_names("df_raw_names", fallback)
+        rows = self.con.execute("SELECT raw_name, operator_id FROM _raw_resolved").fetchall()
+        self.con.unregister("df_raw_names")
+        self.con.execute("DROP TABLE IF EXISTS _raw_resolved")
+        return {row[0]: int(row[1]) for row in rows}
+
+    def record_unmapped_operators(self, rows: list[tuple[str, str, str | None, float]]) -> None:
+        """Aggiorna il report dei nomi non mappati: (raw_name, normalizzato, suggerimento, confidenza)."""
+        if not rows:
+            return
+        df = pd.DataFrame(rows, columns=["raw_name", "normalized_name", "suggestion", "confidence"])
+        df = df.drop_duplicates(subset=["raw_name"], keep="last")
+        self.con.register("df_unmapped", df)
+        self.con.execute(
+            """
+            UPDATE operator_unmapped_name u
+            SET suggestion = n.suggestion,
+                confidence = n.confidence,
+                seen_count = u.seen_count + 1,
+                last_seen_at = CURRENT_TIMESTAMP
+            FROM df_unmapped n
+            WHERE u.raw_name = n.raw_name
+            """
+        )
+        self.con.execute(
+            """
+            INSERT INTO operator_unmapped_name(raw_name, normalized_name, suggestion, confidence)
+            SELECT n.raw_name, n.normalized_name, n.suggestion, n.confidence
+            FROM df_unmapped n
+            WHERE NOT EXISTS (SELECT 1 FROM operator_unmapped_name u WHERE u.raw_name = n.raw_name)
+            """
+        )
+        self.con.unregister("df_unmapped")
+
+    def list_unmapped_operators(self) -> list[dict[str, Any]]:
+        rows = self.con.execute(
+            """
+            SELECT raw_name, normalized_name, suggestion, confidence, seen_count, first_seen_at, last_seen_at
+            FROM operator_unmapped_name
+            ORDER BY seen_count DESC, raw_name
+            """
+        ).fetchall()
+        return [
+            {
+                "raw_name": row[0],
+                "normalized_name": row[1],
+                "suggestion": row[2],
+                "confidence": float(row[3]),
+                "seen_count": int(row[4]),
+                "first_seen_at": str(row[5]),
+                "last_seen_at": str(row[6]),
+            }
+            for row in rows
+        ]
+
+    def recanonicalize_flows(self, fallback: OperatorFallback | None = None) -> dict[str, int]:
+        """Riallinea gli operator_id di `mnp_flow_fact` agli alias correnti.
+
+        Lavora sui nomi raw salvati (`raw_name_dim`), senza rileggere gli
+        Excel: due UPDATE set-based, eliminazione dei self-flow prodotti dalle
+        fusioni di alias e ricalcolo dell'aggregato per i soli periodi toccati.
+        """
+        self.con.execute(
+            """
+            CREATE OR REPLACE TEMP TABLE _fact_raw_names AS
+            SELECT d.raw_name_id, d.raw_name
+            FROM raw_name_dim d
+            WHERE d.raw_name_id IN (
+                SELECT donor_raw_id FROM mnp_flow_store
+                UNION
+                SELECT recipient_raw_id FROM mnp_flow_store
+            )
+            """
+        )
+        if fallback is not None:
+            # il fallback ripopola il report: restano solo i nomi ancora senza alias affidabile
+            self.con.execute("DELETE FROM operator_unmapped_name")
+        self._resolve_raw_names("_fact_raw_names", fallback)
+        self.con.execute(
+            """
+            CREATE OR REPLACE TEMP TABLE _raw_id_resolved AS
+            SELECT n.raw_name_id, r.operator_id
+            FROM _fact_raw_names n
+            JOIN _raw_resolved r ON r.raw_name = n.raw_name
+            """
+        )
+        self.con.execute(
+            """
+            CREATE OR REPLACE TEMP TABLE _recanon_periods AS
+            SELECT DISTINCT f.period_type, f.period_date
+            FROM mnp_flow_store f
+            LEFT JOIN _raw_id_resolved d ON d.raw_name_id = f.donor_raw_id
+            LEFT JOIN _raw_id_resolved r ON r.raw_name_id = f.recipient_raw_id
+            WHERE d.operator_id <> f.donor_operator_id
+               OR r.operator_id <> f.recipient_operator_id
+            """
+        )
+        donor_rows = self.con.execute(
+            """
+            UPDATE mnp_flow_store f
+            SET donor_operator_id = m.operator_id
+            FROM _raw_id_resolved m
+            WHERE f.donor_raw_id = m.raw_name_id
+              AND f.donor_operator_id <> m.operator_id
+            """
+        ).fetchone()[0]
+        recipient_rows = self.con.execute(
+            """
+            UPDATE mnp_flow_store f
+            SET recipient_operator_id = m.operator_id
+            FROM _raw_id_resolved m
+            WHERE f.recipient_raw_id = m.raw_name_id
+              AND f.recipient_operator_id <> m.operator_id
+            """
+        ).fetchone()[0]
+        # due alias fusi nello stesso operatore: i flussi tra loro diventano self-flow
+        self_flows = self.con.execute(
+            "DELETE FROM mnp_flow_store WHERE donor_operator_id = recipient_operator_id"
+        ).fetchone()[0]
+        periods = self.con.execute("SELECT COUNT(*) FROM _recanon_periods").fetchone()[0]
+        self._refresh_operator_period_agg("SELECT period_type, period_date FROM _recanon_periods")
+        # operatori non piu nel mapping e senza flussi (rinominati, fusi, ex UNMAPPED)
+        self.con.execute(
+            """
+            DELETE FROM operator_dim o
+            WHERE NOT EXISTS (SELECT 1 FROM operator_alias a WHERE a.canonical_name = o.canonical_name)
+              AND NOT EXISTS (SELECT 1 FROM mnp_flow_store f WHERE f.donor_operator_id = o.operator_id)
+              AND NOT EXISTS (SELECT 1 FROM mnp_flow_store f WHERE f.recipient_operator_id = o.operator_id)
+            """
+        )
+        for table in ("_fact_raw_names", "_raw_resolved", "_raw_id_resolved", "_recanon_periods"):
+            self.con.execute(f"DROP TABLE IF EXISTS {table}")
+        self.bump_generation()
+        return {
+            "updated_donor_rows": int(donor_rows),
+            "updated_recipient_rows": int(recipient_rows),
+            "deleted_self_flows": int(self_flows),
+            "refreshed_periods": int(periods),
+        }
+
     def delete_flows_for_file_id(self, file_id: int) -> None:
-        self.con.execute("DELETE FROM mnp_flow_fact WHERE file_id = ?", [file_id])
+        self.con.execute(
+            """
+            CREATE OR REPLACE TEMP TABLE _deleted_periods AS
+            SELECT DISTINCT period_type, period_date FROM mnp_flow_store WHERE file_id = ?
+            """,
+            [file_id],
+        )
+        self.con.execute("DELETE FROM mnp_flow_store WHERE file_id = ?", [file_id])
+        self._refresh_operator_period_agg("SELECT period_type, period_date FROM _deleted_periods")
+        self.con.execute("DROP TABLE IF EXISTS _deleted_periods")
+        self.bump_generation()
 
     def delete_generic_rows_for_file_id(self, file_id: int) -> None:
+        templates = [
+            int(row[0])
+            for row in self.con.execute(
+                "SELECT DISTINCT template_id FROM excel_metric_fact WHERE file_id = ?", [file_id]
+            ).fetchall()
+        ]
         self.con.execute("DELETE FROM excel_row_fact WHERE file_id = ?", [file_id])
+        self.con.execute("DELETE FROM excel_row_date_agg WHERE file_id = ?", [file_id])
+        self.con.execute("DELETE FROM excel_metric_fact WHERE file_id = ?", [file_id])
+        for template_id in templates:
+            self._rebuild_template_metric_catalog(template_id)
+        self.bump_generation()
         self.con.execute("DELETE FROM excel_ingest_event WHERE file_id = ?", [file_id])
 
     def delete_file_everywhere_by_checksum(self, checksum: str) -> None:
@@ -200,40 +837,183 @@ class DBRepository:
         # backward-compatible alias
         self.delete_file_everywhere_by_checksum(checksum)
 
+    def _intern_flow_texts(self, source: str) -> None:
+        """Aggiunge a `raw_name_dim` e `sheet_dim` i testi di `source` non ancora codificati."""
+        self.con.execute(
+            f"""
+            INSERT INTO raw_name_dim(raw_name_id, raw_name)
+            SELECT nextval('seq_raw_name_id'), raw_name
+            FROM (
+                SELECT CAST(donor_raw AS VARCHAR) AS raw_name FROM {source}
+                UNION
+                SELECT CAST(recipient_raw AS VARCHAR) FROM {source}
+            ) n
+            WHERE raw_name IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM raw_name_dim d WHERE d.raw_name = n.raw_name)
+            """
+        )
+        self.con.execute(
+            f"""
+            INSERT INTO sheet_dim(sheet_id, sheet_name)
+            SELECT nextval('seq_sheet_id'), sheet_name
+            FROM (SELECT DISTINCT CAST(sheet_name AS VARCHAR) AS sheet_name FROM {source}) n
+            WHERE sheet_name IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM sheet_dim s WHERE s.sheet_name = n.sheet_name)
+            """
+        )
+
+    def _insert_flow_rows(self, source: str) -> int:
+        """Scrive in `mnp_flow_store` le righe di `source` (colonne di `mnp_flow_fact`)."""
+        self._intern_flow_texts(source)
+        return int(
+            self.con.execute(
+                f"""
+                INSERT INTO mnp_flow_store(
+                    file_id,
+                    period_type,
+                    period_date,
+                    donor_operator_id,
+                    recipient_operator_id,
+                    value,
+                    sheet_id,
+                    quality_flag,
+                    donor_raw_id,
+                    recipient_raw_id
+                )
+                SELECT
+                    f.file_id,
+                    CAST(f.period_type AS VARCHAR),
+                    f.period_date,
+                    f.donor_operator_id,
+                    f.recipient_operator_id,
+                    f.value,
+                    s.sheet_id,
+                    CAST(f.quality_flag AS VARCHAR),
+                    d.raw_name_id,
+                    r.raw_name_id
+                FROM {source} f
+                LEFT JOIN sheet_dim s ON s.sheet_name = CAST(f.sheet_name AS VARCHAR)
+                LEFT JOIN raw_name_dim d ON d.raw_name = CAST(f.donor_raw AS VARCHAR)
+                LEFT JOIN raw_name_dim r ON r.raw_name = CAST(f.recipient_raw AS VARCHAR)
+                """
+            ).fetchone()[0]
+        )
+
+    def _stage_frame(self, name: str, df: pd.DataFrame) -> None:
+        """Copia un batch nella tabella temporanea `name` senza `register()`.
+
+        Dentro una transazione la vista registrata resta nel catalogo (e con lei
+        il DataFrame) fino al COMMIT anche dopo `unregister()`: con un file in
+        una sola transazione tutti i batch resterebbero vivi in memoria.
+        """
+        frame = self.con.from_df(df)
+        self.con.execute(f"CREATE OR REPLACE TEMP TABLE {name} AS SELECT * FROM frame")
+
     def insert_flow_dataframe(self, df: pd.DataFrame) -> int:
         if df.empty:
             return 0
-        self.con.register("df_flow", df)
+        self._stage_frame("df_flow", df)
+        self._insert_flow_rows("df_flow")
+        self._refresh_operator_period_agg("SELECT period_type, period_date FROM df_flow")
+        self.con.execute("DROP TABLE IF EXISTS df_flow")
+        self.bump_generation()
+        return int(len(df))
+
+    def upsert_flow_dataframe(self, df: pd.DataFrame) -> int:
+        """Scrive solo le celle nuove o cambiate secondo la chiave naturale.
+
+        Chiave: (period_type, period_date, donor_operator_id, recipient_operator_id).
+        Se il valore corrente della chiave (somma delle righe presenti) coincide
+        con quello in arrivo non si scrive nulla; altrimenti le righe esistenti
+        vengono sostituite da una sola riga del file corrente. Le righe gia
+        scritte dallo stesso file (chiave spezzata su piu batch) vengono sommate.
+
+        Le righe sostituite non vengono conservate: se poi si elimina (o si
+        re-ingestisce con force) il file piu recente, la chiave non torna al
+        valore del file precedente, che va re-ingestito per ripristinarlo.
+        """
+        if df.empty:
+            return 0
+        self._stage_frame("df_flow", df)
         self.con.execute(
             """
-            INSERT INTO mnp_flow_fact(
-                file_id,
-                period_type,
-                period_date,
-                donor_operator_id,
-                recipient_operator_id,
-                value,
-                sheet_name,
-                quality_flag,
-                donor_raw,
-                recipient_raw
-            )
+            CREATE OR REPLACE TEMP TABLE _flow_stage AS
             SELECT
-                file_id,
                 period_type,
                 period_date,
                 donor_operator_id,
                 recipient_operator_id,
-                value,
-                sheet_name,
-                quality_flag,
-                donor_raw,
-                recipient_raw
+                ANY_VALUE(file_id) AS file_id,
+                SUM(value) AS value,
+                MAX(sheet_name) AS sheet_name,
+                MAX(quality_flag) AS quality_flag,
+                MIN(donor_raw) AS donor_raw,
+                MIN(recipient_raw) AS recipient_raw
             FROM df_flow
+            GROUP BY 1, 2, 3, 4
             """
         )
-        self.con.unregister("df_flow")
-        return int(len(df))
+        self.con.execute("DROP TABLE IF EXISTS df_flow")
+        self.con.execute(
+            """
+            CREATE OR REPLACE TEMP TABLE _flow_changed AS
+            WITH current AS (
+                SELECT
+                    f.period_type,
+                    f.period_date,
+                    f.donor_operator_id,
+                    f.recipient_operator_id,
+                    SUM(f.value) FILTER (WHERE f.file_id <> s.file_id) AS other_value,
+                    COUNT(*) FILTER (WHERE f.file_id <> s.file_id) AS other_rows,
+                    SUM(f.value) FILTER (WHERE f.file_id = s.file_id) AS same_value,
+                    COUNT(*) FILTER (WHERE f.file_id = s.file_id) AS same_rows
+                FROM mnp_flow_store f
+                JOIN _flow_stage s
+                  ON s.period_type = f.period_type
+                 AND s.period_date = f.period_date
+                 AND s.donor_operator_id = f.donor_operator_id
+                 AND s.recipient_operator_id = f.recipient_operator_id
+                GROUP BY 1, 2, 3, 4
+            )
+            SELECT
+                s.file_id,
+                s.period_type,
+                s.period_date,
+                s.donor_operator_id,
+                s.recipient_operator_id,
+                s.value + COALESCE(c.same_value, 0) AS value,
+                s.sheet_name,
+                s.quality_flag,
+                s.donor_raw,
+                s.recipient_raw
+            FROM _flow_stage s
+            LEFT JOIN current c
+              ON c.period_type = s.period_type
+             AND c.period_date = s.period_date
+             AND c.donor_operator_id = s.donor_operator_id
+             AND c.recipient_operator_id = s.recipient_operator_id
+            WHERE c.period_type IS NULL
+               OR c.same_rows > 0
+               OR c.other_rows <> 1
+               OR c.other_value <> s.value
+            """
+        )
+        self.con.execute(
+            """
+            DELETE FROM mnp_flow_store f
+            USING _flow_changed c
+            WHERE f.period_type = c.period_type
+              AND f.period_date = c.period_date
+              AND f.donor_operator_id = c.donor_operator_id
+              AND f.recipient_operator_id = c.recipient_operator_id
+            """
+        )
+        written = self._insert_flow_rows("_flow_changed")
+        if written:
+            self._refresh_operator_period_agg("SELECT period_type, period_date FROM _flow_changed")
+            self.bump_generation()
+        self.con.execute("DROP TABLE IF EXISTS _flow_stage; DROP TABLE IF EXISTS _flow_changed")
+        return int(written)
 
     def list_operators(self) -> list[str]:
         rows = self.con.execute("SELECT canonical_name FROM operator_dim ORDER BY 1").fetchall()
@@ -291,6 +1071,23 @@ class DBRepository:
             "created_at": str(row[6]),
         }
 
+    def get_template_by_checksum(self, checksum: str) -> dict[str, Any] | None:
+        """Template dell'ultimo ingest generico riuscito per il checksum, se esiste."""
+        row = self.con.execute(
+            """
+            SELECT e.template_id
+            FROM ingest_file f
+            JOIN excel_ingest_event e ON e.file_id = f.file_id
+            WHERE f.checksum_sha256 = ?
+            ORDER BY e.created_at DESC, e.event_id DESC
+            LIMIT 1
+            """,
+            [checksum],
+        ).fetchone()
+        if not row:
+            return None
+        return self.get_template_by_id(int(row[0]))
+
     def list_templates(self) -> list[dict[str, Any]]:
         rows = self.con.execute(
             """
@@ -350,7 +1147,7 @@ class DBRepository:
         if df.empty:
             return 0
 
-        self.con.register("df_generic", df)
+        self._stage_frame("df_generic", df)
         self.con.execute(
             """
             INSERT INTO excel_row_fact(
@@ -375,9 +1172,160 @@ class DBRepository:
             FROM df_generic
             """
         )
-        self.con.unregister("df_generic")
+        self._merge_excel_row_date_agg("df_generic")
+        self.con.execute("DROP TABLE IF EXISTS df_generic")
+        self.bump_generation()
         return int(len(df))
 
+    def _merge_excel_row_date_agg(self, source: str) -> None:
+        # i conteggi del chunk si sommano a quelli gia presenti per lo stesso file/sheet/data
+        self.con.execute(
+            f"""
+            CREATE OR REPLACE TEMP TABLE _row_date_counts AS
+            SELECT file_id, template_id, sheet_name, CAST(event_date AS DATE) AS event_date, COUNT(*) AS row_count
+            FROM {source}
+            WHERE event_date IS NOT NULL
+            GROUP BY 1, 2, 3, 4
+            """
+        )
+        self.con.execute(
+            """
+            UPDATE excel_row_date_agg a
+            SET row_count = a.row_count + c.row_count
+            FROM _row_date_counts c
+            WHERE a.file_id = c.file_id
+              AND a.template_id = c.template_id
+              AND a.sheet_name = c.sheet_name
+              AND a.event_date = c.event_date
+            """
+        )
+        self.con.execute(
+            """
+            INSERT INTO excel_row_date_agg(file_id, template_id, sheet_name, event_date, row_count)
+            SELECT c.file_id, c.template_id, c.sheet_name, c.event_date, c.row_count
+            FROM _row_date_counts c
+            WHERE NOT EXISTS (
+                SELECT 1 FROM excel_row_date_agg a
+                WHERE a.file_id = c.file_id
+                  AND a.template_id = c.template_id
+                  AND a.sheet_name = c.sheet_name
+                  AND a.event_date = c.event_date
+            )
+            """
+        )
+        self.con.execute("DROP TABLE IF EXISTS _row_date_counts")
+
+    def insert_generic_metric_dataframe(self, df: pd.DataFrame) -> int:
+        """Scrive le metriche tipizzate di righe template.
+
+        Colonne attese: file_id, template_id, sheet_name, row_number,
+        event_date, metric_name, value. I nomi metrica nuovi entrano nel
+        dizionario `excel_metric_dim`.
+        """
+        if df.empty:
+            return 0
+        self._stage_frame("df_metric", df)
+        self._insert_metric_rows("df_metric")
+        self.con.execute("DROP TABLE IF EXISTS df_metric")
+        self.bump_generation()
+        return int(len(df))
+
+    def _insert_metric_rows(self, source: str) -> None:
+        self.con.execute(
+            f"""
+            INSERT INTO excel_metric_dim(metric_id, metric_name)
+            SELECT nextval('seq_metric_id'), n.metric_name
+            FROM (SELECT DISTINCT CAST(metric_name AS VARCHAR) AS metric_name FROM {source}) n
+            WHERE NOT EXISTS (
+                SELECT 1 FROM excel_metric_dim d WHERE d.metric_name = n.metric_name
+            )
+            """
+        )
+        self.con.execute(
+            f"""
+            INSERT INTO excel_metric_fact(file_id, template_id, sheet_name, row_number, event_date, metric_id, value)
+            SELECT s.file_id, s.template_id, s.sheet_name, s.row_number, s.event_date, d.metric_id, s.value
+            FROM {source} s
+            JOIN excel_metric_dim d ON d.metric_name = CAST(s.metric_name AS VARCHAR)
+            """
+        )
+        self._merge_template_metric_catalog(source)
+
+    def _merge_template_metric_catalog(self, source: str) -> None:
+        # le statistiche del chunk si fondono con quelle gia in catalogo (min/max/somma conteggi)
+        self.con.execute(
+            f"""
+            CREATE OR REPLACE TEMP TABLE _metric_stats AS
+            SELECT
+                s.template_id,
+                d.metric_id,
+                d.metric_name,
+                MIN(s.event_date) AS first_date,
+                MAX(s.event_date) AS last_date,
+                COUNT(*) AS row_count,
+                MIN(s.value) AS min_value,
+                MAX(s.value) AS max_value
+            FROM {source} s
+            JOIN excel_metric_dim d ON d.metric_name = CAST(s.metric_name AS VARCHAR)
+            GROUP BY 1, 2, 3
+            """
+        )
+        self.con.execute(
+            """
+            UPDATE template_metric t
+            SET first_date = LEAST(t.first_date, s.first_date),
+                last_date = GREATEST(t.last_date, s.last_date),
+                row_count = t.row_count + s.row_count,
+                min_value = LEAST(t.min_value, s.min_value),
+                max_value = GREATEST(t.max_value, s.max_value),
+                updated_at = CURRENT_TIMESTAMP
+            FROM _metric_stats s
+            WHERE t.template_id = s.template_id
+              AND t.metric_id = s.metric_id
+            """
+        )
+        self.con.execute(
+            """
+            INSERT INTO template_metric(
+                template_id, metric_id, metric_name, first_date, last_date, row_count, min_value, max_value
+            )
+            SELECT s.template_id, s.metric_id, s.metric_name, s.first_date, s.last_date, s.row_count, s.min_value, s.max_value
+            FROM _metric_stats s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM template_metric t
+                WHERE t.template_id = s.template_id AND t.metric_id = s.metric_id
+            )
+            """
+        )
+        self.con.execute("DROP TABLE IF EXISTS _metric_stats")
+
+    def _rebuild_template_metric_catalog(self, template_id: int | None = None) -> None:
+        """Ricalcola il catalogo da excel_metric_fact (dopo delete o per backfill)."""
+        self.con.execute(
+            "DELETE FROM template_metric WHERE (? IS NULL OR template_id = ?)", [template_id, template_id]
+        )
+        self.con.execute(
+            """
+            INSERT INTO template_metric(
+                template_id, metric_id, metric_name, first_date, last_date, row_count, min_value, max_value
+            )
+            SELECT
+                f.template_id,
+                f.metric_id,
+                d.metric_name,
+                MIN(f.event_date),
+                MAX(f.event_date),
+                COUNT(*),
+                MIN(f.value),
+                MAX(f.value)
+            FROM excel_metric_fact f
+            JOIN excel_metric_dim d ON d.metric_id = f.metric_id
+            WHERE (? IS NULL OR f.template_id = ?)
+            GROUP BY 1, 2, 3
+            """,
+            [template_id, template_id],
+        )
+
     def insert_excel_ingest_event(
         self,
         file_id: int,
@@ -398,21 +1346,32 @@ class DBRepository:
 
     def list_template_metrics(self, template_id: int) -> list[str]:
         rows = self.con.execute(
-            "SELECT metrics_json FROM excel_row_fact WHERE template_id = ? LIMIT 1000",
+            "SELECT metric_name FROM template_metric WHERE template_id = ? ORDER BY metric_name",
             [template_id],
         ).fetchall()
-        metrics: set[str] = set()
-        for row in rows:
-            raw = row[0]
-            if not raw:
-                continue
-            try:
-                payload = json.loads(raw)
-            except Exception:
-                continue
-            for key in payload.keys():
-                metrics.add(str(key))
-        return sorted(metrics)
+        return [row[0] for row in rows]
+
+    def list_template_metric_stats(self, template_id: int) -> list[dict[str, Any]]:
+        rows = self.con.execute(
+            """
+            SELECT metric_name, first_date, last_date, row_count, min_value, max_value
+            FROM template_metric
+            WHERE template_id = ?
+            ORDER BY metric_name
+            """,
+            [template_id],
+        ).fetchall()
+        return [
+            {
+                "metric": row[0],
+                "first_date": str(row[1]) if row[1] is not None else None,
+                "last_date": str(row[2]) if row[2] is not None else None,
+                "row_count": int(row[3]),
+                "min_value": row[4],
+                "max_value": row[5],
+            }
+            for row in rows
+        ]
 
     def query_template_trend(
         self,
@@ -422,31 +1381,37 @@ class DBRepository:
         start_date: str | None = None,
         end_date: str | None = None,
     ) -> pd.DataFrame:
+        # righe per data dalla tabella pre-aggregata, valori dalla tabella metriche tipizzata:
+        # nessuna scansione di excel_row_fact ne parsing JSON a query time
         query = """
+        WITH row_counts AS (
+            SELECT event_date, SUM(row_count) AS rows_included
+            FROM excel_row_date_agg
+            WHERE template_id = ?
+              AND (? IS NULL OR sheet_name = ?)
+              AND (? IS NULL OR event_date >= ?)
+              AND (? IS NULL OR event_date <= ?)
+            GROUP BY event_date
+        ),
+        metric_values AS (
+            SELECT f.event_date, SUM(f.value) AS metric_value
+            FROM excel_metric_fact f
+            JOIN excel_metric_dim d ON d.metric_id = f.metric_id
+            WHERE f.template_id = ?
+              AND d.metric_name = ?
+              AND f.event_date IS NOT NULL
+              AND (? IS NULL OR f.sheet_name = ?)
+              AND (? IS NULL OR f.event_date >= ?)
+              AND (? IS NULL OR f.event_date <= ?)
+            GROUP BY f.event_date
+        )
         SELECT
-            event_date,
-            SUM(COALESCE(CAST(json_extract_string(metrics_json, ?) AS DOUBLE), 0)) AS metric_value,
-            COUNT(*) AS rows_included
-        FROM excel_row_fact
-        WHERE template_id = ?
-          AND event_date IS NOT NULL
-          AND (? IS NULL OR sheet_name = ?)
-          AND (? IS NULL OR event_date >= ?)
-          AND (? IS NULL OR event_date <= ?)
-        GROUP BY event_date
-        ORDER BY event_date
+            r.event_date,
+            COALESCE(m.metric_value, 0) AS metric_value,
+            r.rows_included
+        FROM row_counts r
+        LEFT JOIN metric_values m ON m.event_date = r.event_date
+        ORDER BY r.event_date
         """
-        json_path = f"$.{metric_name}"
-        return self.query_df(
-            query,
-            [
-                json_path,
-                template_id,
-                sheet_name,
-                sheet_name,
-                start_date,
-                start_date,
-                end_date,
-                end_date,
-            ],
-        )
+        filters = [sheet_name, sheet_name, start_date, start_date, end_date, end_date]
+        return self.query_df(query, [template_id, *filters, template_id, metric_name, *filters])
@@ -14,6 +14,7 @@ import openpyxl
 import pandas as pd
 
 from mnp_cdx.db.repository import DBRepository
+from mnp_cdx.hashing import sha256_file
 
 
 DATE_HINT_PATTERN = re.compile(r"(20\d{2})(\d{2})(\d{2})")
@@ -49,11 +50,7 @@ class GenericTemplateEngine:
 
     @staticmethod
     def checksum(file_path: str | Path) -> str:
-        sha = hashlib.sha256()
-        with open(file_path, "rb") as fh:
-            for chunk in iter(lambda: fh.read(4096), b""):
-                sha.update(chunk)
-        return sha.hexdigest()
+        return sha256_file(file_path)
 
     @staticmethod
     def _file_date_hint(file_path: str | Path) -> date | None:
@@ -330,81 +327,87 @@ class GenericTemplateEngine:
         template_id: int | None = None,
         template_name: str | None = None,
         force: bool = False,
+        checksum: str | None = None,
     ) -> GenericIngestResult:
         file_path = Path(file_path)
         self._validate_workbook_path(file_path)
-        checksum = self.checksum(file_path)
-
-        if self.repo.file_exists(checksum):
-            if not force:
-                # se file duplicato, serve almeno template info per response
-                analysis = self.analyze(file_path)
-                matched = analysis.matched_template
-                if matched is None:
-                    matched, _ = self.repo.create_or_reuse_template(
-                        signature=analysis.workbook_signature,
-                        schema=analysis.schema,
-                        template_name=template_name,
+        # `checksum` evita di rihashare file gia hashati dal chiamante (es. upload API)
+        checksum = checksum or self.checksum(file_path)
+
+        with self.repo.transaction():
+            if self.repo.file_exists(checksum):
+                if not force:
+                    # se file duplicato, serve almeno template info per response:
+                    # prima dall'evento di ingest gia registrato, altrimenti analizzando il workbook
+                    matched = self.repo.get_template_by_checksum(checksum)
+                    if matched is None:
+                        analysis = self.analyze(file_path)
+                        matched = analysis.matched_template
+                    if matched is None:
+                        matched, _ = self.repo.create_or_reuse_template(
+                            signature=analysis.workbook_signature,
+                            schema=analysis.schema,
+                            template_name=template_name,
+                        )
+
+                    return GenericIngestResult(
+                        file_id=None,
+                        filename=file_path.name,
+                        checksum=checksum,
+                        template_id=int(matched["template_id"]),
+                        template_name=str(matched["template_name"]),
+                        template_version=int(matched["template_version"]),
+                        created_new_template=False,
+                        inserted_rows=0,
+                        skipped_duplicate=True,
+                        warnings=["File gia ingestito (checksum duplicate)"] ,
                     )
+                self.repo.delete_file_everywhere_by_checksum(checksum)
 
-                return GenericIngestResult(
-                    file_id=None,
-                    filename=file_path.name,
-                    checksum=checksum,
-                    template_id=int(matched["template_id"]),
-                    template_name=str(matched["template_name"]),
-                    template_version=int(matched["template_version"]),
-                    created_new_template=False,
-                    inserted_rows=0,
-                    skipped_duplicate=True,
-                    warnings=["File gia ingestito (checksum duplicate)"] ,
+            analysis = self.analyze(file_path)
+
+            if template_id is not None:
+                template = self.repo.get_template_by_id(template_id)
+                if template is None:
+                    raise ValueError(f"Template id non trovato: {template_id}")
+                created_new_template = False
+            else:
+                template, created_new_template = self.repo.create_or_reuse_template(
+                    signature=analysis.workbook_signature,
+                    schema=analysis.schema,
+                    template_name=template_name,
                 )
-            self.repo.delete_file_everywhere_by_checksum(checksum)
-
-        analysis = self.analyze(file_path)
-
-        if template_id is not None:
-            template = self.repo.get_template_by_id(template_id)
-            if template is None:
-                raise ValueError(f"Template id non trovato: {template_id}")
-            created_new_template = False
-        else:
-            template, created_new_template = self.repo.create_or_reuse_template(
-                signature=analysis.workbook_signature,
-                schema=analysis.schema,
-                template_name=template_name,
-            )
 
-        file_id = self.repo.insert_ingest_file(
-            filename=file_path.name,
-            checksum=checksum,
-            parser_version="generic-template-1.0",
-        )
+            file_id = self.repo.insert_ingest_file(
+                filename=file_path.name,
+                checksum=checksum,
+                parser_version="generic-template-1.0",
+            )
 
-        template_schema = template["schema"]
-        rows_inserted, warnings = self._materialize_rows(file_path, file_id, int(template["template_id"]), template_schema)
+            template_schema = template["schema"]
+            rows_inserted, warnings = self._materialize_rows(file_path, file_id, int(template["template_id"]), template_schema)
 
-        self.repo.update_ingest_status(file_id, "OK", rows_inserted)
-        self.repo.insert_excel_ingest_event(
-            file_id=file_id,
-            template_id=int(template["template_id"]),
-            status="OK",
-            row_count=rows_inserted,
-            notes="; ".join(warnings) if warnings else None,
-        )
+            self.repo.update_ingest_status(file_id, "OK", rows_inserted)
+            self.repo.insert_excel_ingest_event(
+                file_id=file_id,
+                template_id=int(template["template_id"]),
+                status="OK",
+                row_count=rows_inserted,
+                notes="; ".join(warnings) if warnings else None,
+            )
 
-        return GenericIngestResult(
-            file_id=file_id,
-            filename=file_path.name,
-            checksum=checksum,
-            template_id=int(template["template_id"]),
-            template_name=str(template["template_name"]),
-            template_version=int(template["template_version"]),
-            created_new_template=created_new_template,
-            inserted_rows=rows_inserted,
-            skipped_duplicate=False,
-            warnings=warnings,
-        )
+            return GenericIngestResult(
+                file_id=file_id,
+                filename=file_path.name,
+                checksum=checksum,
+                template_id=int(template["template_id"]),
+                template_name=str(template["template_name"]),
+                template_version=int(template["template_version"]),
+                created_new_template=created_new_template,
+                inserted_rows=rows_inserted,
+                skipped_duplicate=False,
+                warnings=warnings,
+            )
 
     def _materialize_rows(
         self,
@@ -418,6 +421,7 @@ class GenericTemplateEngine:
         file_date_hint = self._file_date_hint(file_path)
 
         chunk: list[dict[str, Any]] = []
+        metric_chunk: list[dict[str, Any]] = []
         inserted_total = 0
 
         for sheet_cfg in template_schema.get("sheets", []):
@@ -487,17 +491,35 @@ class GenericTemplateEngine:
                         "raw_json": json.dumps(row_map, ensure_ascii=False),
                     }
                 )
+                metric_chunk.extend(
+                    {
+                        "file_id": file_id,
+                        "template_id": template_id,
+                        "sheet_name": sheet_name,
+                        "row_number": row_number,
+                        "event_date": event_date,
+                        "metric_name": key,
+                        "value": num,
+                    }
+                    for key, num in metrics.items()
+                )
 
                 if len(chunk) >= 5000:
-                    inserted_total += self.repo.insert_generic_row_dataframe(pd.DataFrame(chunk))
-                    chunk = []
+                    inserted_total += self._flush_rows(chunk, metric_chunk)
+                    chunk, metric_chunk = [], []
 
         if chunk:
-            inserted_total += self.repo.insert_generic_row_dataframe(pd.DataFrame(chunk))
+            inserted_total += self._flush_rows(chunk, metric_chunk)
 
         wb.close()
         return inserted_total, warnings
 
+    def _flush_rows(self, chunk: list[dict[str, Any]], metric_chunk: list[dict[str, Any]]) -> int:
+        inserted = self.repo.insert_generic_row_dataframe(pd.DataFrame(chunk))
+        if metric_chunk:
+            self.repo.insert_generic_metric_dataframe(pd.DataFrame(metric_chunk))
+        return inserted
+
     @staticmethod
     def _normalize_scalar(value: Any) -> Any:
         if value is None:
@@ -0,0 +1,31 @@
+"""File hashing helpers shared by the ingestion engines."""
+
+from __future__ import annotations
+
+from pathlib import Path
+import hashlib
+import mmap
+
+# letture grandi: su file da decine di MB il costo e' dominato da SHA-256, non dalle syscall
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def sha256_file(file_path: str | Path, chunk_size: int = CHUNK_SIZE) -> str:
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as fh:
+        try:
+            mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # file vuoti o non mappabili (pipe, fs particolari): lettura bufferizzata
+            for chunk in iter(lambda: fh.read(chunk_size), b""):
+                sha.update(chunk)
+            return sha.hexdigest()
+
+        with mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, len(view), chunk_size):
+                    sha.update(view[offset : offset + chunk_size])
+            finally:
+                view.release()
+    return sha.hexdigest()
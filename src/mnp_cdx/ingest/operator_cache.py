@@ -0,0 +1,54 @@
+"""In-memory operator identity cache for bulk ingestion."""
+
+from __future__ import annotations
+
+from typing import Iterable
+
+from mnp_cdx.db.repository import DBRepository
+from mnp_cdx.ingest.operator_mapping import OperatorMapper
+
+
+class OperatorCache:
+    """Risolve nomi operatore raw in `operator_id` senza round-trip per riga.
+
+    I nomi raw distinti non ancora visti vengono risolti in blocco con una join
+    su `operator_alias` (popolata dal mapper al primo uso se vuota); solo i
+    nomi senza alias passano dal match fuzzy del mapper. I match sotto soglia
+    restano UNMAPPED e finiscono nel report `operator_unmapped_name`.
+    """
+
+    def __init__(self, repo: DBRepository, mapper: OperatorMapper) -> None:
+        self.repo = repo
+        self.mapper = mapper
+        self._aliases_ready = False
+        self._raw_ids: dict[str, int] = {}
+
+    def invalidate(self) -> None:
+        self._aliases_ready = False
+        self._raw_ids.clear()
+
+    def resolve_many(self, raw_names: Iterable[str]) -> list[int]:
+        names = list(raw_names)
+        missing = [name for name in dict.fromkeys(names) if name not in self._raw_ids]
+        if missing:
+            self._resolve_missing(missing)
+        return [self._raw_ids[name] for name in names]
+
+    def _resolve_missing(self, raw_names: list[str]) -> None:
+        if not self._aliases_ready:
+            if not self.repo.has_operator_aliases():
+                self.repo.replace_operator_aliases(self.mapper.alias_rows())
+            self._aliases_ready = True
+        self._raw_ids.update(self.repo.resolve_raw_operators(raw_names, fallback=self.resolve_unmatched))
+
+    def resolve_unmatched(self, raw_names: list[str]) -> list[tuple[str, str, str | None, str | None]]:
+        """Fallback per `DBRepository`: match fuzzy dei nomi senza alias esatto."""
+        rows = []
+        unmapped = []
+        for name in raw_names:
+            info = self.mapper.resolve(name)
+            rows.append((name, info.canonical_name, info.group_name, info.op_type))
+            if info.unmapped:
+                unmapped.append((name, info.canonical_name, info.suggestion, info.confidence))
+        self.repo.record_unmapped_operators(unmapped)
+        return rows
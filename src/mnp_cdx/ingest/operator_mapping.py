@@ -2,35 +2,86 @@
 
 from __future__ import annotations
 
+from collections import Counter, OrderedDict
 from dataclasses import dataclass
+from difflib import SequenceMatcher
 from pathlib import Path
+import re
+import threading
 
 import yaml
 
 
+FUZZY_THRESHOLD = 0.88
+MEMO_SIZE = 4096
+# candidati per trigrammi condivisi valutati con edit distance
+FUZZY_CANDIDATES = 8
+
+
 def _normalize_name(name: str | None) -> str:
     if not name:
         return ""
     return str(name).upper().strip().replace("-", " ").replace("  ", " ")
 
 
+def _compact(normalized: str) -> str:
+    # spazi e punteggiatura non distinguono gli operatori ("HO.MOBILE" == "HO MOBILE")
+    return re.sub(r"[^0-9A-Z]", "", normalized)
+
+
+def _trigrams(compact: str) -> set[str]:
+    padded = f"  {compact} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
 @dataclass
 class OperatorInfo:
     canonical_name: str
     group_name: str | None
     op_type: str | None
+    # 1.0 per alias esatti; per match fuzzy la similarita; per UNMAPPED quella del miglior candidato
+    confidence: float = 1.0
+    # UNMAPPED: canonico del candidato fuzzy scartato perche sotto soglia
+    suggestion: str | None = None
+
+    @property
+    def unmapped(self) -> bool:
+        return self.group_name == "UNMAPPED"
 
 
 class OperatorMapper:
-    def __init__(self, mapping_path: Path) -> None:
+    def __init__(
+        self,
+        mapping_path: Path,
+        fuzzy_threshold: float = FUZZY_THRESHOLD,
+        memo_size: int = MEMO_SIZE,
+    ) -> None:
         self.mapping_path = Path(mapping_path)
+        self.fuzzy_threshold = fuzzy_threshold
+        self.memo_size = memo_size
         self.alias_map: dict[str, OperatorInfo] = {}
+        self._compact_map: dict[str, OperatorInfo] = {}
+        self._trigram_index: dict[str, list[str]] = {}
+        self._memo: OrderedDict[str, OperatorInfo] = OrderedDict()
+        self._memo_lock = threading.Lock()
+        self._load()
+
+    def reload(self) -> None:
+        """Rilegge il file YAML; la mappa corrente resta valida se la lettura fallisce."""
         self._load()
 
+    def alias_rows(self) -> list[tuple[str, str, str | None, str | None]]:
+        """Righe (alias normalizzato, canonical_name, group_name, type) per `operator_alias`."""
+        return [
+            (alias, info.canonical_name, info.group_name, info.op_type)
+            for alias, info in self.alias_map.items()
+        ]
+
     def _load(self) -> None:
         with self.mapping_path.open("r", encoding="utf-8") as fh:
             payload = yaml.safe_load(fh) or {}
 
+        alias_map: dict[str, OperatorInfo] = {}
         for op in payload.get("operators", []):
             info = OperatorInfo(
                 canonical_name=op["canonical_name"],
@@ -39,22 +90,78 @@ class OperatorMapper:
             )
             aliases = op.get("aliases", []) + [op["canonical_name"]]
             for alias in aliases:
-                self.alias_map[_normalize_name(alias)] = info
+                alias_map[_normalize_name(alias)] = info
+
+        compact_map = {_compact(alias): info for alias, info in alias_map.items() if _compact(alias)}
+        trigram_index: dict[str, list[str]] = {}
+        for compact in compact_map:
+            for gram in _trigrams(compact):
+                trigram_index.setdefault(gram, []).append(compact)
+
+        with self._memo_lock:
+            self.alias_map = alias_map
+            self._compact_map = compact_map
+            self._trigram_index = trigram_index
+            self._memo.clear()
 
     def resolve(self, raw_name: str) -> OperatorInfo:
         normalized = _normalize_name(raw_name)
+        with self._memo_lock:
+            info = self._memo.get(normalized)
+            if info is not None:
+                self._memo.move_to_end(normalized)
+                return info
+
+        info = self._resolve_normalized(normalized)
+        with self._memo_lock:
+            self._memo[normalized] = info
+            if len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return info
+
+    def _resolve_normalized(self, normalized: str) -> OperatorInfo:
         if normalized in self.alias_map:
             return self.alias_map[normalized]
 
         # fallback for combined names where left side is known
-        if "+" in normalized:
-            left = normalized.split("+", 1)[0].strip()
-            if left in self.alias_map:
-                return self.alias_map[left]
+        left = normalized.split("+", 1)[0].strip() if "+" in normalized else None
+        if left and left in self.alias_map:
+            return self.alias_map[left]
+
+        # match approssimato: sul nome intero e, per "X + MVNO", sul lato sinistro
+        best: tuple[float, OperatorInfo] | None = None
+        for candidate in filter(None, (normalized, left)):
+            match = self._fuzzy_match(candidate)
+            if match is not None and (best is None or match[0] > best[0]):
+                best = match
+
+        if best is not None and best[0] >= self.fuzzy_threshold:
+            score, info = best
+            return OperatorInfo(info.canonical_name, info.group_name, info.op_type, confidence=round(score, 4))
 
         # fallback unknown
         return OperatorInfo(
             canonical_name=normalized or "UNKNOWN",
             group_name="UNMAPPED",
             op_type="UNKNOWN",
+            confidence=round(best[0], 4) if best else 0.0,
+            suggestion=best[1].canonical_name if best else None,
         )
+
+    def _fuzzy_match(self, normalized: str) -> tuple[float, OperatorInfo] | None:
+        """Miglior alias per similarita: indice a trigrammi, poi edit distance sui soli candidati."""
+        compact = _compact(normalized)
+        if not compact:
+            return None
+        if compact in self._compact_map:
+            return 1.0, self._compact_map[compact]
+
+        shared: Counter[str] = Counter()
+        for gram in _trigrams(compact):
+            shared.update(self._trigram_index.get(gram, ()))
+        best: tuple[float, OperatorInfo] | None = None
+        for alias, _ in shared.most_common(FUZZY_CANDIDATES):
+            score = SequenceMatcher(None, compact, alias).ratio()
+            if best is None or score > best[0]:
+                best = (score, self._compact_map[alias])
+        return best
@@ -0,0 +1,137 @@
+"""Parallel directory ingestion: parse in a process pool, write from one process."""
+
+from __future__ import annotations
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+import multiprocessing
+import time
+
+from mnp_cdx.ingest.parser import MNPParser, ParsedWorkbook
+from mnp_cdx.ingest.service import IngestionService, IngestResult
+
+
+@dataclass
+class DirectoryIngestReport:
+    results: list[IngestResult] = field(default_factory=list)
+    failures: list[tuple[str, str]] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+    @property
+    def files_processed(self) -> int:
+        return len(self.results) + len(self.failures)
+
+    @property
+    def inserted_records(self) -> int:
+        return sum(r.inserted_records for r in self.results)
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files_processed / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.inserted_records / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+
+def _parse_worker(
+    file_path: str,
+    checksum: str,
+    include_self_flows: bool,
+    engine: str,
+    batch_size: int,
+) -> ParsedWorkbook:
+    parser = MNPParser(include_self_flows=include_self_flows, engine=engine)
+    return parser.parse_batches(file_path, Path(file_path).name, batch_size=batch_size, checksum=checksum)
+
+
+def ingest_directory(
+    service: IngestionService,
+    directory: str | Path,
+    pattern: str = "*.xlsx",
+    workers: int | None = None,
+    force: bool = False,
+    incremental: bool = False,
+    on_result: Callable[[IngestResult], None] | None = None,
+) -> DirectoryIngestReport:
+    """Ingestisce tutti i workbook di una cartella.
+
+    Il parsing avviene in un pool di processi che restituiscono batch
+    colonnari; tutte le scritture passano dal processo chiamante, quindi
+    DuckDB continua ad avere un solo writer. I file sono scritti in ordine
+    di nome, indipendentemente dall'ordine di completamento dei worker e
+    dalla parse cache: in modalita `incremental` l'ultimo export in ordine di
+    nome vince (vedi `DBRepository.upsert_flow_dataframe` per le righe sostituite).
+    """
+    files = sorted(p for p in Path(directory).glob(pattern) if p.is_file())
+    report = DirectoryIngestReport()
+    started = time.perf_counter()
+
+    def _record(result: IngestResult) -> None:
+        report.results.append(result)
+        if on_result is not None:
+            on_result(result)
+
+    # checksum-first nel writer: i duplicati noti e le voci gia in parse cache
+    # non arrivano al pool; ogni voce resta nella posizione del suo nome file
+    entries: list[tuple[Path, IngestResult | ParsedWorkbook | Future[ParsedWorkbook] | None]] = []
+    to_parse: list[tuple[int, str]] = []
+    for path in files:
+        checksum = service.parser.checksum(path)
+        duplicate = None if force else service.check_duplicate(path.name, checksum)
+        if duplicate is not None:
+            entries.append((path, duplicate))
+            continue
+        cached = service.cached_parse(path.name, checksum)
+        if cached is None:
+            to_parse.append((len(entries), checksum))
+        entries.append((path, cached))
+
+    # spawn: i worker non ereditano la connessione DuckDB del processo writer
+    pool = (
+        ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        if to_parse
+        else None
+    )
+    try:
+        for index, checksum in to_parse:
+            path = entries[index][0]
+            entries[index] = (
+                path,
+                pool.submit(
+                    _parse_worker,
+                    str(path),
+                    checksum,
+                    service.parser.include_self_flows,
+                    service.parser.engine,
+                    service.chunk_size,
+                ),
+            )
+
+        # un solo ciclo in ordine di nome: parse cache e pool non alterano l'ordine delle scritture
+        for path, entry in entries:
+            if isinstance(entry, IngestResult):
+                _record(entry)
+                continue
+            if isinstance(entry, Future):
+                try:
+                    entry = entry.result()
+                except Exception as exc:
+                    report.failures.append((path.name, str(exc)))
+                    continue
+                service.store_parse(entry)
+            try:
+                result = service.ingest_parsed(entry, force=force, incremental=incremental)
+            except Exception as exc:
+                # la transazione del file e gia stata annullata: si prosegue con i successivi
+                report.failures.append((path.name, str(exc)))
+                continue
+            _record(result)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    report.elapsed_seconds = time.perf_counter() - started
+    return report
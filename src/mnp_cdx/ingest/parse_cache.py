@@ -0,0 +1,142 @@
+"""On-disk cache of columnar parser output keyed by checksum and parser version."""
+
+from __future__ import annotations
+
+from dataclasses import asdict
+from pathlib import Path
+import json
+import os
+import re
+import tempfile
+
+import numpy as np
+
+from mnp_cdx.ingest.columnar import FlowBatch
+from mnp_cdx.ingest.parser import ParsedWorkbook, ParseSummary
+
+
+_UNSAFE_KEY_CHARS = re.compile(r"[^A-Za-z0-9._+-]")
+
+
+class ParseCache:
+    """Cache LRU su disco dell'output del parser (un file `.npz` per workbook).
+
+    Ogni voce contiene le colonne dei `FlowBatch` concatenate piu un blocco
+    JSON con summary e dizionari operatore. L'ordine LRU usa l'mtime dei file
+    (aggiornato a ogni hit); oltre `max_bytes` le voci piu vecchie sono rimosse.
+    """
+
+    SUFFIX = ".npz"
+
+    def __init__(self, root: str | Path, max_bytes: int = 512 * 1024 * 1024) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def _path(self, checksum: str, parser_version: str) -> Path:
+        version = _UNSAFE_KEY_CHARS.sub("_", parser_version)
+        return self.root / f"{checksum}__{version}{self.SUFFIX}"
+
+    def get(self, checksum: str, parser_version: str, filename: str | None = None) -> ParsedWorkbook | None:
+        path = self._path(checksum, parser_version)
+        try:
+            with np.load(path, allow_pickle=False) as payload:
+                parsed = self._decode(payload)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError):
+            # voce corrotta o scritta da una versione incompatibile: si riparsa
+            path.unlink(missing_ok=True)
+            return None
+
+        os.utime(path)
+        if filename is not None:
+            # stesso contenuto caricato con un altro nome file
+            parsed.summary.filename = filename
+            for batch in parsed.batches:
+                batch.file_id = filename
+        return parsed
+
+    def put(self, checksum: str, parser_version: str, parsed: ParsedWorkbook) -> None:
+        path = self._path(checksum, parser_version)
+        fd, tmp_name = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                np.savez(fh, **self._encode(parsed))
+            os.replace(tmp_name, path)
+        finally:
+            Path(tmp_name).unlink(missing_ok=True)
+        self._evict(keep=path)
+
+    def size_bytes(self) -> int:
+        return sum(p.stat().st_size for p in self.root.glob(f"*{self.SUFFIX}"))
+
+    def _evict(self, keep: Path) -> None:
+        entries = sorted(self.root.glob(f"*{self.SUFFIX}"), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in entries)
+        for entry in entries:
+            if total <= self.max_bytes:
+                return
+            if entry == keep:
+                continue
+            total -= entry.stat().st_size
+            entry.unlink(missing_ok=True)
+        if total > self.max_bytes:
+            # una singola voce piu grande del budget non viene conservata
+            keep.unlink(missing_ok=True)
+
+    @staticmethod
+    def _encode(parsed: ParsedWorkbook) -> dict[str, np.ndarray]:
+        batches = parsed.batches
+        meta = {
+            "summary": asdict(parsed.summary),
+            "batches": [
+                {
+                    "file_id": b.file_id,
+                    "period_type": b.period_type,
+                    "sheet_name": b.sheet_name,
+                    "operators": b.operators,
+                    "length": len(b),
+                }
+                for b in batches
+            ],
+        }
+
+        def _concat(attr: str, dtype: type) -> np.ndarray:
+            if not batches:
+                return np.empty(0, dtype=dtype)
+            return np.concatenate([getattr(b, attr) for b in batches]).astype(dtype, copy=False)
+
+        return {
+            "meta": np.array(json.dumps(meta, ensure_ascii=False)),
+            "donor_codes": _concat("donor_codes", np.int32),
+            "recipient_codes": _concat("recipient_codes", np.int32),
+            "day_offsets": _concat("day_offsets", np.int32),
+            "values": _concat("values", np.float64),
+            "imputed": _concat("imputed", np.bool_),
+        }
+
+    @staticmethod
+    def _decode(payload: np.lib.npyio.NpzFile) -> ParsedWorkbook:
+        meta = json.loads(str(payload["meta"]))
+        columns = {
+            key: payload[key]
+            for key in ("donor_codes", "recipient_codes", "day_offsets", "values", "imputed")
+        }
+
+        batches: list[FlowBatch] = []
+        offset = 0
+        for info in meta["batches"]:
+            end = offset + int(info["length"])
+            batches.append(
+                FlowBatch(
+                    file_id=info["file_id"],
+                    period_type=info["period_type"],
+                    sheet_name=info["sheet_name"],
+                    operators=list(info["operators"]),
+                    **{key: values[offset:end] for key, values in columns.items()},
+                )
+            )
+            offset = end
+
+        return ParsedWorkbook(summary=ParseSummary(**meta["summary"]), batches=batches)
@@ -6,10 +6,21 @@ from dataclasses import dataclass
 from datetime import date, datetime
 from pathlib import Path
 import hashlib
+import io
+import itertools
 import re
-from typing import Optional
+from typing import BinaryIO, Iterable, Iterator, Optional
 
 import openpyxl
+from openpyxl.workbook.workbook import Workbook
+
+from mnp_cdx.hashing import sha256_file
+from mnp_cdx.ingest.columnar import FlowBatch, FlowBatchBuilder
+from mnp_cdx.ingest.xlsx_stream import XlsxStreamReader
+
+
+# (period_type, period_date, donor_raw, recipient_raw, value, imputed)
+FlowCell = tuple[str, date, str, str, float, bool]
 
 
 @dataclass
@@ -21,7 +32,21 @@ class ParseSummary:
     warnings: list[str]
 
 
+@dataclass
+class ParsedWorkbook:
+    """Output completo del parser in forma colonnare, serializzabile tra processi."""
+
+    summary: ParseSummary
+    batches: list[FlowBatch]
+
+
 class MNPParser:
+    SHEETS = {
+        "MONTHLY": "Monthly details",
+        "DAILY": "Daily details",
+    }
+    HEADER_PEEK_ROWS = 12
+
     MONTH_ALIASES = {
         "JAN": 1,
         "FEB": 2,
@@ -45,122 +70,203 @@ class MNPParser:
         "DIC": 12,
     }
 
-    def __init__(self, include_self_flows: bool = False) -> None:
+    ENGINES = ("openpyxl", "xml")
+
+    def __init__(self, include_self_flows: bool = False, engine: str = "openpyxl") -> None:
+        if engine not in self.ENGINES:
+            raise ValueError(f"Engine parser non supportato: '{engine}' (usa uno tra {', '.join(self.ENGINES)})")
         self.include_self_flows = include_self_flows
+        self.engine = engine
 
     @staticmethod
     def checksum(file_path: str | Path) -> str:
-        sha = hashlib.sha256()
-        with open(file_path, "rb") as fh:
-            for chunk in iter(lambda: fh.read(4096), b""):
-                sha.update(chunk)
-        return sha.hexdigest()
+        return sha256_file(file_path)
+
+    def _load_workbook(self, source: str | Path | BinaryIO) -> Workbook | XlsxStreamReader:
+        if self.engine == "xml":
+            return XlsxStreamReader(source)
+        return openpyxl.load_workbook(source, read_only=True, data_only=True)
 
     def parse(self, file_path: str | Path, file_id: str) -> tuple[list[dict], ParseSummary]:
-        file_path = str(file_path)
-        monthly, monthly_warnings = self.parse_monthly(file_path, file_id)
-        daily, daily_warnings = self.parse_daily(file_path, file_id)
-        all_warnings = monthly_warnings + daily_warnings
-        summary = ParseSummary(
-            filename=Path(file_path).name,
-            checksum=self.checksum(file_path),
-            monthly_records=len(monthly),
-            daily_records=len(daily),
-            warnings=all_warnings,
-        )
-        return monthly + daily, summary
+        records, summary = self.stream(file_path, file_id)
+        rows = list(records)
+        return rows, summary
+
+    def stream(
+        self,
+        file_path: str | Path,
+        file_id: str,
+        checksum: str | None = None,
+    ) -> tuple[Iterator[dict], ParseSummary]:
+        """Restituisce un generatore lazy dei record e il summary che lo accompagna.
+
+        Checksum e filename sono disponibili subito; conteggi e warning del
+        summary sono completi solo dopo aver consumato il generatore. Se il
+        checksum e' gia noto al chiamante il file non viene riletto per hasharlo.
+        """
+        cells, summary = self._open_cells(file_path, checksum)
+        records = (self._to_record(cell, file_id) for cell in cells)
+        return records, summary
+
+    def stream_batches(
+        self,
+        file_path: str | Path,
+        file_id: str,
+        batch_size: int = 50_000,
+        checksum: str | None = None,
+    ) -> tuple[Iterator[FlowBatch], ParseSummary]:
+        """Come `stream`, ma emette batch colonnari (un batch non attraversa mai due sheet)."""
+        cells, summary = self._open_cells(file_path, checksum)
+        return self._iter_batches(cells, file_id, batch_size), summary
+
+    def parse_batches(
+        self,
+        file_path: str | Path,
+        file_id: str,
+        batch_size: int = 50_000,
+        checksum: str | None = None,
+    ) -> ParsedWorkbook:
+        batches, summary = self.stream_batches(file_path, file_id, batch_size, checksum=checksum)
+        return ParsedWorkbook(summary=summary, batches=list(batches))
+
+    def iter_records(self, file_path: str | Path, file_id: str) -> Iterator[dict]:
+        records, _ = self.stream(file_path, file_id)
+        return records
+
+    def iter_batches(self, file_path: str | Path, file_id: str, batch_size: int = 50_000) -> Iterator[FlowBatch]:
+        batches, _ = self.stream_batches(file_path, file_id, batch_size)
+        return batches
 
     def parse_monthly(self, file_path: str, file_id: str) -> tuple[list[dict], list[str]]:
-        warnings: list[str] = []
-        wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
-        if "Monthly details" not in wb.sheetnames:
-            wb.close()
-            return [], ["Sheet 'Monthly details' non trovato"]
-
-        ws = wb["Monthly details"]
-        rows = list(ws.iter_rows(values_only=True))
-        if len(rows) < 6:
-            wb.close()
-            return [], ["Sheet monthly troppo corto"]
-
-        header_idx = self._detect_monthly_header_row(rows)
-        date_map = self._map_monthly_columns(rows[header_idx])
-        if not date_map:
-            warnings.append("Nessuna colonna periodo monthly rilevata")
-
-        # col 3 recipient / col 4 donor (0-based)
-        recipient_col = 3
-        donor_col = 4
-        current_recipient = None
-        data: list[dict] = []
-
-        for row in rows[header_idx + 1 :]:
-            if len(row) <= donor_col:
-                continue
-
-            recipient_val = row[recipient_col] if recipient_col < len(row) else None
-            donor_val = row[donor_col] if donor_col < len(row) else None
-
-            if recipient_val:
-                candidate = str(recipient_val).strip()
-                if self._looks_like_operator(candidate):
-                    current_recipient = candidate
-                    continue
-
-            if donor_val and current_recipient:
-                donor = str(donor_val).strip()
-                if not self._looks_like_operator(donor):
-                    continue
-                if (not self.include_self_flows) and donor.upper() == current_recipient.upper():
-                    continue
-
-                for col_idx, period_date in date_map.items():
-                    if col_idx >= len(row):
-                        continue
-                    cleaned = self._clean_value(row[col_idx])
-                    if cleaned is None:
-                        continue
-                    data.append(
-                        {
-                            "file_id": file_id,
-                            "period_type": "MONTHLY",
-                            "period_date": period_date,
-                            "donor_raw": donor,
-                            "recipient_raw": current_recipient,
-                            "value": cleaned,
-                            "sheet_name": "Monthly details",
-                            "quality_flag": "IMPUTED" if cleaned == 0 and str(row[col_idx]).strip() in {"-", ""} else "OK",
-                        }
-                    )
-
-        wb.close()
-        return data, warnings
+        return self._parse_single_sheet(file_path, file_id, "MONTHLY")
 
     def parse_daily(self, file_path: str, file_id: str) -> tuple[list[dict], list[str]]:
-        warnings: list[str] = []
-        wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
-        if "Daily details" not in wb.sheetnames:
+        return self._parse_single_sheet(file_path, file_id, "DAILY")
+
+    def _parse_single_sheet(self, file_path: str, file_id: str, period_type: str) -> tuple[list[dict], list[str]]:
+        summary = ParseSummary(Path(file_path).name, "", 0, 0, [])
+        wb = self._load_workbook(file_path)
+        try:
+            cells = self._iter_sheet(wb, period_type, self._extract_year_hint(file_path), summary)
+            data = [self._to_record(cell, file_id) for cell in cells]
+        finally:
             wb.close()
-            return [], ["Sheet 'Daily details' non trovato"]
+        return data, summary.warnings
+
+    def _open_cells(
+        self,
+        file_path: str | Path,
+        checksum: str | None = None,
+    ) -> tuple[Iterator[FlowCell], ParseSummary]:
+        file_path = Path(file_path)
+        source: Path | BinaryIO = file_path
+        if checksum is None:
+            # single pass: i byte del file vengono letti una volta, hashati e
+            # passati a openpyxl da memoria (un solo decode ZIP/XML per workbook)
+            with open(file_path, "rb") as fh:
+                payload = fh.read()
+            checksum = hashlib.sha256(payload).hexdigest()
+            source = io.BytesIO(payload)
 
-        ws = wb["Daily details"]
-        rows = list(ws.iter_rows(values_only=True))
-        if len(rows) < 6:
+        summary = ParseSummary(
+            filename=file_path.name,
+            checksum=checksum,
+            monthly_records=0,
+            daily_records=0,
+            warnings=[],
+        )
+        year_hint = self._extract_year_hint(str(file_path))
+        return self._iter_workbook(source, year_hint, summary), summary
+
+    @staticmethod
+    def _to_record(cell: FlowCell, file_id: str) -> dict:
+        period_type, period_date, donor, recipient, value, imputed = cell
+        return {
+            "file_id": file_id,
+            "period_type": period_type,
+            "period_date": period_date,
+            "donor_raw": donor,
+            "recipient_raw": recipient,
+            "value": value,
+            "sheet_name": MNPParser.SHEETS[period_type],
+            "quality_flag": "IMPUTED" if imputed else "OK",
+        }
+
+    def _iter_batches(self, cells: Iterator[FlowCell], file_id: str, batch_size: int) -> Iterator[FlowBatch]:
+        builder: FlowBatchBuilder | None = None
+        for period_type, period_date, donor, recipient, value, imputed in cells:
+            if builder is not None and (builder.period_type != period_type or len(builder) >= batch_size):
+                yield builder.build()
+                builder = None
+            if builder is None:
+                builder = FlowBatchBuilder(file_id, period_type, self.SHEETS[period_type])
+            builder.append(period_date, donor, recipient, value, imputed)
+        if builder is not None and len(builder):
+            yield builder.build()
+
+    def _iter_workbook(
+        self,
+        source: str | Path | BinaryIO,
+        year_hint: int,
+        summary: ParseSummary,
+    ) -> Iterator[FlowCell]:
+        wb = self._load_workbook(source)
+        try:
+            for period_type in self.SHEETS:
+                yield from self._iter_sheet(wb, period_type, year_hint, summary)
+        finally:
             wb.close()
-            return [], ["Sheet daily troppo corto"]
 
-        header_idx = self._detect_daily_header_row(rows)
-        year_hint = self._extract_year_hint(file_path)
-        date_map = self._map_daily_columns(rows[header_idx], year_hint)
+    def _iter_sheet(
+        self,
+        wb: Workbook | XlsxStreamReader,
+        period_type: str,
+        year_hint: int,
+        summary: ParseSummary,
+    ) -> Iterator[FlowCell]:
+        sheet_name = self.SHEETS[period_type]
+        label = period_type.lower()
+        if sheet_name not in wb.sheetnames:
+            summary.warnings.append(f"Sheet '{sheet_name}' non trovato")
+            return
+
+        rows = wb[sheet_name].iter_rows(values_only=True)
+        # l'header sta nelle prime righe: basta un piccolo buffer di peek,
+        # il resto dello sheet viene consumato in streaming
+        head = list(itertools.islice(rows, self.HEADER_PEEK_ROWS))
+        if len(head) < 6:
+            summary.warnings.append(f"Sheet {label} troppo corto")
+            return
+
+        if period_type == "MONTHLY":
+            header_idx = self._detect_monthly_header_row(head)
+            date_map = self._map_monthly_columns(head[header_idx])
+        else:
+            header_idx = self._detect_daily_header_row(head)
+            date_map = self._map_daily_columns(head[header_idx], year_hint)
         if not date_map:
-            warnings.append("Nessuna colonna periodo daily rilevata")
-
+            summary.warnings.append(f"Nessuna colonna periodo {label} rilevata")
+
+        data_rows = itertools.chain(head[header_idx + 1 :], rows)
+        for cell in self._iter_flows(data_rows, date_map, period_type):
+            if period_type == "MONTHLY":
+                summary.monthly_records += 1
+            else:
+                summary.daily_records += 1
+            yield cell
+
+    def _iter_flows(
+        self,
+        rows: Iterable[tuple],
+        date_map: dict[int, date],
+        period_type: str,
+    ) -> Iterator[FlowCell]:
+        # col 3 recipient / col 4 donor (0-based)
         recipient_col = 3
         donor_col = 4
         current_recipient = None
-        data: list[dict] = []
 
-        for row in rows[header_idx + 1 :]:
+        for row in rows:
             if len(row) <= donor_col:
                 continue
 
@@ -186,28 +292,15 @@ class MNPParser:
                     cleaned = self._clean_value(row[col_idx])
                     if cleaned is None:
                         continue
-                    data.append(
-                        {
-                            "file_id": file_id,
-                            "period_type": "DAILY",
-                            "period_date": period_date,
-                            "donor_raw": donor,
-                            "recipient_raw": current_recipient,
-                            "value": cleaned,
-                            "sheet_name": "Daily details",
-                            "quality_flag": "IMPUTED" if cleaned == 0 and str(row[col_idx]).strip() in {"-", ""} else "OK",
-                        }
-                    )
-
-        wb.close()
-        return data, warnings
+                    imputed = cleaned == 0 and str(row[col_idx]).strip() in {"-", ""}
+                    yield period_type, period_date, donor, current_recipient, cleaned, imputed
 
     @staticmethod
     def _detect_monthly_header_row(rows: list[tuple]) -> int:
         # trova la riga con piu token mese nei primi 12 rows
         best_idx = 4
         best_score = -1
-        for idx, row in enumerate(rows[:12]):
+        for idx, row in enumerate(rows[: MNPParser.HEADER_PEEK_ROWS]):
             score = 0
             for val in row:
                 if not val:
@@ -225,7 +318,7 @@ class MNPParser:
         best_idx = 4
         best_score = -1
         pattern = re.compile(r"^\d{1,2}/\d{1,2}$")
-        for idx, row in enumerate(rows[:12]):
+        for idx, row in enumerate(rows[: MNPParser.HEADER_PEEK_ROWS]):
             score = 0
             for val in row:
                 if val and pattern.match(str(val).strip()):
@@ -2,14 +2,20 @@
 
 from __future__ import annotations
 
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
+from typing import Callable, Iterator
 
+import numpy as np
 import pandas as pd
 
 from mnp_cdx.db.repository import DBRepository
+from mnp_cdx.ingest.columnar import FlowBatch
+from mnp_cdx.ingest.operator_cache import OperatorCache
 from mnp_cdx.ingest.operator_mapping import OperatorMapper
-from mnp_cdx.ingest.parser import MNPParser
+from mnp_cdx.ingest.parse_cache import ParseCache
+from mnp_cdx.ingest.parser import MNPParser, ParsedWorkbook, ParseSummary
 
 
 @dataclass
@@ -24,6 +30,15 @@ class IngestResult:
     warnings: list[str]
 
 
+@dataclass
+class MappingReloadResult:
+    aliases: int
+    updated_donor_rows: int
+    updated_recipient_rows: int
+    deleted_self_flows: int
+    refreshed_periods: int
+
+
 class IngestionService:
     def __init__(
         self,
@@ -31,72 +46,178 @@ class IngestionService:
         parser: MNPParser,
         mapper: OperatorMapper,
         parser_version: str = "cdx-0.3.0",
+        chunk_size: int = 50_000,
+        parse_cache: ParseCache | None = None,
     ) -> None:
         self.repo = repo
         self.parser = parser
         self.mapper = mapper
+        self.operators = OperatorCache(repo, mapper)
         self.parser_version = parser_version
-
-    def ingest_file(self, file_path: str | Path, force: bool = False) -> IngestResult:
+        # celle per batch colonnare inviato al DB: limita il picco di memoria su sheet grandi
+        self.chunk_size = chunk_size
+        self.parse_cache = parse_cache
+
+    @property
+    def cache_version(self) -> str:
+        """Chiave di versione per la parse cache: cambia se cambia l'output del parser."""
+        suffix = "+self-flows" if self.parser.include_self_flows else ""
+        return f"{self.parser_version}{suffix}"
+
+    def cached_parse(self, filename: str, checksum: str) -> ParsedWorkbook | None:
+        if self.parse_cache is None:
+            return None
+        return self.parse_cache.get(checksum, self.cache_version, filename=filename)
+
+    def store_parse(self, parsed: ParsedWorkbook) -> None:
+        if self.parse_cache is not None:
+            self.parse_cache.put(parsed.summary.checksum, self.cache_version, parsed)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        try:
+            with self.repo.transaction():
+                yield
+        except BaseException:
+            # gli operator_id creati nella transazione annullata non esistono piu
+            self.operators.invalidate()
+            raise
+
+    def reload_mapping(self) -> MappingReloadResult:
+        """Rilegge operator_mapping.yml e ricanonicalizza i flussi gia caricati.
+
+        Nessun reparse Excel: gli alias vengono riscritti in `operator_alias` e
+        `mnp_flow_fact` viene aggiornata in place dai nomi raw salvati.
+        """
+        self.mapper.reload()
+        with self._transaction():
+            aliases = self.repo.replace_operator_aliases(self.mapper.alias_rows())
+            counts = self.repo.recanonicalize_flows(fallback=self.operators.resolve_unmatched)
+            self.operators.invalidate()
+        return MappingReloadResult(aliases=aliases, **counts)
+
+    def ingest_file(
+        self,
+        file_path: str | Path,
+        force: bool = False,
+        incremental: bool = False,
+        checksum: str | None = None,
+        on_progress: Callable[[int], None] | None = None,
+    ) -> IngestResult:
+        """Ingestisce un workbook MNP.
+
+        Con `incremental` le celle vengono scritte solo se nuove o cambiate
+        rispetto ai dati gia presenti (chiave period_type, period_date, donor,
+        recipient): gli export cumulativi non duplicano i mesi storici.
+        `checksum` evita di rihashare file gia hashati dal chiamante.
+        `on_progress` riceve il numero cumulativo di celle scritte dopo ogni batch.
+        """
         file_path = Path(file_path)
-        file_id = file_path.name
-
-        parsed_rows, summary = self.parser.parse(file_path, file_id=file_id)
-
-        if self.repo.file_exists(summary.checksum):
-            if not force:
-                return IngestResult(
-                    file_id=None,
-                    filename=summary.filename,
-                    checksum=summary.checksum,
-                    inserted_records=0,
-                    monthly_records=summary.monthly_records,
-                    daily_records=summary.daily_records,
-                    skipped_duplicate=True,
-                    warnings=summary.warnings,
+
+        # checksum-first: i duplicati vengono scartati senza aprire il workbook
+        checksum = checksum or self.parser.checksum(file_path)
+
+        if self.parse_cache is None:
+            # streaming: parsing e scritture sono interlacciati, la transazione copre tutto il file
+            with self._transaction():
+                duplicate = self._claim_checksum(file_path.name, checksum, force=force)
+                if duplicate is not None:
+                    return duplicate
+                batches, summary = self.parser.stream_batches(
+                    file_path,
+                    file_id=file_path.name,
+                    batch_size=self.chunk_size,
+                    checksum=checksum,
                 )
-            self.repo.delete_file_and_flows_by_checksum(summary.checksum)
+                return self._write_batches(summary, batches, incremental=incremental, on_progress=on_progress)
+
+        # controllo in sola lettura prima del parsing, senza lock; si ripete nella transazione
+        duplicate = None if force else self.check_duplicate(file_path.name, checksum)
+        if duplicate is not None:
+            return duplicate
+
+        # con la cache attiva l'output colonnare viene materializzato e salvato,
+        # cosi i re-ingest successivi saltano del tutto la decodifica Excel;
+        # il parsing avviene fuori dal lock writer
+        parsed = self.cached_parse(file_path.name, checksum)
+        if parsed is None:
+            parsed = self.parser.parse_batches(
+                file_path,
+                file_id=file_path.name,
+                batch_size=self.chunk_size,
+                checksum=checksum,
+            )
+            self.store_parse(parsed)
+        return self.ingest_parsed(parsed, force=force, incremental=incremental, on_progress=on_progress)
+
+    def ingest_parsed(
+        self,
+        parsed: ParsedWorkbook,
+        force: bool = False,
+        incremental: bool = False,
+        on_progress: Callable[[int], None] | None = None,
+    ) -> IngestResult:
+        """Scrive un workbook gia parsato (es. da un worker di `ingest_directory`)."""
+        summary = parsed.summary
+        # un file = una transazione: un errore a meta non lascia ingest_file ne fatti parziali
+        with self._transaction():
+            duplicate = self._claim_checksum(summary.filename, summary.checksum, force=force)
+            if duplicate is not None:
+                return duplicate
+            return self._write_batches(
+                summary, iter(parsed.batches), incremental=incremental, on_progress=on_progress
+            )
+
+    def check_duplicate(self, filename: str, checksum: str) -> IngestResult | None:
+        """Ritorna il risultato duplicate, oppure None se il checksum non e ancora ingestito.
 
+        Sola lettura: la sostituzione con `force` avviene solo dentro la transazione del file.
+        """
+        if not self.repo.file_exists(checksum):
+            return None
+        return IngestResult(
+            file_id=None,
+            filename=filename,
+            checksum=checksum,
+            inserted_records=0,
+            monthly_records=0,
+            daily_records=0,
+            skipped_duplicate=True,
+            warnings=["File gia ingestito (checksum duplicate)"],
+        )
+
+    def _claim_checksum(self, filename: str, checksum: str, force: bool) -> IngestResult | None:
+        # da chiamare dentro self._transaction(): la delete di force e le nuove
+        # scritture vengono confermate o annullate insieme
+        if force:
+            self.repo.delete_file_and_flows_by_checksum(checksum)
+            return None
+        return self.check_duplicate(filename, checksum)
+
+    def _write_batches(
+        self,
+        summary: ParseSummary,
+        batches: Iterator[FlowBatch],
+        incremental: bool = False,
+        on_progress: Callable[[int], None] | None = None,
+    ) -> IngestResult:
         ingest_file_id = self.repo.insert_ingest_file(
             filename=summary.filename,
             checksum=summary.checksum,
             parser_version=self.parser_version,
         )
 
-        fact_rows: list[dict] = []
-        for row in parsed_rows:
-            donor = self.mapper.resolve(row["donor_raw"])
-            recipient = self.mapper.resolve(row["recipient_raw"])
-
-            donor_id = self.repo.get_or_create_operator(
-                donor.canonical_name, donor.group_name, donor.op_type
-            )
-            recipient_id = self.repo.get_or_create_operator(
-                recipient.canonical_name, recipient.group_name, recipient.op_type
-            )
-
-            if donor_id == recipient_id:
-                continue
-
-            fact_rows.append(
-                {
-                    "file_id": ingest_file_id,
-                    "period_type": row["period_type"],
-                    "period_date": row["period_date"],
-                    "donor_operator_id": donor_id,
-                    "recipient_operator_id": recipient_id,
-                    "value": float(row["value"]),
-                    "sheet_name": row["sheet_name"],
-                    "quality_flag": row["quality_flag"],
-                    "donor_raw": row["donor_raw"],
-                    "recipient_raw": row["recipient_raw"],
-                }
-            )
-
-        df = pd.DataFrame(fact_rows)
-        inserted = self.repo.insert_flow_dataframe(df)
+        write = self.repo.upsert_flow_dataframe if incremental else self.repo.insert_flow_dataframe
+        inserted = 0
+        processed = 0
+        for batch in batches:
+            inserted += write(self._to_fact_frame(batch, ingest_file_id))
+            processed += len(batch)
+            if on_progress is not None:
+                on_progress(processed)
         self.repo.update_ingest_status(ingest_file_id, "OK", inserted)
 
+        # i conteggi del summary sono completi solo dopo aver consumato i batch
         return IngestResult(
             file_id=ingest_file_id,
             filename=summary.filename,
@@ -107,3 +228,15 @@ class IngestionService:
             skipped_duplicate=False,
             warnings=summary.warnings,
         )
+
+    def _to_fact_frame(self, batch: FlowBatch, ingest_file_id: int) -> pd.DataFrame:
+        # risoluzione per voce di dizionario, poi gather vettoriale sui codici
+        operator_ids = np.array(self.operators.resolve_many(batch.operators), dtype=np.int64)
+        donor_ids = operator_ids[batch.donor_codes]
+        recipient_ids = operator_ids[batch.recipient_codes]
+
+        df = batch.to_frame()
+        df.insert(0, "file_id", np.full(len(df), ingest_file_id, dtype=np.int64))
+        df["donor_operator_id"] = donor_ids
+        df["recipient_operator_id"] = recipient_ids
+        return df[donor_ids != recipient_ids].reset_index(drop=True)
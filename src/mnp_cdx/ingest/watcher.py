@@ -0,0 +1,167 @@
+"""Watch-folder ingestion daemon."""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+import logging
+import time
+
+from mnp_cdx.generic.template_engine import GenericTemplateEngine
+from mnp_cdx.hashing import sha256_file
+from mnp_cdx.ingest.parser import MNPParser
+from mnp_cdx.ingest.service import IngestionService
+from mnp_cdx.ingest.xlsx_stream import XlsxStreamReader
+
+
+logger = logging.getLogger(__name__)
+
+# checksum ricordati per scartare le copie senza DB; oltre questa soglia decide la transazione
+SEEN_CHECKSUMS_MAX = 4096
+
+
+@dataclass
+class WatchEvent:
+    path: Path
+    kind: str  # "mnp" | "template" | "duplicate" | "error"
+    checksum: str | None = None
+    result: Any = None
+    error: str | None = None
+
+
+class FolderWatcher:
+    """Ingestisce i workbook che compaiono in una cartella, a polling.
+
+    Un file viene preso in carico solo quando size e mtime restano invariati
+    per `settle_seconds` (debounce delle copie ancora in scrittura). I file
+    MNP passano da `IngestionService`, gli altri dal motore template; la
+    stessa istanza (connessione DuckDB e cache operatori) resta calda per
+    tutta la vita del processo.
+    """
+
+    PATTERNS = ("*.xlsx", "*.xlsm")
+
+    def __init__(
+        self,
+        directory: str | Path,
+        ingest_service: IngestionService,
+        generic_engine: GenericTemplateEngine,
+        settle_seconds: float = 5.0,
+        incremental: bool = False,
+        clock: Callable[[], float] = time.monotonic,
+        seen_checksums_max: int = SEEN_CHECKSUMS_MAX,
+    ) -> None:
+        self.directory = Path(directory)
+        self.ingest_service = ingest_service
+        self.generic_engine = generic_engine
+        self.settle_seconds = settle_seconds
+        self.incremental = incremental
+        self._clock = clock
+        self.seen_checksums_max = seen_checksums_max
+        # path -> (size, mtime_ns, istante da cui la firma e' stabile)
+        self._pending: dict[Path, tuple[int, int, float]] = {}
+        # path -> firma gia processata (si riprocessa solo se il file cambia);
+        # i path rimossi dalla cartella escono ad ogni poll
+        self._processed: dict[Path, tuple[int, int]] = {}
+        # LRU limitata: un processo di lunga durata non accumula checksum all'infinito
+        self._seen_checksums: OrderedDict[str, None] = OrderedDict()
+
+    def _candidates(self) -> list[Path]:
+        paths: set[Path] = set()
+        for pattern in self.PATTERNS:
+            paths.update(self.directory.glob(pattern))
+        # "~$file.xlsx" sono lock file di Excel, non workbook
+        return sorted(p for p in paths if p.is_file() and not p.name.startswith("~$"))
+
+    def _ready_files(self) -> list[Path]:
+        now = self._clock()
+        ready: list[Path] = []
+        present: set[Path] = set()
+
+        for path in self._candidates():
+            present.add(path)
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self._processed.get(path) == signature:
+                continue
+
+            pending = self._pending.get(path)
+            if pending is None or pending[:2] != signature:
+                self._pending[path] = (*signature, now)
+                if self.settle_seconds > 0:
+                    continue
+                pending = self._pending[path]
+
+            if now - pending[2] >= self.settle_seconds:
+                ready.append(path)
+
+        for gone in set(self._pending) - present:
+            del self._pending[gone]
+        for gone in set(self._processed) - present:
+            del self._processed[gone]
+        return ready
+
+    def poll_once(self) -> list[WatchEvent]:
+        events: list[WatchEvent] = []
+        for path in self._ready_files():
+            size, mtime_ns, _ = self._pending.pop(path)
+            event = self._process(path)
+            # un file fallito non viene marcato: al poll successivo torna in debounce e si ritenta
+            if event.kind != "error":
+                self._processed[path] = (size, mtime_ns)
+            events.append(event)
+        return events
+
+    def _process(self, path: Path) -> WatchEvent:
+        try:
+            checksum = sha256_file(path)
+            # solo i checksum scritti da questo watcher si scartano senza DB; il controllo
+            # sul database avviene dentro la transazione dell'ingest, insieme alla scrittura
+            if checksum in self._seen_checksums:
+                self._seen_checksums.move_to_end(checksum)
+                return WatchEvent(path=path, kind="duplicate", checksum=checksum)
+
+            if self._is_mnp_workbook(path):
+                result = self.ingest_service.ingest_file(path, incremental=self.incremental, checksum=checksum)
+                kind = "mnp"
+            else:
+                result = self.generic_engine.ingest(path, checksum=checksum)
+                kind = "template"
+            self._remember_checksum(checksum)
+            if result.skipped_duplicate:
+                kind = "duplicate"
+            return WatchEvent(path=path, kind=kind, checksum=checksum, result=result)
+        except Exception as exc:
+            logger.exception("Watch ingest failed for %s", path)
+            return WatchEvent(path=path, kind="error", error=str(exc))
+
+    def _remember_checksum(self, checksum: str) -> None:
+        self._seen_checksums[checksum] = None
+        self._seen_checksums.move_to_end(checksum)
+        while len(self._seen_checksums) > self.seen_checksums_max:
+            self._seen_checksums.popitem(last=False)
+
+    @staticmethod
+    def _is_mnp_workbook(path: Path) -> bool:
+        reader = XlsxStreamReader(path)
+        try:
+            return any(name in reader.sheetnames for name in MNPParser.SHEETS.values())
+        finally:
+            reader.close()
+
+    def run(
+        self,
+        interval: float = 2.0,
+        on_event: Callable[[WatchEvent], None] | None = None,
+        should_stop: Callable[[], bool] | None = None,
+    ) -> None:
+        while should_stop is None or not should_stop():
+            for event in self.poll_once():
+                if on_event is not None:
+                    on_event(event)
+            time.sleep(interval)
@@ -0,0 +1,238 @@
+"""Minimal streaming xlsx reader built on the raw sheet XML.
+
+Alternativa a openpyxl per il parser MNP: legge workbook.xml, le relazioni,
+la shared-strings table e lo sheet XML con `iterparse`, senza creare un
+oggetto cella per ogni cella della griglia. Le righe sono tuple di valori
+come `iter_rows(values_only=True)` in modalita read-only/data-only.
+
+Limite noto: i number format non vengono interpretati, quindi le celle
+numeriche formattate come data restano numeri (gli sheet MNP usano header
+testuali e valori numerici, dove l'output coincide con openpyxl).
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Iterator
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+OFFICE_DOCUMENT_REL = REL_NS + "/officeDocument"
+
+CELL_REF = re.compile(r"^([A-Z]+)(\d*)$")
+DIMENSION_REF = re.compile(r"^[A-Z]+\d+:([A-Z]+)\d+$|^([A-Z]+)\d+$")
+
+
+def _namespace(tag: str) -> str:
+    return tag[: tag.index("}") + 1] if tag.startswith("{") else ""
+
+
+def _column_index(letters: str) -> int:
+    idx = 0
+    for ch in letters:
+        idx = idx * 26 + (ord(ch) - 64)
+    return idx
+
+
+def _cast_number(text: str) -> int | float:
+    # stessa regola di openpyxl: float solo se c'e' parte decimale o esponente
+    if "." in text or "E" in text or "e" in text:
+        return float(text)
+    return int(text)
+
+
+class XlsxStreamSheet:
+    def __init__(self, reader: XlsxStreamReader, title: str, member: str) -> None:
+        self._reader = reader
+        self.title = title
+        self._member = member
+
+    def iter_rows(self, values_only: bool = True) -> Iterator[tuple[Any, ...]]:
+        if not values_only:
+            raise ValueError("XlsxStreamSheet supporta solo values_only=True")
+        return self._reader._iter_sheet_rows(self._member)
+
+
+class XlsxStreamReader:
+    """Reader xlsx read-only con interfaccia compatibile col sottoinsieme usato da MNPParser."""
+
+    def __init__(self, source: str | Path | BinaryIO) -> None:
+        self._zip = zipfile.ZipFile(source)
+        self._shared_strings_member: str | None = None
+        self._shared_strings: list[str] | None = None
+        self._sheets = self._read_sheet_members()
+
+    @property
+    def sheetnames(self) -> list[str]:
+        return list(self._sheets)
+
+    def __getitem__(self, sheet_name: str) -> XlsxStreamSheet:
+        if sheet_name not in self._sheets:
+            raise KeyError(f"Worksheet {sheet_name} does not exist.")
+        return XlsxStreamSheet(self, sheet_name, self._sheets[sheet_name])
+
+    def close(self) -> None:
+        self._zip.close()
+
+    # ------------------------
+    # Package structure
+    # ------------------------
+    def _read_rels(self, member: str) -> dict[str, tuple[str, str]]:
+        rels_path = posixpath.join(posixpath.dirname(member), "_rels", posixpath.basename(member) + ".rels")
+        if rels_path not in self._zip.namelist():
+            return {}
+        root = ET.fromstring(self._zip.read(rels_path))
+        base_dir = posixpath.dirname(member)
+        rels: dict[str, tuple[str, str]] = {}
+        for rel in root.iter(f"{{{PKG_REL_NS}}}Relationship"):
+            target = rel.attrib["Target"]
+            if target.startswith("/"):
+                resolved = target.lstrip("/")
+            else:
+                resolved = posixpath.normpath(posixpath.join(base_dir, target))
+            rels[rel.attrib["Id"]] = (rel.attrib.get("Type", ""), resolved)
+        return rels
+
+    def _workbook_member(self) -> str:
+        for rel_type, target in self._read_rels("").values():
+            if rel_type.endswith("/officeDocument") or rel_type == OFFICE_DOCUMENT_REL:
+                return target
+        return "xl/workbook.xml"
+
+    def _read_sheet_members(self) -> dict[str, str]:
+        workbook_member = self._workbook_member()
+        rels = self._read_rels(workbook_member)
+        root = ET.fromstring(self._zip.read(workbook_member))
+        ns = _namespace(root.tag)
+
+        sheets: dict[str, str] = {}
+        for sheet in root.iter(f"{ns}sheet"):
+            rel_id = sheet.attrib.get(f"{{{REL_NS}}}id")
+            if rel_id is None:
+                # OOXML strict usa un namespace diverso per r:id
+                rel_id = next((v for k, v in sheet.attrib.items() if k.endswith("}id")), None)
+            if rel_id in rels:
+                sheets[sheet.attrib["name"]] = rels[rel_id][1]
+
+        for rel_type, target in rels.values():
+            if rel_type.endswith("/sharedStrings"):
+                self._shared_strings_member = target
+        return sheets
+
+    @property
+    def shared_strings(self) -> list[str]:
+        if self._shared_strings is None:
+            self._shared_strings = self._read_shared_strings()
+        return self._shared_strings
+
+    def _read_shared_strings(self) -> list[str]:
+        member = self._shared_strings_member
+        if not member or member not in self._zip.namelist():
+            return []
+
+        strings: list[str] = []
+        with self._zip.open(member) as fh:
+            ns = None
+            for event, elem in ET.iterparse(fh, events=("start", "end")):
+                if ns is None:
+                    ns = _namespace(elem.tag)
+                if event == "end" and elem.tag == f"{ns}si":
+                    strings.append(self._text_content(elem, ns))
+                    elem.clear()
+        return strings
+
+    @staticmethod
+    def _text_content(elem: ET.Element, ns: str) -> str:
+        # <t> diretto oppure rich text <r><t>; i run fonetici <rPh> sono esclusi
+        parts: list[str] = []
+        for child in elem:
+            if child.tag == f"{ns}t":
+                parts.append(child.text or "")
+            elif child.tag == f"{ns}r":
+                for t in child.iter(f"{ns}t"):
+                    parts.append(t.text or "")
+        return "".join(parts)
+
+    # ------------------------
+    # Sheet rows
+    # ------------------------
+    def _iter_sheet_rows(self, member: str) -> Iterator[tuple[Any, ...]]:
+        shared = self.shared_strings
+        max_col: int | None = None
+        expected_row = 1
+
+        with self._zip.open(member) as fh:
+            ns = None
+            sheet_data = None
+            for event, elem in ET.iterparse(fh, events=("start", "end")):
+                if ns is None:
+                    ns = _namespace(elem.tag)
+                    row_tag, cell_tag, dim_tag, data_tag = (f"{ns}row", f"{ns}c", f"{ns}dimension", f"{ns}sheetData")
+
+                if event == "start":
+                    if elem.tag == data_tag:
+                        sheet_data = elem
+                    continue
+
+                if elem.tag == dim_tag:
+                    max_col = self._dimension_max_col(elem.attrib.get("ref", ""))
+                    continue
+                if elem.tag != row_tag:
+                    continue
+
+                row_idx = int(elem.attrib.get("r", expected_row))
+                # righe assenti nello XML: openpyxl le restituisce vuote
+                while expected_row < row_idx:
+                    expected_row += 1
+                    yield (None,) * (max_col or 0)
+
+                values: dict[int, Any] = {}
+                col = 0
+                for cell in elem.iter(cell_tag):
+                    ref = cell.attrib.get("r")
+                    match = CELL_REF.match(ref) if ref else None
+                    col = _column_index(match.group(1)) if match else col + 1
+                    values[col] = self._cell_value(cell, ns, shared)
+
+                width = max_col if max_col is not None else (max(values) if values else 0)
+                yield tuple(values.get(c) for c in range(1, width + 1))
+                expected_row = row_idx + 1
+
+                elem.clear()
+                if sheet_data is not None:
+                    sheet_data.clear()
+
+    @staticmethod
+    def _dimension_max_col(ref: str) -> int | None:
+        match = DIMENSION_REF.match(ref.upper())
+        if not match:
+            return None
+        return _column_index(match.group(1) or match.group(2))
+
+    def _cell_value(self, cell: ET.Element, ns: str, shared: list[str]) -> Any:
+        data_type = cell.attrib.get("t", "n")
+        if data_type == "inlineStr":
+            inline = cell.find(f"{ns}is")
+            return self._text_content(inline, ns) if inline is not None else None
+
+        v = cell.find(f"{ns}v")
+        if v is None or v.text is None:
+            return None
+        text = v.text
+
+        if data_type == "s":
+            return shared[int(text)]
+        if data_type == "n":
+            return _cast_number(text)
+        if data_type == "b":
+            return bool(int(text))
+        if data_type == "d":
+            return datetime.fromisoformat(text)
+        # "str" (risultato formula) ed "e" (errori tipo #N/A) restano testo
+        return text
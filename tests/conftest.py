@@ -0,0 +1,46 @@
+from pathlib import Path
+
+import openpyxl
+import pytest
+
+
+def _build_mnp_workbook(path: Path, title: str = "MNP monthly report") -> None:
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Monthly details"
+    ws.append([title])
+    ws.append([])
+    ws.append([])
+    ws.append([])
+    ws.append([None, None, None, "Recipient", "Donor", "Jan 24", "Feb 24", "Mar 24"])
+    ws.append([None, None, None, "WINDTRE"])
+    ws.append([None, None, None, None, "TIM", 10, 12, "-"])
+    ws.append([None, None, None, None, "VODAFONE", 5, None, 7])
+    ws.append([None, None, None, None, "WINDTRE", 1, 1, 1])
+    ws.append([None, None, None, "TIM"])
+    ws.append([None, None, None, None, "WINDTRE", 3, 4, 5])
+    ws.append([None, None, None, None, "ILIAD", "2,5", 1, 0])
+
+    ws2 = wb.create_sheet("Daily details")
+    ws2.append(["MNP daily report"])
+    ws2.append([])
+    ws2.append([])
+    ws2.append([])
+    ws2.append([None, None, None, "Recipient", "Donor", "30/12", "31/12", "1/1"])
+    ws2.append([None, None, None, "ILIAD"])
+    ws2.append([None, None, None, None, "TIM", 2, 3, 4])
+    ws2.append([None, None, None, None, "VERY MOBILE", "-", 1, None])
+
+    wb.save(path)
+
+
+@pytest.fixture
+def mnp_workbook(tmp_path) -> Path:
+    file_path = tmp_path / "MNP MATRIX 2024.xlsx"
+    _build_mnp_workbook(file_path)
+    return file_path
+
+
+@pytest.fixture
+def mnp_workbook_factory():
+    return _build_mnp_workbook
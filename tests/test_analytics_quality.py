@@ -1,9 +1,13 @@
 from datetime import date
+from pathlib import Path
 
 import pandas as pd
 
 from mnp_cdx.analytics.kpi import AnalyticsService
 from mnp_cdx.db.repository import DBRepository
+from mnp_cdx.ingest.operator_mapping import OperatorMapper
+from mnp_cdx.ingest.parser import MNPParser
+from mnp_cdx.ingest.service import IngestionService
 
 
 def test_quality_report_and_snapshot(tmp_path) -> None:
@@ -57,3 +61,50 @@ def test_quality_report_and_snapshot(tmp_path) -> None:
     assert quality["imputed_rows"] == 1
 
     repo.close()
+
+
+def test_kpi_snapshot_all_matches_per_operator_snapshots(tmp_path, mnp_workbook):
+    repo = DBRepository(tmp_path / "kpi.duckdb")
+    repo.init_schema()
+    IngestionService(repo, MNPParser(), OperatorMapper(Path("config/operator_mapping.yml"))).ingest_file(mnp_workbook)
+    analytics = AnalyticsService(repo)
+
+    for period_type, start in (("MONTHLY", None), ("DAILY", None), ("MONTHLY", "2024-02-01")):
+        batch = analytics.kpi_snapshot_all(period_type, start_date=start)
+        assert [s["operator"] for s in batch] == analytics.operators()
+        for snapshot in batch:
+            assert snapshot == analytics.kpi_snapshot(snapshot["operator"], period_type, start_date=start)
+    repo.close()
+
+
+def test_flow_matrix_matches_pair_totals_and_normalizes(tmp_path, mnp_workbook):
+    repo = DBRepository(tmp_path / "matrix.duckdb")
+    repo.init_schema()
+    IngestionService(repo, MNPParser(), OperatorMapper(Path("config/operator_mapping.yml"))).ingest_file(mnp_workbook)
+    analytics = AnalyticsService(repo)
+
+    matrix = analytics.flow_matrix("MONTHLY")
+    assert matrix.labels == analytics.operators()
+    assert matrix.values.shape == (len(matrix.labels), len(matrix.labels))
+
+    pairs = repo.query_df(
+        """
+        SELECT d.canonical_name AS donor, r.canonical_name AS recipient, SUM(f.value) AS value
+        FROM mnp_flow_fact f
+        JOIN operator_dim d ON d.operator_id = f.donor_operator_id
+        JOIN operator_dim r ON r.operator_id = f.recipient_operator_id
+        WHERE f.period_type = 'MONTHLY'
+        GROUP BY 1, 2
+        """
+    )
+    for row in pairs.itertuples(index=False):
+        assert matrix.values[matrix.index_of(row.donor), matrix.index_of(row.recipient)] == row.value
+    assert matrix.values.sum() == pairs["value"].sum()
+
+    by_row = analytics.flow_matrix("MONTHLY", normalize="row").values
+    row_totals = by_row.sum(axis=1)
+    assert all(abs(total - 1.0) < 1e-9 or total == 0 for total in row_totals)
+    by_col = analytics.flow_matrix("MONTHLY", normalize="col").values
+    col_totals = by_col.sum(axis=0)
+    assert all(abs(total - 1.0) < 1e-9 or total == 0 for total in col_totals)
+    repo.close()
@@ -1,9 +1,12 @@
 import re
+import sys
 
 import pytest
 from fastapi import HTTPException
+from fastapi.testclient import TestClient
 
-from mnp_cdx.api.app import _raise_internal_error
+from mnp_cdx.api.app import _raise_internal_error, create_app
+from mnp_cdx.config import Settings
 
 
 def test_raise_internal_error_for_template_analyze_has_reference_code() -> None:
@@ -24,3 +27,22 @@ def test_raise_internal_error_for_template_ingest_has_reference_code() -> None:
     detail = str(captured.value.detail)
     assert detail.startswith("Ingestion template fallita per errore interno (ref: ")
     assert re.search(r"ref: [a-f0-9]{8}\)", detail)
+
+
+def test_arrow_flow_matrix_without_pyarrow_is_not_implemented(tmp_path, mnp_workbook, monkeypatch) -> None:
+    settings = Settings(
+        base_dir=tmp_path,
+        data_dir=tmp_path / "data",
+        db_path=tmp_path / "data" / "mnp.duckdb",
+        mapping_path=Settings.load().mapping_path,
+        parse_cache_dir=None,
+    )
+    client = TestClient(create_app(settings), raise_server_exceptions=False)
+    assert client.post("/ingest", files={"file": (mnp_workbook.name, mnp_workbook.read_bytes())}).status_code == 200
+
+    # pyarrow assente: `import pyarrow` solleva ImportError
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    response = client.get("/flow-matrix", params={"format": "arrow"})
+
+    assert response.status_code == 501
+    assert "pyarrow" in response.json()["detail"]
@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+import io
+
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+
+from mnp_cdx.api.app import create_app
+from mnp_cdx.api.uploads import spool_upload
+from mnp_cdx.config import Settings
+
+
+def test_spool_upload_hashes_while_writing_in_chunks(tmp_path):
+    payload = bytes(range(256)) * 1000
+    upload = UploadFile(file=io.BytesIO(payload), filename="../MNP MATRIX 2024")
+
+    spooled = asyncio.run(spool_upload(upload, tmp_path / "uploads", chunk_size=4096))
+
+    assert spooled.filename == "MNP MATRIX 2024.xlsx"
+    assert spooled.path.parent.parent == tmp_path / "uploads"
+    assert spooled.path.read_bytes() == payload
+    assert spooled.size_bytes == len(payload)
+    assert spooled.checksum == hashlib.sha256(payload).hexdigest()
+
+    spooled.discard()
+    assert not any((tmp_path / "uploads").iterdir())
+
+
+def test_duplicate_upload_is_answered_before_parsing(tmp_path, mnp_workbook, monkeypatch):
+    settings = Settings(
+        base_dir=tmp_path,
+        data_dir=tmp_path / "data",
+        db_path=tmp_path / "data" / "mnp.duckdb",
+        mapping_path=Settings.load().mapping_path,
+        parse_cache_dir=None,
+    )
+    client = TestClient(create_app(settings))
+    content = mnp_workbook.read_bytes()
+
+    first = client.post("/ingest", files={"file": (mnp_workbook.name, content)})
+    assert first.status_code == 200
+    assert first.json()["filename"] == mnp_workbook.name
+    assert first.json()["inserted_records"] > 0
+
+    def _no_parse(*args, **kwargs):
+        raise AssertionError("un duplicato non deve essere parsato")
+
+    monkeypatch.setattr("mnp_cdx.ingest.parser.MNPParser.parse_batches", _no_parse)
+    monkeypatch.setattr("mnp_cdx.ingest.parser.MNPParser.stream_batches", _no_parse)
+
+    again = client.post("/ingest?async_job=true", files={"file": ("copy.xlsx", content)})
+    assert again.status_code == 200
+    assert again.json()["skipped_duplicate"] is True
+    assert again.json()["checksum"] == first.json()["checksum"]
+    assert not any((tmp_path / "data" / "uploads").iterdir())
+
+
+def test_forced_upload_that_fails_to_parse_keeps_previous_rows(tmp_path, mnp_workbook, monkeypatch):
+    settings = Settings(
+        base_dir=tmp_path,
+        data_dir=tmp_path / "data",
+        db_path=tmp_path / "data" / "mnp.duckdb",
+        mapping_path=Settings.load().mapping_path,
+        parse_cache_dir=None,
+    )
+    app = create_app(settings)
+    client = TestClient(app, raise_server_exceptions=False)
+    content = mnp_workbook.read_bytes()
+
+    first = client.post("/ingest", files={"file": (mnp_workbook.name, content)})
+    assert first.status_code == 200
+
+    def _broken(*args, **kwargs):
+        raise ValueError("workbook corrotto")
+
+    monkeypatch.setattr("mnp_cdx.ingest.parser.MNPParser.parse_batches", _broken)
+    monkeypatch.setattr("mnp_cdx.ingest.parser.MNPParser.stream_batches", _broken)
+
+    forced = client.post("/ingest?force=true", files={"file": (mnp_workbook.name, content)})
+    assert forced.status_code == 500
+
+    monkeypatch.undo()
+    again = client.post("/ingest", files={"file": (mnp_workbook.name, content)})
+    assert again.json()["skipped_duplicate"] is True
+    # prima lettura KPI dopo il fallimento: nessun valore in cache da prima del force
+    totals = client.get("/kpi").json()
+    assert sum(row["total_port_in"] for row in totals) == 49.5
+
+
+def test_default_settings_ingest_through_the_streaming_path(tmp_path, mnp_workbook, monkeypatch):
+    mapping_path = Settings.load().mapping_path
+    for name in ("MNP_CDX_PARSE_CACHE_MAX_MB", "MNP_CDX_PARSE_CACHE_DIR", "MNP_CDX_DATA_DIR", "MNP_CDX_DB_PATH"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("MNP_CDX_BASE_DIR", str(tmp_path))
+    monkeypatch.setenv("MNP_CDX_MAPPING_PATH", str(mapping_path))
+    settings = Settings.load()
+    assert settings.parse_cache_dir is None
+
+    def _no_materialize(*args, **kwargs):
+        raise AssertionError("con le impostazioni di default il workbook non va materializzato")
+
+    monkeypatch.setattr("mnp_cdx.ingest.parser.MNPParser.parse_batches", _no_materialize)
+    client = TestClient(create_app(settings))
+    response = client.post("/ingest", files={"file": (mnp_workbook.name, mnp_workbook.read_bytes())})
+
+    assert response.status_code == 200
+    assert response.json()["inserted_records"] == 16
+    assert not (tmp_path / "data" / "parse_cache").exists()
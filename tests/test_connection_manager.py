@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from mnp_cdx.db.repository import DBRepository
+
+
+def test_each_thread_gets_its_own_cursor_on_the_same_database(tmp_path):
+    repo = DBRepository(tmp_path / "mnp.duckdb")
+    repo.init_schema()
+    repo.con.execute("CREATE TABLE numbers AS SELECT range AS n FROM range(10000)")
+
+    def _read(_):
+        con = repo.con
+        total = repo.query_df("SELECT SUM(n) AS s FROM numbers")["s"].iloc[0]
+        return id(con), int(total)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(_read, range(16)))
+
+    assert {total for _, total in results} == {sum(range(10000))}
+    assert len({con_id for con_id, _ in results}) > 1
+    assert id(repo.con) not in {con_id for con_id, _ in results}
+    repo.close()
+
+
+def test_writer_path_is_exclusive_across_threads(tmp_path):
+    repo = DBRepository(tmp_path / "mnp.duckdb")
+    repo.init_schema()
+    repo.con.execute("CREATE TABLE log (thread VARCHAR, step INTEGER)")
+    active = {"now": 0, "max": 0}
+    guard = threading.Lock()
+
+    def _write(name):
+        with repo.writer() as con:
+            with guard:
+                active["now"] += 1
+                active["max"] = max(active["max"], active["now"])
+            for step in range(3):
+                con.execute("INSERT INTO log VALUES (?, ?)", [name, step])
+                time.sleep(0.005)
+            with guard:
+                active["now"] -= 1
+
+    threads = [threading.Thread(target=_write, args=(f"t{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert active["max"] == 1
+    assert repo.con.execute("SELECT COUNT(*) FROM log").fetchone()[0] == 12
+    repo.close()
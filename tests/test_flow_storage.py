@@ -0,0 +1,98 @@
+from datetime import date, datetime
+from pathlib import Path
+
+import duckdb
+
+from mnp_cdx.db.repository import DBRepository
+from mnp_cdx.ingest.operator_mapping import OperatorMapper
+from mnp_cdx.ingest.parser import MNPParser
+from mnp_cdx.ingest.service import IngestionService
+
+
+def test_fact_texts_are_dictionary_encoded_behind_compatibility_view(tmp_path, mnp_workbook) -> None:
+    repo = DBRepository(tmp_path / "store.duckdb")
+    repo.init_schema()
+    service = IngestionService(repo, MNPParser(), OperatorMapper(Path("config/operator_mapping.yml")), chunk_size=4)
+    service.ingest_file(mnp_workbook)
+
+    columns = dict(
+        repo.con.execute(
+            "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = 'mnp_flow_store'"
+        ).fetchall()
+    )
+    assert columns["donor_raw_id"] == columns["sheet_id"] == "INTEGER"
+    assert columns["period_type"].startswith("ENUM")
+    assert "donor_raw" not in columns
+
+    assert repo.con.execute("SELECT COUNT(*) FROM raw_name_dim").fetchone()[0] == 5
+    assert repo.con.execute("SELECT COUNT(*) FROM sheet_dim").fetchone()[0] == 2
+
+    view = repo.query_df(
+        """
+        SELECT period_type, sheet_name, quality_flag, donor_raw, recipient_raw, value
+        FROM mnp_flow_fact
+        WHERE period_type = 'DAILY'
+        ORDER BY period_date, donor_raw
+        """
+    )
+    assert view.iloc[0].to_dict() == {
+        "period_type": "DAILY",
+        "sheet_name": "Daily details",
+        "quality_flag": "OK",
+        "donor_raw": "TIM",
+        "recipient_raw": "ILIAD",
+        "value": 2.0,
+    }
+    repo.close()
+
+
+def test_legacy_flow_table_is_migrated(tmp_path) -> None:
+    db_path = tmp_path / "legacy.duckdb"
+    con = duckdb.connect(str(db_path))
+    con.execute(
+        """
+        CREATE TABLE mnp_flow_fact (
+            file_id BIGINT NOT NULL,
+            period_type VARCHAR NOT NULL,
+            period_date DATE NOT NULL,
+            donor_operator_id BIGINT NOT NULL,
+            recipient_operator_id BIGINT NOT NULL,
+            value DOUBLE NOT NULL,
+            sheet_name VARCHAR,
+            quality_flag VARCHAR NOT NULL DEFAULT 'OK',
+            donor_raw VARCHAR,
+            recipient_raw VARCHAR,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX idx_flow_period ON mnp_flow_fact(period_type, period_date);
+        """
+    )
+    legacy_rows = [
+        (1, "MONTHLY", date(2024, 1, 1), 1, 2, 10.0, "Monthly details", "OK", "TIM", "WINDTRE", datetime(2024, 2, 1)),
+        (1, "MONTHLY", date(2024, 1, 1), 3, 2, 4.0, "Monthly details", "IMPUTED", "VOD", "WINDTRE", datetime(2024, 2, 1)),
+        (1, "DAILY", date(2024, 1, 5), 1, 3, 1.0, None, "OK", "TIM", None, datetime(2024, 2, 1)),
+    ]
+    con.executemany("INSERT INTO mnp_flow_fact VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", legacy_rows)
+    con.close()
+
+    repo = DBRepository(db_path)
+    repo.init_schema()
+    kind = repo.con.execute(
+        "SELECT table_type FROM information_schema.tables WHERE table_name = 'mnp_flow_fact'"
+    ).fetchone()[0]
+    assert kind == "VIEW"
+    migrated = repo.con.execute(
+        """
+        SELECT file_id, period_type, period_date, donor_operator_id, recipient_operator_id, value,
+               sheet_name, quality_flag, donor_raw, recipient_raw, created_at
+        FROM mnp_flow_fact
+        ORDER BY period_type DESC, value DESC
+        """
+    ).fetchall()
+    assert migrated == legacy_rows
+    assert repo.con.execute("SELECT SUM(port_in) FROM operator_period_agg").fetchone()[0] == 15.0
+
+    # la migrazione e' una tantum: una seconda apertura non tocca i dati
+    repo.init_schema()
+    assert repo.con.execute("SELECT COUNT(*) FROM mnp_flow_store").fetchone()[0] == 3
+    repo.close()
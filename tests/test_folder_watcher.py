@@ -0,0 +1,142 @@
+import shutil
+from pathlib import Path
+
+import openpyxl
+
+from mnp_cdx.db.repository import DBRepository
+from mnp_cdx.generic.template_engine import GenericTemplateEngine
+from mnp_cdx.ingest.operator_mapping import OperatorMapper
+from mnp_cdx.ingest.parser import MNPParser
+from mnp_cdx.ingest.service import IngestionService
+from mnp_cdx.ingest.watcher import FolderWatcher
+
+
+class _FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_watcher_debounces_routes_and_deduplicates(tmp_path, mnp_workbook_factory) -> None:
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    repo = DBRepository(tmp_path / "watch.duckdb")
+    repo.init_schema()
+    service = IngestionService(
+        repo=repo,
+        parser=MNPParser(),
+        mapper=OperatorMapper(Path("config/operator_mapping.yml")),
+    )
+    clock = _FakeClock()
+    watcher = FolderWatcher(inbox, service, GenericTemplateEngine(repo), settle_seconds=5.0, clock=clock)
+
+    mnp_workbook_factory(inbox / "MNP MATRIX 2024.xlsx")
+    generic = openpyxl.Workbook()
+    generic.active.append(["Data", "Region", "Revenue"])
+    generic.active.append(["2025-01-01", "North", 10])
+    generic.save(inbox / "sales_20250101.xlsx")
+    (inbox / "~$MNP MATRIX 2024.xlsx").write_bytes(b"lock")
+
+    assert watcher.poll_once() == []
+    clock.now = 3.0
+    assert watcher.poll_once() == []
+    clock.now = 6.0
+    events = {e.path.name: e for e in watcher.poll_once()}
+
+    assert events["MNP MATRIX 2024.xlsx"].kind == "mnp"
+    assert events["MNP MATRIX 2024.xlsx"].result.inserted_records == 16
+    assert events["sales_20250101.xlsx"].kind == "template"
+    assert "~$MNP MATRIX 2024.xlsx" not in events
+
+    clock.now = 20.0
+    assert watcher.poll_once() == []
+
+    shutil.copy(inbox / "MNP MATRIX 2024.xlsx", inbox / "MNP MATRIX 2024 copy.xlsx")
+    watcher.poll_once()
+    clock.now = 30.0
+    [duplicate] = watcher.poll_once()
+    assert duplicate.kind == "duplicate"
+
+    repo.close()
+
+
+def test_watcher_checks_duplicates_inside_the_ingest_transaction(tmp_path, mnp_workbook_factory, monkeypatch) -> None:
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    repo = DBRepository(tmp_path / "watch.duckdb")
+    repo.init_schema()
+    service = IngestionService(
+        repo=repo,
+        parser=MNPParser(),
+        mapper=OperatorMapper(Path("config/operator_mapping.yml")),
+    )
+    watcher = FolderWatcher(inbox, service, GenericTemplateEngine(repo), settle_seconds=0)
+
+    # stesso file gia scritto da un altro writer (es. upload API) sullo stesso DB
+    mnp_workbook_factory(inbox / "MNP MATRIX 2024.xlsx")
+    service.ingest_file(inbox / "MNP MATRIX 2024.xlsx")
+
+    file_exists = repo.file_exists
+
+    def _inside_transaction(checksum):
+        assert repo._transaction_depth > 0, "controllo duplicati fuori dalla transazione di scrittura"
+        return file_exists(checksum)
+
+    monkeypatch.setattr(repo, "file_exists", _inside_transaction)
+
+    [event] = watcher.poll_once()
+    assert event.kind == "duplicate"
+    assert event.result.skipped_duplicate is True
+    assert repo.con.execute("SELECT COUNT(*) FROM ingest_file").fetchone()[0] == 1
+
+    repo.close()
+
+
+def test_watcher_retries_failed_files_and_forgets_removed_ones(tmp_path, mnp_workbook_factory, monkeypatch) -> None:
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    repo = DBRepository(tmp_path / "watch.duckdb")
+    repo.init_schema()
+    service = IngestionService(
+        repo=repo,
+        parser=MNPParser(),
+        mapper=OperatorMapper(Path("config/operator_mapping.yml")),
+    )
+    watcher = FolderWatcher(
+        inbox, service, GenericTemplateEngine(repo), settle_seconds=0, seen_checksums_max=1
+    )
+    mnp_workbook_factory(inbox / "MNP MATRIX 2024.xlsx")
+
+    ingest_file = service.ingest_file
+
+    def _locked(*args, **kwargs):
+        raise OSError("database locked")
+
+    monkeypatch.setattr(service, "ingest_file", _locked)
+    [failed] = watcher.poll_once()
+    assert failed.kind == "error"
+    assert watcher._processed == {}
+
+    # errore transitorio risolto: lo stesso file, invariato, viene ritentato
+    monkeypatch.setattr(service, "ingest_file", ingest_file)
+    [retried] = watcher.poll_once()
+    assert retried.kind == "mnp"
+    assert retried.result.inserted_records == 16
+    assert watcher.poll_once() == []
+
+    generic = openpyxl.Workbook()
+    generic.active.append(["Data", "Region", "Revenue"])
+    generic.active.append(["2025-01-01", "North", 10])
+    generic.save(inbox / "sales_20250101.xlsx")
+    [template] = watcher.poll_once()
+    assert template.kind == "template"
+    assert list(watcher._seen_checksums) == [template.checksum]
+
+    (inbox / "MNP MATRIX 2024.xlsx").unlink()
+    (inbox / "sales_20250101.xlsx").unlink()
+    assert watcher.poll_once() == []
+    assert watcher._processed == {}
+
+    repo.close()
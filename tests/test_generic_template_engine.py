@@ -51,3 +51,107 @@ def test_analyze_and_ingest_generic_excel(tmp_path) -> None:
     assert not trend_df.empty
 
     repo.close()
+
+
+def test_duplicate_ingest_answers_from_recorded_template_without_analyze(tmp_path, monkeypatch) -> None:
+    file_path = tmp_path / "sample_20250103.xlsx"
+    _build_sample_workbook(file_path)
+
+    repo = DBRepository(tmp_path / "generic.duckdb")
+    repo.init_schema()
+    engine = GenericTemplateEngine(repo)
+    first = engine.ingest(file_path, template_name="SALES_TEMPLATE")
+
+    def _no_analyze(_path):
+        raise AssertionError("il duplicato non deve riaprire il workbook")
+
+    monkeypatch.setattr(engine, "analyze", _no_analyze)
+    duplicate = engine.ingest(file_path, checksum=first.checksum)
+
+    assert duplicate.skipped_duplicate
+    assert duplicate.inserted_rows == 0
+    assert duplicate.template_id == first.template_id
+    assert duplicate.template_name == "SALES_TEMPLATE"
+
+    repo.close()
+
+
+def _json_trend(repo: DBRepository, template_id: int, metric: str):
+    return repo.query_df(
+        """
+        SELECT
+            event_date,
+            SUM(COALESCE(CAST(json_extract_string(metrics_json, ?) AS DOUBLE), 0)) AS metric_value,
+            COUNT(*) AS rows_included
+        FROM excel_row_fact
+        WHERE template_id = ? AND event_date IS NOT NULL
+        GROUP BY event_date
+        ORDER BY event_date
+        """,
+        [f"$.{metric}", template_id],
+    )
+
+
+def test_typed_metric_table_matches_json_trend_and_is_backfilled(tmp_path) -> None:
+    db_path = tmp_path / "generic.duckdb"
+    file_path = tmp_path / "sample_20250103.xlsx"
+    _build_sample_workbook(file_path)
+
+    repo = DBRepository(db_path)
+    repo.init_schema()
+    result = GenericTemplateEngine(repo).ingest(file_path, template_name="SALES_TEMPLATE")
+
+    for metric in ("Revenue", "Stock"):
+        typed = repo.query_template_trend(result.template_id, metric_name=metric)
+        expected = _json_trend(repo, result.template_id, metric)
+        assert typed["metric_value"].tolist() == expected["metric_value"].tolist()
+        assert typed["rows_included"].tolist() == expected["rows_included"].tolist()
+
+    metric_rows = repo.con.execute("SELECT COUNT(*) FROM excel_metric_fact").fetchone()[0]
+    assert metric_rows > 0
+
+    # database pre-esistente: tabella tipizzata e conteggi per data vengono ricostruiti
+    repo.con.execute("DELETE FROM excel_metric_fact")
+    repo.con.execute("DELETE FROM excel_row_date_agg")
+    repo.close()
+    reopened = DBRepository(db_path)
+    reopened.init_schema()
+    assert reopened.con.execute("SELECT COUNT(*) FROM excel_metric_fact").fetchone()[0] == metric_rows
+    rebuilt = reopened.query_template_trend(result.template_id, metric_name="Revenue")
+    assert rebuilt["rows_included"].tolist() == _json_trend(reopened, result.template_id, "Revenue")["rows_included"].tolist()
+
+    reopened.delete_file_everywhere_by_checksum(result.checksum)
+    assert reopened.con.execute("SELECT COUNT(*) FROM excel_metric_fact").fetchone()[0] == 0
+    assert reopened.con.execute("SELECT COUNT(*) FROM excel_row_date_agg").fetchone()[0] == 0
+    reopened.close()
+
+
+def test_metric_catalog_tracks_stats_across_ingest_and_delete(tmp_path) -> None:
+    repo = DBRepository(tmp_path / "generic.duckdb")
+    repo.init_schema()
+    engine = GenericTemplateEngine(repo)
+
+    first_path = tmp_path / "sample_20250103.xlsx"
+    _build_sample_workbook(first_path)
+    first = engine.ingest(first_path, template_name="SALES_TEMPLATE")
+
+    second_path = tmp_path / "sample_20250110.xlsx"
+    wb = openpyxl.load_workbook(first_path)
+    wb["Sales"].append([date(2025, 1, 10), "East", 5000, 100])
+    wb.save(second_path)
+    second = engine.ingest(second_path, template_id=first.template_id)
+    assert second.inserted_rows > 0
+
+    stats = {m["metric"]: m for m in repo.list_template_metric_stats(first.template_id)}
+    assert repo.list_template_metrics(first.template_id) == sorted(stats)
+    assert stats["Revenue"]["row_count"] == 7
+    assert stats["Revenue"]["first_date"] == "2025-01-01"
+    assert stats["Revenue"]["last_date"] == "2025-01-10"
+    assert (stats["Revenue"]["min_value"], stats["Revenue"]["max_value"]) == (900, 5000)
+
+    repo.delete_file_everywhere_by_checksum(second.checksum)
+    revenue = {m["metric"]: m for m in repo.list_template_metric_stats(first.template_id)}["Revenue"]
+    assert revenue["row_count"] == 3
+    assert revenue["last_date"] == "2025-01-03"
+    assert revenue["max_value"] == 1100
+    repo.close()
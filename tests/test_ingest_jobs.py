@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from mnp_cdx.api.app import create_app
+from mnp_cdx.api.jobs import IngestJobManager, QueueFullError
+from mnp_cdx.config import Settings
+
+
+def _wait(manager: IngestJobManager, job_id: str, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job.status in ("succeeded", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} non concluso")
+
+
+def test_job_writes_are_serialized_in_submission_order():
+    manager = IngestJobManager(max_queue=8, workers=3)
+    order: list[str] = []
+    active = {"writers": 0, "max": 0}
+
+    def _prepare(job):
+        # il primo job prepara piu lentamente: la sua write deve comunque andare per prima
+        time.sleep(0.05 if job.filename == "a.xlsx" else 0.0)
+        return job.filename
+
+    def _write(job, prepared):
+        active["writers"] += 1
+        active["max"] = max(active["max"], active["writers"])
+        time.sleep(0.01)
+        order.append(prepared)
+        active["writers"] -= 1
+        return {"filename": prepared}
+
+    jobs = [manager.submit("mnp", name, _write, prepare=_prepare) for name in ("a.xlsx", "b.xlsx", "c.xlsx")]
+    results = [_wait(manager, job.job_id) for job in jobs]
+    manager.shutdown(timeout=5)
+
+    assert [job.status for job in results] == ["succeeded"] * 3
+    assert order == ["a.xlsx", "b.xlsx", "c.xlsx"]
+    assert active["max"] == 1
+
+
+def test_job_failure_is_reported_and_queue_applies_backpressure():
+    manager = IngestJobManager(max_queue=1, workers=1)
+    release = threading.Event()
+
+    def _blocked(job, prepared):
+        release.wait(5)
+        return {}
+
+    def _boom(job, prepared):
+        raise ValueError("workbook non valido")
+
+    first = manager.submit("mnp", "slow.xlsx", _blocked)
+    time.sleep(0.05)  # il worker prende il primo job, la coda torna vuota
+    failing = manager.submit("mnp", "bad.xlsx", _boom)
+    with pytest.raises(QueueFullError):
+        manager.submit("mnp", "overflow.xlsx", _blocked)
+
+    release.set()
+    assert _wait(manager, first.job_id).status == "succeeded"
+    failed = _wait(manager, failing.job_id)
+    manager.shutdown(timeout=5)
+
+    assert failed.status == "failed"
+    assert failed.error == "workbook non valido"
+
+
+def test_async_ingest_endpoint_returns_job_and_final_result(tmp_path, mnp_workbook):
+    settings = Settings(
+        base_dir=tmp_path,
+        data_dir=tmp_path / "data",
+        db_path=tmp_path / "data" / "mnp.duckdb",
+        mapping_path=Settings.load().mapping_path,
+        parse_cache_dir=None,
+    )
+    client = TestClient(create_app(settings))
+
+    with mnp_workbook.open("rb") as fh:
+        response = client.post("/ingest?async_job=true", files={"file": (mnp_workbook.name, fh)})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    deadline = time.monotonic() + 10
+    while True:
+        status = client.get(f"/jobs/{job_id}").json()
+        if status["status"] in ("succeeded", "failed") or time.monotonic() > deadline:
+            break
+        time.sleep(0.02)
+
+    assert status["status"] == "succeeded"
+    assert status["progress"] == 1.0
+    assert status["processed_cells"] == status["total_cells"] == 16
+    assert status["result"]["filename"] == mnp_workbook.name
+    assert status["result"]["inserted_records"] > 0
+    assert not any((tmp_path / "data" / "uploads").iterdir())
+    assert client.get("/jobs/missing").status_code == 404
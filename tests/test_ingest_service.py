@@ -0,0 +1,221 @@
+import gc
+import os
+import weakref
+from pathlib import Path
+
+from mnp_cdx.db.repository import DBRepository
+from mnp_cdx.ingest.operator_mapping import OperatorMapper
+from mnp_cdx.ingest.parse_cache import ParseCache
+from mnp_cdx.ingest.parser import MNPParser
+from mnp_cdx.ingest.service import IngestionService
+
+
+def _build_service(db_path: Path, **kwargs) -> IngestionService:
+    repo = DBRepository(db_path)
+    repo.init_schema()
+    mapper = OperatorMapper(Path("config/operator_mapping.yml"))
+    return IngestionService(repo=repo, parser=MNPParser(), mapper=mapper, **kwargs)
+
+
+def test_ingest_file_in_bounded_chunks(tmp_path, mnp_workbook) -> None:
+    service = _build_service(tmp_path / "ingest.duckdb", chunk_size=4)
+
+    result = service.ingest_file(mnp_workbook)
+    assert result.skipped_duplicate is False
+    assert result.monthly_records == 11
+    assert result.daily_records == 5
+    assert result.inserted_records == 16
+
+    stored = service.repo.query_df(
+        """
+        SELECT period_type, period_date, sheet_name, quality_flag, donor_raw, recipient_raw, value
+        FROM mnp_flow_fact
+        ORDER BY period_type, period_date, donor_raw, recipient_raw
+        """
+    )
+    assert len(stored) == 16
+    assert set(stored["sheet_name"]) == {"Monthly details", "Daily details"}
+    first = stored.iloc[0]
+    assert (first["period_type"], str(first["period_date"])[:10]) == ("DAILY", "2024-12-30")
+    assert (first["donor_raw"], first["recipient_raw"], first["value"]) == ("TIM", "ILIAD", 2.0)
+
+    again = service.ingest_file(mnp_workbook)
+    assert again.skipped_duplicate is True
+    assert again.inserted_records == 0
+
+    service.repo.close()
+
+
+def test_duplicate_is_answered_from_checksum_without_parsing(tmp_path, mnp_workbook, monkeypatch) -> None:
+    service = _build_service(tmp_path / "dup.duckdb")
+    service.ingest_file(mnp_workbook)
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("duplicate files must not be parsed")
+
+    monkeypatch.setattr(service.parser, "stream_batches", _fail)
+    result = service.ingest_file(mnp_workbook)
+
+    assert result.skipped_duplicate is True
+    assert result.checksum == MNPParser.checksum(mnp_workbook)
+    assert result.warnings == ["File gia ingestito (checksum duplicate)"]
+
+    service.repo.close()
+
+
+def test_operator_cache_resolves_each_name_once_and_inserts_in_batch(tmp_path) -> None:
+    service = _build_service(tmp_path / "ops.duckdb")
+    repo = service.repo
+    existing_id = repo.get_or_create_operator("TIM", "TIM_GROUP", "MNO")
+
+    calls: list[list[tuple]] = []
+    original_insert = repo.insert_operators
+
+    def _tracking_insert(operators):
+        calls.append(list(operators))
+        return original_insert(operators)
+
+    repo.insert_operators = _tracking_insert
+    ids = service.operators.resolve_many(["TIM", "VOD", "VODAFONE", "SOME NEW MVNO", "VOD"])
+
+    assert ids[0] == existing_id
+    assert ids[1] == ids[2] == ids[4]
+    assert len(calls) == 1
+    assert sorted(op[0] for op in calls[0]) == ["SOME NEW MVNO", "VODAFONE"]
+    assert sorted(repo.list_operators()) == ["SOME NEW MVNO", "TIM", "VODAFONE"]
+
+    assert service.operators.resolve_many(["TIM", "VOD"]) == [ids[0], ids[1]]
+    assert len(calls) == 1
+
+    repo.close()
+
+
+def test_force_reingest_reuses_parse_cache(tmp_path, mnp_workbook, monkeypatch) -> None:
+    cache = ParseCache(tmp_path / "parse_cache")
+    service = _build_service(tmp_path / "cache.duckdb", parse_cache=cache, chunk_size=4)
+    first = service.ingest_file(mnp_workbook)
+    assert len(list(cache.root.glob("*.npz"))) == 1
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("cached workbooks must not be parsed again")
+
+    monkeypatch.setattr(service.parser, "parse_batches", _fail)
+    again = service.ingest_file(mnp_workbook, force=True)
+
+    assert again.inserted_records == first.inserted_records == 16
+    assert (again.monthly_records, again.daily_records) == (11, 5)
+    count = service.repo.query_df("SELECT COUNT(*) AS n FROM mnp_flow_fact").iloc[0]["n"]
+    assert int(count) == 16
+
+    service.repo.close()
+
+
+def test_parse_cache_evicts_least_recently_used(tmp_path, mnp_workbook) -> None:
+    parsed = MNPParser().parse_batches(mnp_workbook, mnp_workbook.name)
+    cache = ParseCache(tmp_path / "lru")
+    cache.put("a" * 64, "v1", parsed)
+    entry_size = cache.size_bytes()
+    cache.max_bytes = entry_size * 2
+
+    cache.put("b" * 64, "v1", parsed)
+    os.utime(cache._path("a" * 64, "v1"), (0, 0))
+    os.utime(cache._path("b" * 64, "v1"), (1, 1))
+    assert cache.get("a" * 64, "v1") is not None
+    cache.put("c" * 64, "v1", parsed)
+
+    assert cache.get("b" * 64, "v1") is None
+    restored = cache.get("a" * 64, "v1", filename="renamed.xlsx")
+    assert restored.summary.filename == "renamed.xlsx"
+    assert [r for b in restored.batches for r in b.to_records()][0]["file_id"] == "renamed.xlsx"
+    assert cache.get("a" * 64, "v2") is None
+
+
+def test_failed_ingest_rolls_back_the_whole_file(tmp_path, mnp_workbook, monkeypatch) -> None:
+    service = _build_service(tmp_path / "rollback.duckdb", chunk_size=4)
+    repo = service.repo
+
+    def _fail(*args, **kwargs):
+        raise RuntimeError("disk full")
+
+    # l'errore arriva dopo che tutti i batch sono gia stati scritti
+    monkeypatch.setattr(repo, "update_ingest_status", _fail)
+    try:
+        service.ingest_file(mnp_workbook)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("expected RuntimeError")
+
+    for table in ("ingest_file", "mnp_flow_fact", "operator_period_agg", "operator_dim"):
+        assert repo.con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] == 0
+
+    monkeypatch.undo()
+    result = service.ingest_file(mnp_workbook)
+    assert result.skipped_duplicate is False
+    assert result.inserted_records == 16
+    orphans = repo.con.execute(
+        """
+        SELECT COUNT(*) FROM mnp_flow_fact f
+        WHERE f.donor_operator_id NOT IN (SELECT operator_id FROM operator_dim)
+           OR f.recipient_operator_id NOT IN (SELECT operator_id FROM operator_dim)
+        """
+    ).fetchone()[0]
+    assert orphans == 0
+    repo.close()
+
+
+def test_forced_reingest_failing_mid_parse_keeps_previous_rows(tmp_path, mnp_workbook, monkeypatch) -> None:
+    service = _build_service(tmp_path / "force.duckdb", chunk_size=4)
+    repo = service.repo
+    first = service.ingest_file(mnp_workbook)
+    stream_batches = service.parser.stream_batches
+
+    def _fail_after_first_batch(*args, **kwargs):
+        batches, summary = stream_batches(*args, **kwargs)
+
+        def _broken():
+            yield next(batches)
+            raise ValueError("sheet corrotto")
+
+        return _broken(), summary
+
+    monkeypatch.setattr(service.parser, "stream_batches", _fail_after_first_batch)
+    try:
+        service.ingest_file(mnp_workbook, force=True)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+
+    # la delete di force e il primo batch vengono annullati insieme
+    assert repo.con.execute("SELECT COUNT(*) FROM mnp_flow_fact").fetchone()[0] == first.inserted_records
+    assert repo.con.execute("SELECT COUNT(*) FROM ingest_file").fetchone()[0] == 1
+    assert service.check_duplicate(mnp_workbook.name, first.checksum).skipped_duplicate is True
+    repo.close()
+
+
+def test_written_batches_are_released_before_commit(tmp_path, mnp_workbook, monkeypatch) -> None:
+    service = _build_service(tmp_path / "memory.duckdb", chunk_size=4)
+    repo = service.repo
+    written: list[weakref.ref] = []
+    alive_at_commit: list[int] = []
+    insert_flow_dataframe = repo.insert_flow_dataframe
+    update_ingest_status = repo.update_ingest_status
+
+    def _track(df):
+        written.append(weakref.ref(df))
+        return insert_flow_dataframe(df)
+
+    def _count_alive(*args, **kwargs):
+        # ultimo passo prima del COMMIT: i batch gia scritti non devono restare referenziati
+        gc.collect()
+        alive_at_commit.append(sum(ref() is not None for ref in written))
+        return update_ingest_status(*args, **kwargs)
+
+    monkeypatch.setattr(repo, "insert_flow_dataframe", _track)
+    monkeypatch.setattr(repo, "update_ingest_status", _count_alive)
+    service.ingest_file(mnp_workbook)
+
+    assert len(written) > 1
+    assert alive_at_commit == [0]
+    repo.close()
@@ -0,0 +1,125 @@
+from datetime import date
+from pathlib import Path
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from mnp_cdx.analytics.kpi import AnalyticsService
+from mnp_cdx.db.lakehouse import Lakehouse
+from mnp_cdx.db.repository import DBRepository
+from mnp_cdx.ingest.operator_mapping import OperatorMapper
+from mnp_cdx.ingest.parser import MNPParser
+from mnp_cdx.ingest.service import IngestionService
+
+
+def _ingested_repo(tmp_path, mnp_workbook) -> DBRepository:
+    repo = DBRepository(tmp_path / "lake.duckdb")
+    repo.init_schema()
+    IngestionService(repo, MNPParser(), OperatorMapper(Path("config/operator_mapping.yml"))).ingest_file(mnp_workbook)
+    return repo
+
+
+def test_export_writes_hive_partitions_and_views(tmp_path, mnp_workbook) -> None:
+    repo = _ingested_repo(tmp_path, mnp_workbook)
+    lake = Lakehouse(tmp_path / "lake")
+
+    result = lake.export(repo)
+    assert (result.flow_rows, result.template_rows) == (16, 0)
+    assert (lake.root / "mnp_flow_fact" / "period_type=MONTHLY" / "year=2024" / "month=2").is_dir()
+    assert lake.available
+
+    columns = "period_type, period_date, donor_operator_id, recipient_operator_id, value, donor_raw"
+    from_lake = repo.query_df(f"SELECT {columns} FROM lake_mnp_flow_fact ORDER BY ALL")
+    from_db = repo.query_df(f"SELECT {columns} FROM mnp_flow_fact ORDER BY ALL")
+    pd.testing.assert_frame_equal(from_lake, from_db, check_dtype=False)
+    assert repo.con.execute("SELECT COUNT(*) FROM lake_excel_row_fact").fetchone()[0] == 0
+
+    # un secondo export sostituisce lo snapshot senza duplicare i file
+    assert lake.export(repo).files == result.files
+    repo.close()
+
+
+def test_lake_analytics_match_duckdb_and_prune_partitions(tmp_path, mnp_workbook) -> None:
+    repo = _ingested_repo(tmp_path, mnp_workbook)
+    lake = Lakehouse(tmp_path / "lake")
+    lake.export(repo)
+
+    db_analytics = AnalyticsService(repo)
+    lake_analytics = AnalyticsService(repo, lake=lake)
+    pd.testing.assert_frame_equal(
+        lake_analytics.trend("WINDTRE"), db_analytics.trend("WINDTRE"), check_dtype=False
+    )
+    pd.testing.assert_frame_equal(
+        lake_analytics.top_donors("WINDTRE"), db_analytics.top_donors("WINDTRE"), check_dtype=False
+    )
+
+    # un file fuori intervallo illeggibile: la query limitata a marzo non deve aprirlo
+    monthly = lake.root / "mnp_flow_fact" / "period_type=MONTHLY"
+    january = next((monthly / "year=2024" / "month=1").glob("*.parquet"))
+    january.write_bytes(b"not parquet")
+    march = lake_analytics.trend("WINDTRE", start_date=date(2024, 3, 1), end_date=date(2024, 3, 31))
+    assert march["port_in"].tolist() == [7.0]
+    repo.close()
+
+
+def test_lake_mode_serves_every_endpoint_from_the_same_snapshot(tmp_path, mnp_workbook) -> None:
+    repo = _ingested_repo(tmp_path, mnp_workbook)
+    lake = Lakehouse(tmp_path / "lake")
+    lake.export(repo)
+    db_analytics = AnalyticsService(repo)
+    expected_kpi = db_analytics.kpi_snapshot_all()
+    expected_matrix = db_analytics.flow_matrix()
+
+    # il database va avanti rispetto allo snapshot: in modalita lake KPI e matrice non cambiano
+    checksum = repo.con.execute("SELECT checksum_sha256 FROM ingest_file").fetchone()[0]
+    with repo.transaction():
+        repo.delete_file_everywhere_by_checksum(checksum)
+
+    lake_analytics = AnalyticsService(repo, lake=lake)
+    kpi_all = lake_analytics.kpi_snapshot_all()
+    assert kpi_all == expected_kpi
+    windtre = next(row for row in kpi_all if row["operator"] == "WINDTRE")
+    assert lake_analytics.kpi_snapshot("WINDTRE") == windtre
+    matrix = lake_analytics.flow_matrix()
+    assert matrix.labels == expected_matrix.labels
+    np.testing.assert_allclose(matrix.values, expected_matrix.values)
+    assert AnalyticsService(repo).flow_matrix().values.sum() == 0
+    repo.close()
+
+
+def test_export_reads_a_snapshot_without_blocking_the_writer(tmp_path, mnp_workbook) -> None:
+    repo = _ingested_repo(tmp_path, mnp_workbook)
+    lake = Lakehouse(tmp_path / "lake")
+    checksum = repo.con.execute("SELECT checksum_sha256 FROM ingest_file").fetchone()[0]
+    writing = threading.Event()
+    release = threading.Event()
+
+    def _ingest_in_progress() -> None:
+        # transazione di scrittura aperta (e non ancora committata) per tutta la durata delle COPY
+        with repo.transaction():
+            repo.delete_file_everywhere_by_checksum(checksum)
+            writing.set()
+            release.wait(timeout=30)
+
+    writer = threading.Thread(target=_ingest_in_progress)
+    writer.start()
+    assert writing.wait(timeout=30)
+    exported: list = []
+    exporter = threading.Thread(target=lambda: exported.append(lake.export(repo)))
+    exporter.start()
+
+    # le COPY e lo swap dello snapshot si completano mentre il writer e ancora occupato
+    deadline = time.monotonic() + 10
+    while not lake.available:
+        assert time.monotonic() < deadline, "export bloccato dal writer"
+        time.sleep(0.05)
+    release.set()
+    writer.join()
+    exporter.join()
+
+    # lo snapshot non vede la delete non committata
+    assert exported[0].flow_rows == 16
+    assert repo.con.execute("SELECT COUNT(*) FROM mnp_flow_fact").fetchone()[0] == 0
+    repo.close()
@@ -0,0 +1,82 @@
+from datetime import date
+import hashlib
+
+import numpy as np
+import openpyxl
+
+from mnp_cdx.ingest.parser import MNPParser
+from mnp_cdx.ingest.xlsx_stream import XlsxStreamReader
+
+
+def test_parse_single_pass_matches_sheet_parsers(mnp_workbook) -> None:
+    file_path = mnp_workbook
+    parser = MNPParser()
+
+    records, summary = parser.parse(file_path, file_id=file_path.name)
+    monthly, _ = parser.parse_monthly(str(file_path), file_path.name)
+    daily, _ = parser.parse_daily(str(file_path), file_path.name)
+
+    assert records == monthly + daily
+    assert summary.checksum == MNPParser.checksum(file_path)
+    assert summary.monthly_records == 11
+    assert summary.daily_records == 5
+    assert summary.warnings == []
+    assert daily[2]["period_date"] == date(2025, 1, 1)
+    assert any(r["quality_flag"] == "IMPUTED" for r in monthly)
+
+
+def test_iter_records_streams_lazily_with_summary(mnp_workbook) -> None:
+    file_path = mnp_workbook
+    parser = MNPParser()
+
+    records, summary = parser.stream(file_path, file_id=file_path.name)
+    assert summary.checksum == MNPParser.checksum(file_path)
+    assert summary.monthly_records == 0
+
+    first = next(records)
+    assert first["period_type"] == "MONTHLY"
+    rest = list(records)
+
+    assert len(rest) + 1 == 16
+    assert summary.monthly_records == 11
+    assert summary.daily_records == 5
+    assert list(parser.iter_records(file_path, file_path.name)) == [first] + rest
+
+
+def test_columnar_batches_match_records(mnp_workbook) -> None:
+    parser = MNPParser()
+    records = list(parser.iter_records(mnp_workbook, mnp_workbook.name))
+
+    batches, summary = parser.stream_batches(mnp_workbook, mnp_workbook.name, batch_size=4)
+    batches = list(batches)
+
+    assert [b.period_type for b in batches] == ["MONTHLY"] * 3 + ["DAILY"] * 2
+    assert all(len(b) <= 4 for b in batches)
+    assert batches[0].values.dtype == np.float64
+    assert batches[0].donor_codes.dtype == np.int32
+    assert summary.monthly_records == 11
+    assert [r for b in batches for r in b.to_records()] == records
+
+
+def test_checksum_matches_hashlib_including_empty_files(tmp_path, mnp_workbook) -> None:
+    empty = tmp_path / "empty.xlsx"
+    empty.write_bytes(b"")
+
+    assert MNPParser.checksum(empty) == hashlib.sha256(b"").hexdigest()
+    assert MNPParser.checksum(mnp_workbook) == hashlib.sha256(mnp_workbook.read_bytes()).hexdigest()
+
+
+def test_xml_engine_matches_openpyxl_engine(mnp_workbook) -> None:
+    default_records, default_summary = MNPParser().parse(mnp_workbook, mnp_workbook.name)
+    xml_records, xml_summary = MNPParser(engine="xml").parse(mnp_workbook, mnp_workbook.name)
+
+    assert xml_records == default_records
+    assert xml_summary == default_summary
+
+    for sheet_name in MNPParser.SHEETS.values():
+        wb = openpyxl.load_workbook(mnp_workbook, read_only=True, data_only=True)
+        expected = list(wb[sheet_name].iter_rows(values_only=True))
+        wb.close()
+        reader = XlsxStreamReader(mnp_workbook)
+        assert list(reader[sheet_name].iter_rows(values_only=True)) == expected
+        reader.close()
@@ -1,5 +1,7 @@
 from pathlib import Path
 
+import yaml
+
 from mnp_cdx.ingest.operator_mapping import OperatorMapper
 
 
@@ -13,3 +15,111 @@ def test_operator_alias_resolution() -> None:
 
     unknown = mapper.resolve("SOME NEW MVNO")
     assert unknown.group_name == "UNMAPPED"
+
+
+def test_sql_alias_resolution_matches_mapper(tmp_path) -> None:
+    from mnp_cdx.db.repository import DBRepository
+
+    mapper = OperatorMapper(Path("config/operator_mapping.yml"))
+    repo = DBRepository(tmp_path / "alias.duckdb")
+    repo.init_schema()
+    repo.replace_operator_aliases(mapper.alias_rows())
+
+    raw_names = ["VOD", "poste", " ho-mobile ", "Wind  Tre", "TIM + KENA", "SOME NEW MVNO", ""]
+    ids = repo.resolve_raw_operators(raw_names)
+    names = dict(repo.con.execute("SELECT operator_id, canonical_name FROM operator_dim").fetchall())
+    assert {raw: names[ids[raw]] for raw in raw_names} == {raw: mapper.resolve(raw).canonical_name for raw in raw_names}
+    repo.close()
+
+
+def test_reload_mapping_recanonicalizes_flows_in_place(tmp_path, mnp_workbook) -> None:
+    from mnp_cdx.db.repository import DBRepository
+    from mnp_cdx.ingest.parser import MNPParser
+    from mnp_cdx.ingest.service import IngestionService
+
+    mapping = tmp_path / "operator_mapping.yml"
+    mapping.write_text(Path("config/operator_mapping.yml").read_text(encoding="utf-8"), encoding="utf-8")
+    repo = DBRepository(tmp_path / "reload.duckdb")
+    repo.init_schema()
+    service = IngestionService(repo, MNPParser(), OperatorMapper(mapping))
+    service.ingest_file(mnp_workbook)
+    before = repo.con.execute("SELECT COUNT(*), SUM(value) FROM mnp_flow_fact").fetchone()
+
+    # fix del mapping: VODAFONE confluisce in WINDTRE, ILIAD cambia nome canonico
+    payload = yaml.safe_load(mapping.read_text(encoding="utf-8"))
+    payload["operators"] = [op for op in payload["operators"] if op["canonical_name"] != "VODAFONE"]
+    for op in payload["operators"]:
+        if op["canonical_name"] == "WINDTRE":
+            op["aliases"].append("VODAFONE")
+        if op["canonical_name"] == "ILIAD":
+            op["canonical_name"] = "ILIAD ITALIA"
+    mapping.write_text(yaml.safe_dump(payload), encoding="utf-8")
+
+    result = service.reload_mapping()
+    assert result.updated_donor_rows + result.updated_recipient_rows > 0
+    # VODAFONE -> WINDTRE (5 + 7) e' diventato un self-flow
+    assert result.deleted_self_flows == 2
+
+    after = repo.con.execute("SELECT COUNT(*), SUM(value) FROM mnp_flow_fact").fetchone()
+    assert after == (before[0] - 2, before[1] - 12)
+    pairs = repo.query_df(
+        """
+        SELECT DISTINCT f.donor_raw, d.canonical_name AS donor
+        FROM mnp_flow_fact f JOIN operator_dim d ON d.operator_id = f.donor_operator_id
+        """
+    )
+    assert dict(zip(pairs["donor_raw"], pairs["donor"]))["ILIAD"] == "ILIAD ITALIA"
+
+    agg = repo.query_df("SELECT SUM(port_in) AS port_in, SUM(port_out) AS port_out FROM operator_period_agg")
+    assert agg["port_in"][0] == agg["port_out"][0] == after[1]
+
+    # le ingest successive usano gia il mapping ricaricato
+    assert service.operators.resolve_many(["VODAFONE"]) == service.operators.resolve_many(["WINDTRE"])
+    assert not {"VODAFONE", "ILIAD"} & set(repo.list_operators())
+    repo.close()
+
+
+def test_fuzzy_resolution_with_confidence() -> None:
+    mapper = OperatorMapper(Path("config/operator_mapping.yml"))
+
+    exact = mapper.resolve("ho.mobile")
+    assert (exact.canonical_name, exact.confidence) == ("HO.MOBILE", 1.0)
+
+    spaced = mapper.resolve("Lyca-Mobile.")
+    assert spaced.canonical_name == "LYCA MOBILE"
+    assert spaced.confidence == 1.0
+
+    typo = mapper.resolve("VODAFON")
+    assert typo.canonical_name == "VODAFONE"
+    assert mapper.fuzzy_threshold <= typo.confidence < 1.0
+
+    suffixed = mapper.resolve("ILLIAD + MVNO")
+    assert suffixed.canonical_name == "ILIAD"
+
+    weak = mapper.resolve("TIMX")
+    assert weak.unmapped
+    assert weak.suggestion == "TIM"
+    assert weak.confidence < mapper.fuzzy_threshold
+
+    assert mapper.resolve("VODAFON") is typo
+    mapper.reload()
+    assert mapper.resolve("VODAFON") is not typo
+
+
+def test_low_confidence_names_land_in_unmapped_report(tmp_path) -> None:
+    from mnp_cdx.db.repository import DBRepository
+    from mnp_cdx.ingest.operator_cache import OperatorCache
+
+    repo = DBRepository(tmp_path / "fuzzy.duckdb")
+    repo.init_schema()
+    cache = OperatorCache(repo, OperatorMapper(Path("config/operator_mapping.yml")))
+
+    ids = cache.resolve_many(["VODAFONE", "Vodafon", "TIMX", "SOME NEW MVNO"])
+    assert ids[0] == ids[1]
+    assert sorted(repo.list_operators()) == ["SOME NEW MVNO", "TIMX", "VODAFONE"]
+
+    report = {row["raw_name"]: row for row in repo.list_unmapped_operators()}
+    assert set(report) == {"TIMX", "SOME NEW MVNO"}
+    assert report["TIMX"]["suggestion"] == "TIM"
+    assert report["TIMX"]["confidence"] > report["SOME NEW MVNO"]["confidence"]
+    repo.close()
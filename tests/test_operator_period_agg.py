@@ -0,0 +1,94 @@
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+
+from mnp_cdx.db.repository import DBRepository
+from mnp_cdx.ingest.operator_mapping import OperatorMapper
+from mnp_cdx.ingest.parser import MNPParser
+from mnp_cdx.ingest.service import IngestionService
+
+
+FULL_AGGREGATE = """
+WITH flows AS (
+    SELECT period_type, period_date, recipient_operator_id AS operator_id, value AS port_in, 0.0 AS port_out
+    FROM mnp_flow_fact
+    UNION ALL
+    SELECT period_type, period_date, donor_operator_id, 0.0, value
+    FROM mnp_flow_fact
+)
+SELECT period_type, period_date, operator_id, SUM(port_in) AS port_in, SUM(port_out) AS port_out,
+       SUM(port_in) - SUM(port_out) AS net_flow
+FROM flows
+GROUP BY 1, 2, 3
+ORDER BY 1, 2, 3
+"""
+
+
+def _agg(repo: DBRepository) -> pd.DataFrame:
+    return repo.query_df(
+        """
+        SELECT period_type, period_date, operator_id, port_in, port_out, net_flow
+        FROM operator_period_agg
+        ORDER BY 1, 2, 3
+        """
+    )
+
+
+def _assert_agg_matches_facts(repo: DBRepository) -> None:
+    pd.testing.assert_frame_equal(_agg(repo), repo.query_df(FULL_AGGREGATE), check_dtype=False)
+
+
+def test_aggregate_follows_insert_upsert_and_delete(tmp_path, mnp_workbook_factory) -> None:
+    repo = DBRepository(tmp_path / "agg.duckdb")
+    repo.init_schema()
+    service = IngestionService(repo, MNPParser(), OperatorMapper(Path("config/operator_mapping.yml")), chunk_size=4)
+
+    workbook = tmp_path / "MNP MATRIX A.xlsx"
+    mnp_workbook_factory(workbook)
+    first = service.ingest_file(workbook)
+    assert first.inserted_records > 0
+    assert not _agg(repo).empty
+    _assert_agg_matches_facts(repo)
+
+    tim = repo.get_or_create_operator("TIM", "TIM_GROUP", "MNO")
+    windtre = repo.get_or_create_operator("WINDTRE", "WINDTRE_GROUP", "MNO")
+    upsert_file = repo.insert_ingest_file("manual.xlsx", "manual", "test")
+    repo.upsert_flow_dataframe(
+        pd.DataFrame(
+            [
+                {
+                    "file_id": upsert_file,
+                    "period_type": "MONTHLY",
+                    "period_date": date(2030, 1, 1),
+                    "donor_operator_id": tim,
+                    "recipient_operator_id": windtre,
+                    "value": 7.0,
+                    "sheet_name": "Monthly details",
+                    "quality_flag": "OK",
+                    "donor_raw": "TIM",
+                    "recipient_raw": "WINDTRE",
+                }
+            ]
+        )
+    )
+    _assert_agg_matches_facts(repo)
+
+    repo.delete_file_everywhere_by_checksum(first.checksum)
+    _assert_agg_matches_facts(repo)
+    assert set(_agg(repo)["period_date"].astype(str)) == {"2030-01-01"}
+    repo.close()
+
+
+def test_init_schema_backfills_aggregate_for_existing_facts(tmp_path, mnp_workbook) -> None:
+    db_path = tmp_path / "agg.duckdb"
+    repo = DBRepository(db_path)
+    repo.init_schema()
+    IngestionService(repo, MNPParser(), OperatorMapper(Path("config/operator_mapping.yml"))).ingest_file(mnp_workbook)
+    repo.con.execute("DELETE FROM operator_period_agg")
+    repo.close()
+
+    reopened = DBRepository(db_path)
+    reopened.init_schema()
+    _assert_agg_matches_facts(reopened)
+    reopened.close()
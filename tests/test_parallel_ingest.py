@@ -0,0 +1,146 @@
+import shutil
+from pathlib import Path
+
+import openpyxl
+
+from mnp_cdx.db.repository import DBRepository
+from mnp_cdx.ingest.operator_mapping import OperatorMapper
+from mnp_cdx.ingest.parallel import ingest_directory
+from mnp_cdx.ingest.parse_cache import ParseCache
+from mnp_cdx.ingest.parser import MNPParser
+from mnp_cdx.ingest.service import IngestionService
+
+
+def test_ingest_directory_parses_in_pool_and_writes_in_order(tmp_path, mnp_workbook_factory) -> None:
+    folder = tmp_path / "exports"
+    folder.mkdir()
+    mnp_workbook_factory(folder / "MNP MATRIX 20240131.xlsx", title="January")
+    mnp_workbook_factory(folder / "MNP MATRIX 20240229.xlsx", title="February")
+    shutil.copy(folder / "MNP MATRIX 20240131.xlsx", folder / "MNP MATRIX 20240131 copy.xlsx")
+
+    repo = DBRepository(tmp_path / "dir.duckdb")
+    repo.init_schema()
+    service = IngestionService(
+        repo=repo,
+        parser=MNPParser(),
+        mapper=OperatorMapper(Path("config/operator_mapping.yml")),
+    )
+
+    report = ingest_directory(service, folder, workers=2)
+
+    assert [r.filename for r in report.results] == [
+        "MNP MATRIX 20240131 copy.xlsx",
+        "MNP MATRIX 20240131.xlsx",
+        "MNP MATRIX 20240229.xlsx",
+    ]
+    assert [r.skipped_duplicate for r in report.results] == [False, True, False]
+    assert report.inserted_records == 32
+    assert report.failures == []
+    assert report.rows_per_second > 0
+
+    again = ingest_directory(service, folder, workers=2)
+    assert all(r.skipped_duplicate for r in again.results)
+
+    repo.close()
+
+
+def test_cached_workbooks_are_written_in_name_order(tmp_path, mnp_workbook_factory) -> None:
+    folder = tmp_path / "exports"
+    folder.mkdir()
+    mnp_workbook_factory(folder / "MNP MATRIX 20240131.xlsx", title="January")
+    mnp_workbook_factory(folder / "MNP MATRIX 20240229.xlsx", title="February")
+
+    repo = DBRepository(tmp_path / "order.duckdb")
+    repo.init_schema()
+    service = IngestionService(
+        repo=repo,
+        parser=MNPParser(),
+        mapper=OperatorMapper(Path("config/operator_mapping.yml")),
+        parse_cache=ParseCache(tmp_path / "parse_cache"),
+    )
+    # solo il secondo file e in parse cache: il primo passa dal pool
+    february = folder / "MNP MATRIX 20240229.xlsx"
+    service.store_parse(service.parser.parse_batches(february, february.name, checksum=service.parser.checksum(february)))
+
+    report = ingest_directory(service, folder, workers=1)
+
+    assert [r.filename for r in report.results] == ["MNP MATRIX 20240131.xlsx", "MNP MATRIX 20240229.xlsx"]
+    file_ids = [r.file_id for r in report.results]
+    assert file_ids == sorted(file_ids)
+
+    repo.close()
+
+
+def test_incremental_directory_keeps_newest_export_with_mixed_cache_hits(tmp_path, mnp_workbook_factory) -> None:
+    folder = tmp_path / "exports"
+    folder.mkdir()
+    older = folder / "MNP MATRIX 2024-01.xlsx"
+    newer = folder / "MNP MATRIX 2024-02.xlsx"
+    mnp_workbook_factory(older, title="January")
+    mnp_workbook_factory(newer, title="February")
+    wb = openpyxl.load_workbook(newer)
+    wb["Monthly details"]["F7"] = 99  # TIM -> WINDTRE, Jan 24 (10 nell'export precedente)
+    wb.save(newer)
+
+    repo = DBRepository(tmp_path / "incremental.duckdb")
+    repo.init_schema()
+    service = IngestionService(
+        repo=repo,
+        parser=MNPParser(),
+        mapper=OperatorMapper(Path("config/operator_mapping.yml")),
+        parse_cache=ParseCache(tmp_path / "parse_cache"),
+    )
+    # l'export piu recente e in parse cache, il precedente passa dal pool
+    service.store_parse(service.parser.parse_batches(newer, newer.name, checksum=service.parser.checksum(newer)))
+
+    report = ingest_directory(service, folder, workers=1, incremental=True)
+    assert report.failures == []
+
+    value = repo.con.execute(
+        """
+        SELECT f.value
+        FROM mnp_flow_fact f
+        JOIN operator_dim d ON d.operator_id = f.donor_operator_id
+        JOIN operator_dim r ON r.operator_id = f.recipient_operator_id
+        WHERE f.period_type = 'MONTHLY' AND f.period_date = DATE '2024-01-01'
+          AND d.canonical_name = 'TIM' AND r.canonical_name = 'WINDTRE'
+        """
+    ).fetchall()
+    assert value == [(99.0,)]
+
+    repo.close()
+
+
+def test_failed_write_is_reported_and_the_run_continues(tmp_path, mnp_workbook_factory, monkeypatch) -> None:
+    folder = tmp_path / "exports"
+    folder.mkdir()
+    mnp_workbook_factory(folder / "MNP MATRIX 20240131.xlsx", title="January")
+    mnp_workbook_factory(folder / "MNP MATRIX 20240229.xlsx", title="February")
+
+    repo = DBRepository(tmp_path / "failures.duckdb")
+    repo.init_schema()
+    service = IngestionService(
+        repo=repo,
+        parser=MNPParser(),
+        mapper=OperatorMapper(Path("config/operator_mapping.yml")),
+    )
+    update_ingest_status = repo.update_ingest_status
+    calls = []
+
+    def _fail_first(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError("disk full")
+        return update_ingest_status(*args, **kwargs)
+
+    # l'errore arriva dopo le scritture dei fatti del primo file
+    monkeypatch.setattr(repo, "update_ingest_status", _fail_first)
+
+    report = ingest_directory(service, folder, workers=1)
+
+    assert report.failures == [("MNP MATRIX 20240131.xlsx", "disk full")]
+    assert [r.filename for r in report.results] == ["MNP MATRIX 20240229.xlsx"]
+    assert repo.con.execute("SELECT filename FROM ingest_file").fetchall() == [("MNP MATRIX 20240229.xlsx",)]
+    assert repo.con.execute("SELECT COUNT(*) FROM mnp_flow_fact").fetchone()[0] == report.inserted_records == 16
+
+    repo.close()
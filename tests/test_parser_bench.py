@@ -0,0 +1,44 @@
+from mnp_cdx.benchmarks.parser_bench import (
+    BenchConfig,
+    BenchResult,
+    compare_to_baseline,
+    run_parser_benchmarks,
+    save_baseline,
+)
+from mnp_cdx.benchmarks.synthetic import write_synthetic_mnp_workbook
+from mnp_cdx.ingest.parser import MNPParser
+
+
+def test_synthetic_workbook_record_counts(tmp_path):
+    path = write_synthetic_mnp_workbook(tmp_path / "MNP SYNTHETIC 2024.xlsx", operators=4, months=3, days=5)
+    records, summary = MNPParser().parse(str(path), path.name)
+
+    assert summary.monthly_records == 4 * 3 * 3
+    assert summary.daily_records == 4 * 3 * 5
+    assert len(records) == summary.monthly_records + summary.daily_records
+
+
+def test_bench_baseline_roundtrip_and_regression(tmp_path):
+    config = BenchConfig(operators=4, months=3, days=5, repeat=1)
+    results = run_parser_benchmarks(tmp_path / "work", config, "config/operator_mapping.yml")
+    by_name = {r.name: r for r in results}
+    assert by_name["parse_monthly"].rows == 36
+    assert by_name["parse_daily"].rows == 60
+    assert by_name["ingest_file"].rows == 96
+
+    baseline = tmp_path / "baseline.json"
+    save_baseline(baseline, config, results)
+    assert compare_to_baseline(results, config, baseline, tolerance=10.0) == []
+
+    slower = [r.__class__(r.name, r.seconds * 100 + 1, r.rows, r.peak_mb) for r in results]
+    assert any("parse_daily" in line for line in compare_to_baseline(slower, config, baseline))
+
+    # passi da pochi millisecondi: +100% relativo ma sotto la soglia assoluta non e regressione
+    fast_baseline = tmp_path / "fast.json"
+    save_baseline(fast_baseline, config, [BenchResult("checksum", 0.002, 0, 0.01)])
+    noisy = [BenchResult("checksum", 0.004, 0, 0.5)]
+    assert compare_to_baseline(noisy, config, fast_baseline) == []
+    assert len(compare_to_baseline(noisy, config, fast_baseline, min_delta_seconds=0.0, min_delta_mb=0.0)) == 2
+
+    other = BenchConfig(operators=5, months=3, days=5, repeat=1)
+    assert "configurazione diversa" in compare_to_baseline(results, other, baseline)[0]
@@ -0,0 +1,99 @@
+from pathlib import Path
+
+import pandas as pd
+
+from mnp_cdx.analytics.cache import QueryCache
+from mnp_cdx.analytics.kpi import AnalyticsService
+from mnp_cdx.db.repository import DBRepository
+from mnp_cdx.ingest.operator_mapping import OperatorMapper
+from mnp_cdx.ingest.parser import MNPParser
+from mnp_cdx.ingest.service import IngestionService
+
+
+def test_cache_lru_and_size_eviction():
+    cache = QueryCache(max_entries=2, max_bytes=10_000)
+    calls: list[str] = []
+
+    def _compute(name):
+        def _run():
+            calls.append(name)
+            return pd.DataFrame({"v": [1, 2, 3]})
+
+        return _run
+
+    cache.get_or_compute("a", 0, _compute("a"))
+    cache.get_or_compute("b", 0, _compute("b"))
+    cache.get_or_compute("a", 0, _compute("a"))  # hit, "a" diventa la piu recente
+    cache.get_or_compute("c", 0, _compute("c"))  # evict "b"
+    cache.get_or_compute("b", 0, _compute("b"))
+
+    assert calls == ["a", "b", "c", "b"]
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.evictions, stats.entries) == (1, 4, 2, 2)
+
+    big = QueryCache(max_entries=10, max_bytes=100)
+    big.get_or_compute("big", 0, lambda: pd.DataFrame({"v": range(1000)}))
+    assert big.stats().entries == 0
+
+
+def test_cached_results_are_copies_and_invalidated_by_ingest(tmp_path, mnp_workbook_factory):
+    repo = DBRepository(tmp_path / "cache.duckdb")
+    repo.init_schema()
+    service = IngestionService(repo, MNPParser(), OperatorMapper(Path("config/operator_mapping.yml")))
+    cache = QueryCache()
+    analytics = AnalyticsService(repo, cache=cache)
+
+    first = tmp_path / "MNP MATRIX A.xlsx"
+    mnp_workbook_factory(first)
+    service.ingest_file(first)
+
+    trend = analytics.trend("WINDTRE")
+    trend["port_in"] = -1  # il chiamante modifica la sua copia
+    again = analytics.trend("WINDTRE")
+    assert (again["port_in"] >= 0).all()
+    snapshot = analytics.kpi_snapshot("WINDTRE")
+    assert analytics.kpi_snapshot("WINDTRE") == snapshot
+    hits_before = cache.stats().hits
+    assert hits_before >= 2
+
+    second = tmp_path / "MNP MATRIX B.xlsx"
+    mnp_workbook_factory(second, title="MNP monthly report v2")
+    service.ingest_file(second)
+
+    refreshed = analytics.kpi_snapshot("WINDTRE")
+    assert refreshed["total_port_in"] == 2 * snapshot["total_port_in"]
+    assert cache.stats().generation == repo.generation
+    repo.close()
+
+
+
+def test_duplicate_and_rolled_back_ingests_keep_cached_results(tmp_path, mnp_workbook, monkeypatch):
+    repo = DBRepository(tmp_path / "cache.duckdb")
+    repo.init_schema()
+    service = IngestionService(repo, MNPParser(), OperatorMapper(Path("config/operator_mapping.yml")))
+    cache = QueryCache()
+    analytics = AnalyticsService(repo, cache=cache)
+    service.ingest_file(mnp_workbook)
+
+    analytics.kpi_snapshot_all()
+    generation = repo.generation
+
+    # reinvio dello stesso file: solo il controllo duplicati, nessuna scrittura
+    assert service.ingest_file(mnp_workbook).skipped_duplicate is True
+    assert repo.generation == generation
+
+    # force annullato a meta: nessuna modifica committata
+    def _fail(*args, **kwargs):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(repo, "update_ingest_status", _fail)
+    try:
+        service.ingest_file(mnp_workbook, force=True)
+    except RuntimeError:
+        pass
+    assert repo.generation == generation
+
+    hits = cache.stats().hits
+    analytics.kpi_snapshot_all()
+    assert cache.stats().hits == hits + 1
+    repo.close()